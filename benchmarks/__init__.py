@@ -0,0 +1,7 @@
+"""FileCleaner 性能基准测试。
+
+在仓库根目录下运行，例如::
+
+    python -m benchmarks.scan_benchmark --files 1000000
+    python -m benchmarks.suite --output results.json
+"""
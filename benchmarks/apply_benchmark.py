@@ -0,0 +1,81 @@
+"""测量按目录分片并行执行重命名/删除的吞吐量
+
+使用 LatencyFileOperations 在每次文件操作前等待固定时间，模拟网络文件系统的往返延迟，
+然后用不同的 worker_threads 对同一棵合成目录树执行 clean_directory。
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from file_cleaner import FileCleaner, LocalFileOperations
+from benchmarks.synthetic_tree import SyntheticTree, default_bench_root
+
+
+class LatencyFileOperations(LocalFileOperations):
+    """每次操作前等待 latency 秒的文件系统操作"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def rename(self, src, dst):
+        time.sleep(self.latency)
+        super().rename(src, dst)
+
+    def unlink(self, path):
+        time.sleep(self.latency)
+        super().unlink(path)
+
+    def recycle(self, path):
+        # 基准测试中不使用回收站，让删除走直接删除的路径
+        raise ImportError("回收站在基准测试中不可用")
+
+    def recycle_many(self, paths):
+        raise ImportError("回收站在基准测试中不可用")
+
+
+def run_once(tree_options, workers, latency, base):
+    with SyntheticTree(base=base, **tree_options) as root:
+        # 配置文件和历史数据库都写在独立的临时目录中
+        work_dir = tempfile.mkdtemp(prefix="filecleaner_bench_db_", dir=base)
+        old_cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            cleaner = FileCleaner(file_ops=LatencyFileOperations(latency))
+            cleaner.config.override("worker_threads", workers)
+            start = time.perf_counter()
+            results = cleaner.clean_directory(root)
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(old_cwd)
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return elapsed, len(results["renamed"]) + len(results["deleted"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=4000)
+    parser.add_argument("--files-per-dir", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="每次文件操作的模拟延迟（毫秒）")
+    parser.add_argument("--workers", default="1,2,4,8,16", help="逗号分隔的线程数列表")
+    parser.add_argument("--base", default=None, help="合成目录树所在的父目录（默认使用 tmpfs）")
+    args = parser.parse_args(argv)
+
+    base = args.base or default_bench_root()
+    tree_options = {
+        "files": args.files,
+        "files_per_dir": args.files_per_dir,
+        "match_ratio": 0.5,
+        "cleanup_ratio": 0.1,
+    }
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        elapsed, operations = run_once(tree_options, workers, args.latency_ms / 1000, base)
+        baseline = baseline or elapsed
+        print(f"workers={workers:3d}: {operations} 个操作, {elapsed:7.2f} s, "
+              f"{operations / elapsed:8.1f} 操作/秒, 加速比 {baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""对比两次 benchmarks.suite 的 JSON 结果
+
+按场景列出两次的耗时和比值，比基准慢 --threshold 以上的场景标记为回归，存在回归时退出码为 1::
+
+    python -m benchmarks.compare base.json new.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.suite import RESULT_FORMAT
+
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    if result.get("format") != RESULT_FORMAT:
+        raise SystemExit(f"不是基准测试结果文件: {path}")
+    return result
+
+
+def compare(base, new, threshold):
+    """返回 [(场景, 基准耗时, 新耗时, 比值, 是否回归)]，只包含两次都运行过的场景"""
+    rows = []
+    for name, scenario in new["scenarios"].items():
+        if name not in base["scenarios"]:
+            continue
+        before = base["scenarios"][name]["seconds"]
+        after = scenario["seconds"]
+        ratio = after / before if before else None
+        rows.append((name, before, after, ratio, ratio is not None and ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", help="基准结果（例如上一个提交）")
+    parser.add_argument("new", help="新的结果")
+    parser.add_argument("--threshold", type=float, default=0.1, help="慢多少比例以上视为回归（默认 0.1）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出对比结果")
+    args = parser.parse_args(argv)
+
+    base = load(args.base)
+    new = load(args.new)
+    if base.get("parameters") != new.get("parameters"):
+        print("警告: 两次运行的参数不同，结果不可直接比较", file=sys.stderr)
+    rows = compare(base, new, args.threshold)
+
+    if args.json:
+        print(json.dumps({
+            "base": base.get("revision"),
+            "new": new.get("revision"),
+            "scenarios": [{"scenario": name, "base_seconds": before, "new_seconds": after,
+                           "ratio": ratio, "regression": regression}
+                          for name, before, after, ratio, regression in rows],
+        }, indent=2, ensure_ascii=False))
+    else:
+        print(f"{'场景':<16} {base.get('revision') or '基准':>10} {new.get('revision') or '新':>10} {'比值':>8}")
+        for name, before, after, ratio, regression in rows:
+            ratio_text = f"{ratio:7.2f}x" if ratio is not None else "       -"
+            print(f"{name:<16} {before:9.3f}s {after:9.3f}s {ratio_text}{'  回归' if regression else ''}")
+    return 1 if any(row[4] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""测量从回收站撤销大量删除操作的耗时
+
+在临时目录中建立一个 freedesktop 格式的回收站，先放入 --bin-items 个无关项目模拟"装满的回收站"，
+再清理一棵包含 --deletes 个快捷方式的合成目录树，最后逐条撤销这些删除记录。
+
+对照组（--linear-sample 条）每次撤销前丢弃索引，相当于旧实现每次都遍历整个回收站；
+其余记录复用同一个 TrashIndex。
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from file_cleaner import FileCleaner, FreedesktopTrash
+from benchmarks.synthetic_tree import default_bench_root, generate_tree
+
+
+def fill_trash(trash, directory, count):
+    """向回收站放入 count 个与本次清理无关的项目"""
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        path = os.path.join(directory, f"old_{i}.tmp")
+        fd = os.open(path, os.O_CREAT | os.O_WRONLY)
+        os.close(fd)
+        trash.recycle(path)
+
+
+def delete_operations(cleaner):
+    operations = cleaner.history_db.get_recent_operations(limit=-1)
+    return [op for op in operations if op[1] == "delete"]
+
+
+def revert_all(cleaner, operations, rebuild_each):
+    restored = 0
+    start = time.perf_counter()
+    for op in operations:
+        if rebuild_each:
+            cleaner._trash_index = None
+        if cleaner.revert_operation(op):
+            restored += 1
+    return time.perf_counter() - start, restored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--deletes", type=int, default=10_000, help="需要撤销的删除操作数")
+    parser.add_argument("--bin-items", type=int, default=20_000, help="回收站中预先存在的无关项目数")
+    parser.add_argument("--linear-sample", type=int, default=100, help="每次重建索引的对照组撤销条数")
+    parser.add_argument("--base", default=None, help="临时文件所在的父目录（默认使用 tmpfs）")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="filecleaner_bench_revert_", dir=args.base or default_bench_root())
+    old_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        trash = FreedesktopTrash(os.path.join(work_dir, "Trash"))
+        start = time.perf_counter()
+        fill_trash(trash, os.path.join(work_dir, "old"), args.bin_items)
+        print(f"回收站预置 {args.bin_items} 个项目: {time.perf_counter() - start:.2f} s")
+
+        root = os.path.join(work_dir, "tree")
+        # 每两个文件中有一个是 .url 快捷方式
+        generate_tree(root, files=args.deletes * 2, files_per_dir=200, match_ratio=0, cleanup_ratio=0.5)
+        cleaner = FileCleaner(trash=trash)
+        start = time.perf_counter()
+        results = cleaner.clean_directory(root)
+        print(f"清理删除 {len(results['deleted'])} 个文件: {time.perf_counter() - start:.2f} s")
+
+        operations = delete_operations(cleaner)
+        sample = operations[:args.linear_sample]
+        rest = operations[args.linear_sample:]
+
+        if sample:
+            elapsed, restored = revert_all(cleaner, sample, rebuild_each=True)
+            per_op = elapsed / len(sample)
+            print(f"每次重建索引: 撤销 {restored}/{len(sample)} 条, {per_op * 1000:8.2f} ms/条, "
+                  f"推算 {len(operations)} 条约 {per_op * len(operations):.1f} s")
+
+        cleaner._trash_index = None
+        elapsed, restored = revert_all(cleaner, rest, rebuild_each=False)
+        if rest:
+            print(f"复用索引:     撤销 {restored}/{len(rest)} 条, {elapsed / len(rest) * 1000:8.2f} ms/条, "
+                  f"共 {elapsed:.2f} s（含一次建立索引）")
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""对比旧的 os.walk 扫描循环与 DirectoryScanner 的扫描耗时
+
+两种实现都只做判断、不修改文件，测量的是"扫描 + 目标存在性检查"部分的开销。
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+from file_cleaner import DirectoryScanner
+from benchmarks.synthetic_tree import DEFAULT_PATTERN, SyntheticTree
+
+TARGET_EXTENSIONS = [".mp4", ".avi", ".mkv", ".mov", ".wmv", ".flv", ".m4v"]
+REMOVE_PATTERNS = ["hhd800.com@", "18av.mm-cg.com@", DEFAULT_PATTERN, "javbus.com@"]
+
+
+def legacy_walk(directory):
+    """旧实现：os.walk + 每个条目构造 Path + new_path.exists()"""
+    checked = 0
+    for root, _, files in os.walk(directory):
+        for file in files:
+            file_path = Path(root) / file
+            if any(file.lower().endswith(ext) for ext in TARGET_EXTENSIONS):
+                for pattern in REMOVE_PATTERNS:
+                    if pattern in file:
+                        new_path = file_path.parent / file.replace(pattern, "")
+                        new_path.exists()
+                        checked += 1
+    return checked
+
+
+def scandir_scan(directory):
+    """新实现：DirectoryScanner + 目录名称集合"""
+    checked = 0
+    for batch in DirectoryScanner().scan(directory):
+        for entry in batch.files:
+            file = entry.name
+            if any(file.lower().endswith(ext) for ext in TARGET_EXTENSIONS):
+                for pattern in REMOVE_PATTERNS:
+                    if pattern in file:
+                        batch.contains(file.replace(pattern, ""))
+                        checked += 1
+    return checked
+
+
+def time_call(func, directory, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(directory)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=1_000_000, help="合成目录树中的文件数量")
+    parser.add_argument("--files-per-dir", type=int, default=200)
+    parser.add_argument("--match-ratio", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=3, help="每种实现重复运行次数，取最快一次")
+    parser.add_argument("--base", help="合成目录树所在的父目录（默认使用 tmpfs）")
+    args = parser.parse_args(argv)
+
+    print(f"正在生成 {args.files} 个文件的合成目录树...")
+    with SyntheticTree(base=args.base, files=args.files,
+                       files_per_dir=args.files_per_dir, match_ratio=args.match_ratio) as root:
+        walk_time, walk_checked = time_call(legacy_walk, root, args.repeat)
+        scan_time, scan_checked = time_call(scandir_scan, root, args.repeat)
+
+    print(f"os.walk        : {walk_time:8.3f} s  ({args.files / walk_time:,.0f} 文件/秒, 检查 {walk_checked} 个目标)")
+    print(f"DirectoryScanner: {scan_time:8.3f} s  ({args.files / scan_time:,.0f} 文件/秒, 检查 {scan_checked} 个目标)")
+    print(f"加速比: {walk_time / scan_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
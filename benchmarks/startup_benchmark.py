@@ -0,0 +1,110 @@
+"""测量启动耗时：模块导入耗时（-X importtime）、命令行启动耗时和图形界面首帧时间
+
+结果以 JSON 输出，便于在不同版本之间对比，例如::
+
+    python -m benchmarks.startup_benchmark --output startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+GUI_MODULES = ("customtkinter", "tkinter", "winshell")
+# 只在用到时才导入的标准库模块：历史数据库、归档、命令行解析和多线程执行器
+DEFERRED_MODULES = ("sqlite3", "gzip", "argparse", "concurrent")
+
+
+def run_python(args, env=None):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable] + args, cwd=REPO_ROOT, env=env,
+                          capture_output=True, text=True, encoding="utf-8", errors="replace")
+    return time.perf_counter() - start, proc
+
+
+def import_report(top):
+    """解析 python -X importtime 的输出，返回总导入耗时和自身耗时最多的模块"""
+    _, proc = run_python(["-X", "importtime", "-c", "import file_cleaner"])
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us)))
+    total = next((cumulative for name, _, cumulative in modules if name == "file_cleaner"), None)
+    modules.sort(key=lambda m: m[1], reverse=True)
+    return {
+        "file_cleaner_cumulative_ms": total / 1000 if total is not None else None,
+        "gui_modules_imported": sorted({name.split(".")[0] for name, _, _ in modules
+                                        if name.split(".")[0] in GUI_MODULES}),
+        "deferred_modules_imported": sorted({name.split(".")[0] for name, _, _ in modules
+                                             if name.split(".")[0] in DEFERRED_MODULES}),
+        "top_self_ms": [{"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000}
+                        for name, self_us, cumulative_us in modules[:top]],
+    }
+
+
+def cli_startup_ms():
+    elapsed, proc = run_python(["-m", "file_cleaner", "--help"])
+    return elapsed * 1000 if proc.returncode == 0 else None
+
+
+def first_frame():
+    """启动图形界面，首帧绘制完成后程序自行退出；返回 (进程内首帧耗时, 进程总耗时)，失败时返回 None"""
+    env = dict(os.environ, FILE_CLEANER_STARTUP_PROBE="1")
+    elapsed, proc = run_python(["file_cleaner.py"], env=env)
+    match = re.search(r"first_frame_ms=([\d.]+)", proc.stderr)
+    if not match:
+        return None
+    return float(match.group(1)), elapsed * 1000
+
+
+def median_or_none(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="每项测量重复次数，取中位数")
+    parser.add_argument("--top", type=int, default=15, help="报告自身导入耗时最多的前 N 个模块")
+    parser.add_argument("--no-gui", action="store_true", help="跳过图形界面首帧测量（无显示环境时使用）")
+    parser.add_argument("--output", help="把 JSON 结果写入文件")
+    args = parser.parse_args(argv)
+
+    # 先运行一次，确保 .pyc 已经生成，不把编译时间算进导入耗时
+    run_python(["-c", "import file_cleaner"])
+
+    reports = [import_report(args.top) for _ in range(args.repeat)]
+    result = {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "import_ms": median_or_none([r["file_cleaner_cumulative_ms"] for r in reports]),
+        "gui_modules_imported": reports[-1]["gui_modules_imported"],
+        "deferred_modules_imported": reports[-1]["deferred_modules_imported"],
+        "top_imports": reports[-1]["top_self_ms"],
+        "cli_startup_ms": median_or_none([cli_startup_ms() for _ in range(args.repeat)]),
+        "first_frame_ms": None,
+        "first_frame_process_ms": None,
+    }
+    if not args.no_gui:
+        frames = [first_frame() for _ in range(args.repeat)]
+        result["first_frame_ms"] = median_or_none([f[0] for f in frames if f])
+        result["first_frame_process_ms"] = median_or_none([f[1] for f in frames if f])
+        if result["first_frame_ms"] is None:
+            print("图形界面无法启动（缺少显示环境或 customtkinter），跳过首帧测量", file=sys.stderr)
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
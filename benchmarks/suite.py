@@ -0,0 +1,343 @@
+"""基准测试套件：在合成目录树上运行固定的场景，结果以 JSON 输出，便于在不同提交之间对比
+
+场景：
+    scan_only       只扫描生成计划（dry_run，完整扫描，不使用目录状态缓存）
+    rename_heavy    clean_directory，一半文件需要重命名，部分与已有文件重名
+    delete_heavy    clean_directory，一半文件是需要删除的快捷方式
+    history_insert  通过会话写入器插入操作记录
+    history_query   在 history_insert 生成的数据库上执行分页、搜索和计数查询
+    bulk_revert     撤销一次包含重命名和删除的清理会话
+    rename_rules    对一批文件名分别计时每条重命名规则，以及 remove_patterns 加全部规则的整条规则链；
+                    默认使用 SAMPLE_RENAME_RULES，--rules-config 可以指定一个配置文件测试其中的 rename_rules
+
+回收站替换为 StubTrash（移动到临时目录中），不会触碰系统回收站。例如::
+
+    python -m benchmarks.suite --output base.json
+    python -m benchmarks.suite --scenarios scan_only,bulk_revert --files 50000 --output new.json
+    python -m benchmarks.compare base.json new.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from file_cleaner import (CompiledRuleSet, FileCleaner, FileRenamer, HistoryDatabase,
+                          LocalFileOperations, PatternMatcher, RenameRule,
+                          REASON_PATTERNS_REMOVED, REASON_SHORTCUT_RECYCLED)
+from benchmarks.synthetic_tree import generate_tree, default_bench_root, DEFAULT_PATTERN
+
+RESULT_FORMAT = "filecleaner-bench/1"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# rename_rules 场景默认测试的规则：站点标签、分辨率标记、结尾的 -C
+SAMPLE_RENAME_RULES = [
+    {"type": "regex", "pattern": r"\[[^\]]*\]", "name": "site_tag"},
+    {"type": "regex", "pattern": r" ?[\[(]?\b(?:480|720|1080|2160)[pP]\b[\])]?", "name": "resolution"},
+    {"type": "regex", "pattern": r"-C(?=\.[^.]+$)", "ignore_case": True, "name": "trailing_c"},
+    {"type": "literal", "pattern": "hhd800.com@", "name": "literal_prefix"},
+]
+
+
+class StubTrash:
+    """回收站替身：把文件移动到 directory 中，接口与 FreedesktopTrash 相同"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = {}
+        self.counter = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def recycle(self, path):
+        self.counter += 1
+        handle = os.path.join(self.directory, str(self.counter))
+        os.rename(path, handle)
+        self.entries[handle] = (os.path.abspath(path), datetime.now())
+
+    def items(self):
+        for handle, (original_path, deleted_at) in self.entries.items():
+            yield original_path, deleted_at, handle
+
+    def restore(self, handle, original_path):
+        if os.path.lexists(original_path):
+            raise FileExistsError(original_path)
+        os.rename(handle, original_path)
+        del self.entries[handle]
+
+
+class Workspace:
+    """一次场景运行使用的临时目录：目录树、配置文件、历史数据库和回收站都在其中"""
+
+    def __init__(self, base):
+        self.path = tempfile.mkdtemp(prefix="filecleaner_suite_", dir=base)
+        self.tree = os.path.join(self.path, "tree")
+        self.db_file = os.path.join(self.path, "history.db")
+
+    def cleaner(self):
+        trash = StubTrash(os.path.join(self.path, "trash"))
+        # 不存在配置文件时 FileCleanerConfig 会打印提示，这里不需要
+        with contextlib.redirect_stdout(io.StringIO()):
+            cleaner = FileCleaner(file_ops=LocalFileOperations(trash),
+                                  config_file=os.path.join(self.path, "config.json"),
+                                  db_file=self.db_file, trash=trash)
+        cleaner.config.override("incremental_scan", False)
+        return cleaner
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def tree_options(args, **overrides):
+    options = {
+        "files": args.files,
+        "files_per_dir": args.files_per_dir,
+        "fanout": args.fanout,
+        "depth": args.depth,
+        "match_ratio": 0.1,
+        "cleanup_ratio": 0.01,
+        "collision_ratio": 0.0,
+    }
+    options.update(overrides)
+    return options
+
+
+def scan_only(workspace, args):
+    options = tree_options(args)
+    generate_tree(workspace.tree, **options)
+    cleaner = workspace.cleaner()
+    start = time.perf_counter()
+    results = cleaner.dry_run(workspace.tree)
+    elapsed = time.perf_counter() - start
+    return elapsed, options["files"], {"planned": len(results["renamed"]) + len(results["deleted"])}
+
+
+def rename_heavy(workspace, args):
+    options = tree_options(args, match_ratio=0.5, cleanup_ratio=0.0, collision_ratio=0.1)
+    generate_tree(workspace.tree, **options)
+    cleaner = workspace.cleaner()
+    start = time.perf_counter()
+    results = cleaner.clean_directory(workspace.tree)
+    elapsed = time.perf_counter() - start
+    operations = len(results["renamed"]) + len(results["skipped"])
+    return elapsed, operations, {"renamed": len(results["renamed"]), "skipped": len(results["skipped"])}
+
+
+def delete_heavy(workspace, args):
+    options = tree_options(args, match_ratio=0.0, cleanup_ratio=0.5)
+    generate_tree(workspace.tree, **options)
+    cleaner = workspace.cleaner()
+    start = time.perf_counter()
+    results = cleaner.clean_directory(workspace.tree)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(results["deleted"]), {"deleted": len(results["deleted"])}
+
+
+def fill_history(db, rows, session_id="bench"):
+    """通过会话写入器插入 rows 条记录（九成重命名、一成删除）"""
+    writer = db.open_session_writer(session_id, batch_size=500, flush_interval=3600)
+    try:
+        for i in range(rows):
+            directory = f"/bench/d{i // 200}"
+            if i % 10 == 9:
+                writer.add_operation("delete", f"{directory}/link_{i}.url", None, REASON_SHORTCUT_RECYCLED)
+            else:
+                writer.add_operation("rename", f"{directory}/javdb.com@video_{i}.mp4",
+                                     f"{directory}/video_{i}.mp4", REASON_PATTERNS_REMOVED, ["javdb.com@"])
+    finally:
+        writer.close()
+
+
+def history_insert(workspace, args):
+    db = HistoryDatabase(workspace.db_file)
+    start = time.perf_counter()
+    fill_history(db, args.history_rows)
+    elapsed = time.perf_counter() - start
+    return elapsed, args.history_rows, {}
+
+
+def history_query(workspace, args):
+    db = HistoryDatabase(workspace.db_file)
+    fill_history(db, args.history_rows)
+    middle = db.get_operations_page(limit=1, offset=args.history_rows // 2)[0]
+    queries = {
+        "first_page": lambda: db.get_operations_page(limit=200),
+        "keyset_page": lambda: db.get_operations_page(limit=200, before=(middle.timestamp, middle.id)),
+        "count": lambda: db.count_operations(),
+        "search_path": lambda: db.search_operations(text="video_12345", reverted=None),
+        "search_short": lambda: db.search_operations(text="_9", reverted=None),
+        "search_type": lambda: db.search_operations(operation_type="delete", reverted=False),
+        "count_search": lambda: db.count_search_results(text="video_1", reverted=None),
+    }
+    timings = {}
+    for name, query in queries.items():
+        start = time.perf_counter()
+        query()
+        timings[name] = time.perf_counter() - start
+    return sum(timings.values()), len(queries), {"queries_ms": {k: v * 1000 for k, v in timings.items()}}
+
+
+def bulk_revert(workspace, args):
+    options = tree_options(args, match_ratio=0.5, cleanup_ratio=0.2)
+    generate_tree(workspace.tree, **options)
+    cleaner = workspace.cleaner()
+    cleaner.clean_directory(workspace.tree)
+    session_id = cleaner.history_db.get_cleaning_sessions(limit=1)[0][0]
+    start = time.perf_counter()
+    results = cleaner.revert_session(session_id)
+    elapsed = time.perf_counter() - start
+    operations = len(results["renamed"]) + len(results["restored"])
+    return elapsed, operations, {"renamed": len(results["renamed"]), "restored": len(results["restored"]),
+                                 "skipped": len(results["skipped"]), "errors": len(results["errors"])}
+
+
+def rename_names(count):
+    """rename_rules 场景使用的文件名：大约一半带有各种需要处理的标记"""
+    templates = [
+        "ABP-{0}.mp4",
+        "[site.com]ABP-{0}.mp4",
+        DEFAULT_PATTERN + "ABP-{0} 1080p.mp4",
+        "ABP-{0}-C.mp4",
+        "hhd800.com@SSIS-{0} [720P]-c.mkv",
+        "Some Movie Title ({0}).mkv",
+    ]
+    return [templates[i % len(templates)].format(i) for i in range(count)]
+
+
+def time_apply(apply, names):
+    start = time.perf_counter()
+    for name in names:
+        apply(name)
+    return time.perf_counter() - start
+
+
+def rename_rules(workspace, args):
+    rename_rules = SAMPLE_RENAME_RULES
+    if args.rules_config:
+        with open(args.rules_config, "r", encoding="utf-8") as f:
+            rename_rules = json.load(f).get("rename_rules") or []
+    rules = CompiledRuleSet.from_config({
+        "target_extensions": [".mp4", ".mkv"],
+        "cleanup_extensions": [".url"],
+        "remove_patterns": [DEFAULT_PATTERN],
+        "collision_strategy": "skip",
+        "scan_subdirectories": True,
+        "incremental_scan": False,
+        "rename_rules": rename_rules,
+    })
+    names = rename_names(args.rule_names)
+
+    per_rule = {}
+    for item in rename_rules:
+        rule = RenameRule.from_config(item)
+        single = FileRenamer(PatternMatcher(()), [rule])
+        per_rule[rule.label] = time_apply(single.apply, names) / len(names) * 1e6
+    # 整条规则链：不匹配任何规则的文件名只用组合正则扫描一遍；paths 限定的规则按根目录计算是否生效
+    renamer = rules.renamer(workspace.path)
+    elapsed = time_apply(renamer.apply, names)
+    renamed = sum(1 for name in names if renamer.apply(name))
+    return elapsed, len(names), {"rules": len(rules.rename_rules), "renamed": renamed,
+                                 "rules_us_per_name": per_rule}
+
+
+SCENARIOS = {
+    "scan_only": scan_only,
+    "rename_heavy": rename_heavy,
+    "delete_heavy": delete_heavy,
+    "history_insert": history_insert,
+    "history_query": history_query,
+    "bulk_revert": bulk_revert,
+    "rename_rules": rename_rules,
+}
+
+
+def git_revision():
+    try:
+        proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return proc.stdout.strip() or None
+
+
+def run_scenario(name, args, base):
+    """运行 repeat 次，每次使用新的临时目录，记录最快的一次"""
+    runs = []
+    items = 0
+    extra = {}
+    for _ in range(args.repeat):
+        workspace = Workspace(base)
+        try:
+            elapsed, items, extra = SCENARIOS[name](workspace, args)
+        finally:
+            workspace.remove()
+        runs.append(elapsed)
+    best = min(runs)
+    return {
+        "seconds": best,
+        "runs": runs,
+        "items": items,
+        "us_per_item": best / items * 1e6 if items else None,
+        **extra,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景列表")
+    parser.add_argument("--files", type=int, default=20_000, help="合成目录树中的文件数量")
+    parser.add_argument("--files-per-dir", type=int, default=200)
+    parser.add_argument("--fanout", type=int, default=16, help="每个目录的子目录数")
+    parser.add_argument("--depth", type=int, default=None, help="文件所在目录的层数（默认由文件数决定）")
+    parser.add_argument("--history-rows", type=int, default=100_000, help="历史记录场景插入的记录数")
+    parser.add_argument("--rule-names", type=int, default=200_000, help="rename_rules 场景处理的文件名数量")
+    parser.add_argument("--rules-config", help="rename_rules 场景改为测试此配置文件中的 rename_rules")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景重复运行次数，取最快一次")
+    parser.add_argument("--base", help="临时文件所在的父目录（默认使用 tmpfs）")
+    parser.add_argument("--output", help="把 JSON 结果写入文件")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的场景: {', '.join(unknown)}")
+
+    base = args.base or default_bench_root()
+    result = {
+        "format": RESULT_FORMAT,
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "parameters": {
+            "files": args.files,
+            "files_per_dir": args.files_per_dir,
+            "fanout": args.fanout,
+            "depth": args.depth,
+            "history_rows": args.history_rows,
+            "rule_names": args.rule_names,
+            "rules_config": args.rules_config,
+            "repeat": args.repeat,
+        },
+        "scenarios": {},
+    }
+    for name in names:
+        print(f"正在运行 {name}...", file=sys.stderr)
+        scenario = run_scenario(name, args, base)
+        result["scenarios"][name] = scenario
+        print(f"  {scenario['seconds']:8.3f} s, {scenario['items']} 项", file=sys.stderr)
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""生成用于基准测试的合成目录树"""
+import os
+import shutil
+import tempfile
+
+DEFAULT_PATTERN = "javdb.com@"
+
+
+def default_bench_root():
+    """优先使用 tmpfs（/dev/shm），避免磁盘 I/O 干扰测试结果"""
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _dir_for_index(root, index, fanout, depth=None):
+    # 把目录序号按 fanout 进制拆分成多级路径，得到一棵均衡的目录树；
+    # 指定 depth 时所有文件都位于第 depth 层，目录序号超出 fanout ** depth 后循环使用
+    parts = []
+    if depth:
+        index %= fanout ** depth
+        for _ in range(depth):
+            parts.append(f"d{index % fanout}")
+            index //= fanout
+    else:
+        while True:
+            parts.append(f"d{index % fanout}")
+            index //= fanout
+            if index == 0:
+                break
+    return os.path.join(root, *reversed(parts))
+
+
+def _touch(path):
+    fd = os.open(path, os.O_CREAT | os.O_WRONLY)
+    os.close(fd)
+
+
+def generate_tree(root, files=1_000_000, files_per_dir=200, fanout=16,
+                  match_ratio=0.1, cleanup_ratio=0.01, pattern=DEFAULT_PATTERN,
+                  depth=None, collision_ratio=0.0):
+    """在 root 下创建 files 个空文件
+
+    match_ratio 比例的文件带有 pattern 前缀（会被重命名），
+    cleanup_ratio 比例的文件是 .url 快捷方式（会被删除），其余为普通视频文件。
+    collision_ratio 比例的带前缀文件在同一目录中已有去掉前缀后的同名文件（重命名会被跳过），
+    这些同名文件也计入 files。
+    depth: 文件所在目录的层数，默认由文件数、files_per_dir 和 fanout 决定。
+    返回实际创建的文件数。
+    """
+    match_every = int(1 / match_ratio) if match_ratio else 0
+    cleanup_every = int(1 / cleanup_ratio) if cleanup_ratio else 0
+    collision_every = int(1 / collision_ratio) if collision_ratio else 0
+    created = 0
+    matched = 0
+    dir_index = 0
+    while created < files:
+        directory = _dir_for_index(root, dir_index, fanout, depth)
+        os.makedirs(directory, exist_ok=True)
+        dir_end = min(files, created + files_per_dir)
+        while created < dir_end:
+            if cleanup_every and created % cleanup_every == 1:
+                _touch(os.path.join(directory, f"link_{created}.url"))
+            elif match_every and created % match_every == 0:
+                _touch(os.path.join(directory, f"{pattern}video_{created}.mp4"))
+                if collision_every and matched % collision_every == 0 and created + 1 < dir_end:
+                    created += 1
+                    _touch(os.path.join(directory, f"video_{created - 1}.mp4"))
+                matched += 1
+            else:
+                _touch(os.path.join(directory, f"video_{created}.mp4"))
+            created += 1
+        dir_index += 1
+    return created
+
+
+class SyntheticTree:
+    """上下文管理器：创建临时合成目录树，退出时删除"""
+
+    def __init__(self, base=None, **options):
+        self.base = base or default_bench_root()
+        self.options = options
+        self.root = None
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp(prefix="filecleaner_bench_", dir=self.base)
+        generate_tree(self.root, **self.options)
+        return self.root
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.root, ignore_errors=True)
+        return False
@@ -17,7 +17,8 @@ def build_exe():
         'file_cleaner.py',  # 主脚本
         '--name=FileCleaner',  # 生成的 exe 名称
         '--noconsole',  # 不显示控制台窗口
-        '--onefile',  # 打包成单个文件
+        # 默认打包成目录：单文件模式每次启动都要先把所有依赖解压到临时目录，明显拖慢启动
+        '--onefile' if '--onefile' in sys.argv[1:] else '--onedir',
         '--clean',  # 清理临时文件
         f'--add-data={customtkinter_path};customtkinter',  # 使用实际的 customtkinter 路径
         '--hidden-import=customtkinter',
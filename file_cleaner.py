@@ -1,16 +1,42 @@
 import os
+import sys
+import contextlib
+import errno
+import fnmatch
+import hashlib
+import itertools
 import json
 import re
-from pathlib import Path
-import customtkinter as ctk
-from tkinter import filedialog, messagebox
-import sqlite3
-from datetime import datetime, timedelta
-import winshell
+import signal
+import queue
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+from datetime import datetime
+
+# 模块开始加载的时间，用于统计图形界面的首帧时间
+MODULE_START_TIME = time.perf_counter()
+
+# 图形界面模块只在启动 GUI 时导入（见 load_gui_modules），命令行模式不需要 tkinter
+ctk = None
+filedialog = None
+messagebox = None
+
+def load_gui_modules():
+    """导入 customtkinter 和 tkinter 对话框模块"""
+    global ctk, filedialog, messagebox
+    if ctk is None:
+        import customtkinter
+        from tkinter import filedialog as tk_filedialog, messagebox as tk_messagebox
+        ctk = customtkinter
+        filedialog = tk_filedialog
+        messagebox = tk_messagebox
 
 class FileCleanerConfig:
-    def __init__(self):
-        self.config_file = "cleaner_config.json"
+    def __init__(self, config_file="cleaner_config.json"):
+        self.config_file = config_file
         # 修改配置键名,使其更一致
         self.default_config = {
             "target_extensions": [".mp4", ".avi", ".mkv", ".mov", ".wmv", ".flv", ".m4v"],
@@ -21,19 +47,103 @@ class FileCleanerConfig:
                 "javbus.com@"
             ],
             "cleanup_extensions": [".url", ".ink", ".lnk", ".desktop"],
-            "scan_subdirectories": True
+            "scan_subdirectories": True,
+            # 历史记录批量写入：累计多少条或间隔多少秒提交一次
+            "history_batch_size": 500,
+            "history_flush_interval": 2.0,
+            # 并行执行重命名/删除的线程数（按目录分片）
+            "worker_threads": 4,
+            # 增量扫描：跳过自上次扫描后没有变化的目录；缓存超过指定天数未用到时清除
+            "incremental_scan": True,
+            "directory_cache_max_age_days": 90,
+            # 历史记录保留策略（0 表示不限制）：超过天数或超出最近会话数的会话归档到 history_archive_dir 后删除，
+            # history_type_max_age_days 中的操作类型超过天数后直接删除；每隔 history_maintenance_interval_hours 小时维护一次
+            "history_max_age_days": 365,
+            "history_max_sessions": 1000,
+            "history_type_max_age_days": {"skip": 30, "error": 180},
+            "history_archive_dir": "history_archive",
+            "history_maintenance_interval_hours": 24,
+            # 监视模式：文件最后一次变化后等待多少秒再处理；不支持 inotify 时轮询目录的间隔（秒）
+            "watch_debounce_seconds": 2.0,
+            "watch_poll_interval": 5.0,
+            # 重命名的目标名称已被占用时的处理方式，见 COLLISION_STRATEGIES
+            "collision_strategy": "skip",
+            # 在 remove_patterns 之后依次应用的重命名规则，格式见 RenameRule.from_config
+            "rename_rules": [],
+            # 结果汇总中每类记录在内存中保留的条数，超出的部分写入临时文件
+            "results_memory_limit": 10000
         }
+        # 缺少这些键的配置文件视为不完整，其余键缺失时使用默认值
+        self.required_keys = ("target_extensions", "remove_patterns", "cleanup_extensions", "scan_subdirectories")
+        # 命令行参数等对配置项的覆盖，重新加载配置文件后仍然有效
+        self.overrides = {}
+        # 加载时配置文件的修改时间，rules() 发现它变化后重新加载
+        self._mtime_ns = None
         self.config = self.load_config()
+        self._rules = None
+        self._rules_config = None
+        self._lock = threading.Lock()
+    
+    def rules(self):
+        """返回当前配置编译出的 CompiledRuleSet
+
+        每次调用检查一次配置文件的修改时间（一次 stat），文件被修改后先重新加载；
+        self.config 被整体替换或调用 override() 之后重新编译。规则集不可变，替换是原子的，
+        正在进行的扫描继续使用它开始时取得的规则集。
+        """
+        with self._lock:
+            self.reload_if_changed()
+            if self._rules_config is not self.config:
+                self._rules = CompiledRuleSet.from_config(self.config, self._rules)
+                self._rules_config = self.config
+            return self._rules
+    
+    def override(self, key, value):
+        """覆盖一个配置项（不写入配置文件），重新加载配置文件后仍然有效"""
+        self.overrides[key] = value
+        self.config[key] = value
+        self._rules_config = None
+    
+    def _file_mtime(self):
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    def reload_if_changed(self):
+        """配置文件的修改时间变化后重新读取，返回是否重新加载
+
+        文件无法解析或不完整（例如编辑器还没有写完）时保留当前配置，不会像启动时那样改用默认配置。
+        """
+        mtime_ns = self._file_mtime()
+        if mtime_ns is None or mtime_ns == self._mtime_ns:
+            return False
+        # 先记录修改时间，有问题的文件不会在每次调用时重新读取
+        self._mtime_ns = mtime_ns
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                loaded_config = json.load(f)
+        except Exception as e:
+            print(f"重新加载配置文件失败，继续使用原来的配置: {e}")
+            return False
+        if not isinstance(loaded_config, dict) or not all(key in loaded_config for key in self.required_keys):
+            print("配置文件格式不完整，继续使用原来的配置")
+            return False
+        self.config = {**self.default_config, **loaded_config, **self.overrides}
+        print("配置文件已修改，已重新加载")
+        return True
     
     def load_config(self):
         try:
             # 如果配置文件存在，则加载它
             if os.path.exists(self.config_file):
+                self._mtime_ns = self._file_mtime()
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     loaded_config = json.load(f)
                     # 检查加载配置是否包含所必要的键
-                    if all(key in loaded_config for key in self.default_config.keys()):
-                        return loaded_config
+                    if all(key in loaded_config for key in self.required_keys):
+                        # 旧版本配置文件中缺少的可选项使用默认值补齐
+                        return {**self.default_config, **loaded_config}
                     else:
                         print("配置文件格式不完整，使用默认配置")
                         return self.create_default_config()
@@ -49,92 +159,725 @@ class FileCleanerConfig:
         try:
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(self.default_config, f, indent=4, ensure_ascii=False)
+            self._mtime_ns = self._file_mtime()
             print("已创建默认配置文件")
-            return self.default_config
+            return dict(self.default_config)
         except Exception as e:
             print(f"创建默认配置文件时出错: {e}")
-            return self.default_config
+            return dict(self.default_config)
     
     def save_config(self, config):
-        """保存配置到文件"""
+        """保存配置到文件，失败时抛出异常由调用方提示"""
         try:
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=4, ensure_ascii=False)
+            # 调用方随后会替换 self.config，不需要再从文件重新加载
+            self._mtime_ns = self._file_mtime()
         except Exception as e:
             print(f"保存配置文件时出错: {e}")
-            messagebox.showerror("错误", f"保存配置文件时出错: {e}")
+            raise
+
+class PatternMatcher:
+    """把 remove_patterns 编译成一个组合正则，每个文件名只需扫描一遍即可找出所有命中的模式"""
+
+    def __init__(self, patterns):
+        self.source = tuple(patterns)
+        # 去重、去空；较长的模式排在前面，避免短模式抢先匹配到长模式的一部分
+        unique = sorted({p for p in self.source if p}, key=len, reverse=True)
+        self._regex = re.compile("|".join(map(re.escape, unique))) if unique else None
+
+    def apply(self, name):
+        """移除文件名中所有命中的模式
+
+        返回 (新文件名, 命中的模式列表)，没有命中时返回 None。
+        """
+        if self._regex is None:
+            return None
+        found = self._regex.findall(name)
+        if not found:
+            return None
+        return self._regex.sub("", name), list(dict.fromkeys(found))
+
+@lru_cache(maxsize=256)
+def _compile(source):
+    """编译正则；配置重新加载时没有变化的规则不会重新编译"""
+    return re.compile(source)
+
+# 模式中引用了自身分组的规则（\1、\g<...>、(?P=...)）放进组合正则后分组编号会变化
+_BACKREFERENCE = re.compile(r"\\(?:[1-9]|g<)|\(\?P=")
+
+class RenameRule(namedtuple("RenameRule", ("kind", "pattern", "replace", "ignore_case", "paths", "label"))):
+    """rename_rules 中的一条规则"""
+    __slots__ = ()
+
+    @classmethod
+    def from_config(cls, item):
+        """解析配置中的一项，格式错误时抛出 ValueError
+
+        字符串等同于 {"pattern": 字符串}。字典的键：
+            type: "literal"（默认，按原文匹配）或 "regex"
+            pattern: 要匹配的文本或正则表达式
+            replace: 替换为的文本，默认为空（即删除）；regex 规则中可以用 \\1、\\g<name> 引用分组
+            ignore_case: 是否忽略大小写，默认 false
+            paths: glob 列表，只对路径匹配其中之一的目录（及其子目录）中的文件生效，例如 "*/字幕"
+            name: 历史记录中显示的规则名称，默认为 pattern
+        """
+        if isinstance(item, str):
+            item = {"pattern": item}
+        if not isinstance(item, dict):
+            raise ValueError(f"规则必须是字符串或对象: {item!r}")
+        kind = item.get("type", "literal")
+        if kind not in ("literal", "regex"):
+            raise ValueError(f"未知的规则类型: {kind}")
+        pattern = item.get("pattern")
+        if not isinstance(pattern, str) or not pattern:
+            raise ValueError(f"规则缺少 pattern: {item!r}")
+        paths = item.get("paths") or ()
+        if isinstance(paths, str):
+            paths = (paths,)
+        rule = cls(kind, pattern, str(item.get("replace", "")), bool(item.get("ignore_case", False)),
+                   tuple(str(path).replace("\\", "/") for path in paths), str(item.get("name") or pattern))
+        try:
+            _compile(rule.source)
+        except re.error as e:
+            raise ValueError(f"正则表达式无效: {pattern}: {e}")
+        return rule
+
+    @property
+    def combinable(self):
+        """能否作为一个分支放进 _any_rule_filter 的组合正则"""
+        return not (self.kind == "regex" and _BACKREFERENCE.search(self.pattern))
+
+    @property
+    def source(self):
+        body = self.pattern if self.kind == "regex" else re.escape(self.pattern)
+        return f"(?i:{body})" if self.ignore_case else body
+
+    def applies_to(self, directory):
+        """没有 paths 的规则对所有目录生效；否则目录本身或它的某个上级目录匹配 paths 中的 glob 时生效"""
+        if not self.paths:
+            return True
+        path = directory.replace(os.sep, "/")
+        while True:
+            if any(fnmatch.fnmatch(path, pattern) for pattern in self.paths):
+                return True
+            parent = path.rsplit("/", 1)[0]
+            if not parent or parent == path:
+                return False
+            path = parent
+
+    def apply(self, name):
+        """替换 name 中所有匹配的部分，返回新文件名；没有变化时返回 None"""
+        if self.kind == "literal" and not self.ignore_case:
+            new_name = name.replace(self.pattern, self.replace)
+        elif self.kind == "literal":
+            replace = self.replace
+            new_name = _compile(self.source).sub(lambda match: replace, name)
+        else:
+            new_name = _compile(self.source).sub(self.replace, name)
+        return new_name if new_name != name else None
+
+def _any_rule_filter(rules):
+    """把规则合并为 (?:规则1)|(?:规则2)|... 的正则，用于一次扫描判断文件名是否可能被修改
+
+    规则是依次应用的：文件名不匹配其中任何一条时，第一条规则不会修改它，之后的每一条看到的都是原文件名，
+    所以整条规则链都不会修改它。有引用自身分组的规则、或者合并后无法编译（例如命名分组重名）时返回 None。
+    """
+    if not rules or not all(rule.combinable for rule in rules):
+        return None
+    try:
+        return _compile("|".join(f"(?:{rule.source})" for rule in rules))
+    except re.error:
+        return None
+
+class FileRenamer:
+    """对一个目录中的文件先移除 remove_patterns，再按配置顺序逐条应用生效的 rename_rules，
+    每条规则处理的是前一条的结果"""
+    __slots__ = ("matcher", "rules", "_filter")
+
+    def __init__(self, matcher, rules):
+        self.matcher = matcher
+        self.rules = tuple(rules)
+        self._filter = _any_rule_filter(self.rules)
+
+    def apply(self, name):
+        """返回 (新文件名, 命中的模式和规则名称列表)；没有命中、或结果不是合法的文件名时返回 None"""
+        found = []
+        new_name = name
+        match = self.matcher.apply(name)
+        if match:
+            new_name, found = match
+        # 大多数文件名不匹配任何规则，先用组合正则扫描一遍排除
+        if self.rules and (self._filter is None or self._filter.search(new_name)):
+            for rule in self.rules:
+                result = rule.apply(new_name)
+                if result is not None:
+                    new_name = result
+                    found.append(rule.label)
+        if not found or new_name == name or new_name in ("", ".", "..") or "/" in new_name or os.sep in new_name:
+            return None
+        if new_name.startswith(".") and not name.startswith("."):
+            # 只剩下扩展名，重命名后会变成隐藏文件
+            return None
+        return new_name, list(dict.fromkeys(found))
+
+def _normalize_suffix(ext):
+    """扩展名统一为小写并以点开头；空字符串返回 None"""
+    ext = str(ext).strip().lower()
+    if not ext:
+        return None
+    return ext if ext.startswith(".") else "." + ext
+
+class CompiledRuleSet(namedtuple("CompiledRuleSet", (
+    "target_suffixes", "cleanup_suffixes", "max_suffix_dots", "matcher",
+    "collision_strategy", "recursive", "incremental", "fingerprint", "rename_rules"
+))):
+    """由配置编译出的不可变规则集，一次扫描从头到尾使用同一个对象（见 FileCleanerConfig.rules）
+
+    扩展名统一为小写、以点开头，保存在 frozenset 中；判断文件类型时只取文件名最后几个点之后的后缀查表，
+    耗时与扩展名的数量无关，也支持 ".part.mp4" 这样包含多个点的后缀。
+    重命名时先移除 remove_patterns，再按顺序逐条应用 rename_rules（见 renamer）。
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_config(cls, config, previous=None):
+        """编译配置；previous 是上一个规则集，模式列表没有变化时复用它的匹配器"""
+        target = frozenset(filter(None, map(_normalize_suffix, config["target_extensions"])))
+        cleanup = frozenset(filter(None, map(_normalize_suffix, config["cleanup_extensions"])))
+        patterns = tuple(config["remove_patterns"])
+        if previous is not None and previous.matcher.source == patterns:
+            matcher = previous.matcher
+        else:
+            matcher = PatternMatcher(patterns)
+        strategy = config["collision_strategy"]
+        if strategy not in COLLISION_STRATEGIES:
+            print(f"未知的 collision_strategy: {strategy}，使用 skip")
+            strategy = "skip"
+        rename_rules = []
+        for item in config.get("rename_rules") or ():
+            try:
+                rename_rules.append(RenameRule.from_config(item))
+            except ValueError as e:
+                print(f"忽略无效的重命名规则: {e}")
+        rename_rules = tuple(rename_rules)
+        fingerprint = hashlib.sha1(json.dumps(
+            [sorted(target), list(patterns), sorted(cleanup), strategy, rename_rules], ensure_ascii=False
+        ).encode("utf-8")).hexdigest()
+        return cls(
+            target,
+            cleanup,
+            max((suffix.count(".") for suffix in target | cleanup), default=0),
+            matcher,
+            strategy,
+            bool(config["scan_subdirectories"]),
+            bool(config["incremental_scan"]),
+            fingerprint,
+            rename_rules
+        )
+
+    def renamer(self, directory):
+        """返回对 directory 中的文件生效的 FileRenamer，每个目录调用一次"""
+        return FileRenamer(self.matcher, [rule for rule in self.rename_rules if rule.applies_to(directory)])
+
+    def kind(self, name):
+        """返回 "delete"（要清理的快捷方式）、"rename"（要处理的目标文件）或 None；两者都匹配时按快捷方式处理"""
+        lower = name.lower()
+        end = len(lower)
+        is_target = False
+        for _ in range(self.max_suffix_dots):
+            end = lower.rfind(".", 0, end)
+            if end < 0:
+                break
+            suffix = lower[end:]
+            if suffix in self.cleanup_suffixes:
+                return "delete"
+            if suffix in self.target_suffixes:
+                is_target = True
+        return "rename" if is_target else None
+
+# 历史记录详情的编码：operations.reason_code 保存原因，detail_args 以 JSON 数组保存参数，
+# 界面显示时才用 format_details 拼成文本；旧版本写入的文本由 compact_details 转换为编码
+REASON_PATTERNS_REMOVED = 1
+REASON_TARGET_EXISTS = 2
+REASON_SOURCE_MISSING = 3
+REASON_SHORTCUT_RECYCLED = 4
+REASON_SHORTCUT_DELETED = 5
+REASON_SHORTCUT_DELETED_NO_RECYCLE_BIN = 6
+REASON_RENAME_FAILED = 7
+REASON_DELETE_FAILED = 8
+REASON_CLEANING_ERROR = 9
+REASON_OPERATION_FAILED = 10
+REASON_RENAMED_WITH_SUFFIX = 11
+REASON_TARGET_REPLACED = 12
+REASON_REPLACED_BY_NEWER = 13
+REASON_REPLACED_BY_LARGER = 14
+
+# operations.status_code：带文件操作的记录先以 STATUS_PENDING 写入，操作执行后更新
+STATUS_PENDING = 0
+STATUS_DONE = 1
+STATUS_FAILED = 2
+STATUS_SKIPPED = 3
+
+# 计划中跳过操作的简短原因（结果汇总中显示）
+SKIP_REASONS = {
+    REASON_TARGET_EXISTS: "目标文件已存在",
+    REASON_SOURCE_MISSING: "源文件不存在",
+}
+
+DETAIL_TEMPLATES = {
+    REASON_TARGET_EXISTS: "跳过重命名：目标文件 '{0}' 已存在",
+    REASON_SOURCE_MISSING: "跳过：源文件 '{0}' 已不存在",
+    REASON_SHORTCUT_RECYCLED: "删除了快捷方式文件 (已移至回收站)",
+    REASON_SHORTCUT_DELETED: "删除了快捷方式文件 (直接删除，不可撤销)",
+    REASON_SHORTCUT_DELETED_NO_RECYCLE_BIN: "删除了快捷方式文件 (回收站不可用，直接删除，不可撤销)",
+    REASON_RENAME_FAILED: "重命名文件失败: {0}",
+    REASON_DELETE_FAILED: "删除文件失败: {0}",
+    REASON_CLEANING_ERROR: "清理过程中发生错误: {0}",
+    REASON_OPERATION_FAILED: "执行操作时发生错误: {0}",
+    REASON_REPLACED_BY_NEWER: "与 '{0}' 重名，保留了较新的文件 (已移至回收站)",
+    REASON_REPLACED_BY_LARGER: "与 '{0}' 重名，保留了较大的文件 (已移至回收站)",
+}
+
+# 这些原因的参数都是移除的模式列表，显示时在模式之后附加说明
+PATTERN_REASONS = {
+    REASON_PATTERNS_REMOVED: "",
+    REASON_RENAMED_WITH_SUFFIX: "（目标文件已存在，添加了编号）",
+    REASON_TARGET_REPLACED: "（替换了同名文件）",
+}
+
+# 重命名的目标名称已被占用时的处理方式（配置项 collision_strategy）：
+# skip 跳过；suffix 改用 "名称 (2).扩展名" 这样的空闲名称；
+# keep_newer / keep_larger 保留修改时间较新 / 文件较大的一个，另一个移至回收站
+COLLISION_STRATEGIES = {
+    "skip": "跳过",
+    "suffix": "添加编号",
+    "keep_newer": "保留较新的文件",
+    "keep_larger": "保留较大的文件",
+}
+
+# 无法探测目录所在的文件系统是否区分大小写时（目录中没有含字母的名称）使用的默认值：
+# Windows 和 macOS 的默认文件系统不区分大小写
+CASE_INSENSITIVE_NAMES = sys.platform in ("win32", "darwin")
+
+def _folds_case(directory, names):
+    """探测 directory 所在的文件系统是否忽略文件名的大小写
+
+    取一个含字母的现有名称，lstat 大小写互换后的名称：存在且是同一个文件时即不区分大小写。
+    是否区分大小写由文件系统决定而不是平台，例如 Linux 上挂载的 vfat、exFAT、SMB 共享不区分，
+    macOS 上的 APFS 卷可以区分。
+    """
+    for name in names:
+        swapped = name.swapcase()
+        if swapped == name or swapped.swapcase() != name or swapped in names:
+            continue
+        try:
+            st = os.lstat(os.path.join(directory, name))
+        except OSError:
+            continue
+        try:
+            return os.path.samestat(st, os.lstat(os.path.join(directory, swapped)))
+        except OSError:
+            return False
+    return CASE_INSENSITIVE_NAMES
+
+def _same_file(path, other):
+    """两个路径是否指向同一个文件（不区分大小写的文件系统上只有大小写不同的两个路径）"""
+    try:
+        return os.path.samestat(os.lstat(path), os.lstat(other))
+    except OSError:
+        return False
+
+_LEGACY_DETAIL_PATTERNS = [
+    (REASON_PATTERNS_REMOVED, re.compile(r"从文件名中移除了 ('.*')")),
+] + [
+    (code, re.compile(re.escape(template).replace(re.escape("{0}"), "(.*)")))
+    for code, template in DETAIL_TEMPLATES.items()
+]
+
+def format_details(reason_code, detail_args, details=None, pattern=None):
+    """把编码后的详情还原为显示用的文本；没有编码的记录直接返回 details
+
+    只移除了一个模式的记录把模式保存在 patterns 表中（pattern），detail_args 为空。
+    """
+    if reason_code is None:
+        return details
+    args = json.loads(detail_args) if detail_args else []
+    if reason_code in PATTERN_REASONS:
+        if pattern is not None:
+            args = [pattern]
+        return "从文件名中移除了 " + "、".join(f"'{p}'" for p in args) + PATTERN_REASONS[reason_code]
+    return DETAIL_TEMPLATES[reason_code].format(*args)
+
+def _encode_args(args):
+    return json.dumps(args, ensure_ascii=False) if args else None
+
+def parse_details(details):
+    """把旧版本写入的详情文本转换为 (reason_code, detail_args)，无法识别时返回 None"""
+    for code, pattern in _LEGACY_DETAIL_PATTERNS:
+        match = pattern.fullmatch(details)
+        if not match:
+            continue
+        if code == REASON_PATTERNS_REMOVED:
+            args = re.findall(r"'([^']*)'", match.group(1))
+        else:
+            args = list(match.groups())
+        detail_args = _encode_args(args)
+        # 只有能原样还原的文本才转换
+        if format_details(code, detail_args) == details:
+            return code, detail_args
+    return None
+
+def _split_pattern(reason_code, args):
+    """只移除了一个模式时把模式单独取出（保存为 patterns 表的引用），返回 (detail_args, pattern)"""
+    if reason_code == REASON_PATTERNS_REMOVED and args and len(args) == 1:
+        return None, args[0]
+    return _encode_args(args), None
+
+def _subtree_range(path):
+    """返回 (path, 下界, 上界)：目录树中的路径满足 path 相等或落在 [下界, 上界) 内，可以使用主键索引"""
+    prefix = os.path.join(path, "")
+    return path, prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def _pattern_id(conn, cache, pattern):
+    """返回模式在 patterns 表中的 id，不存在时插入；cache 是调用方持有的 {模式: id} 字典"""
+    pattern_id = cache.get(pattern)
+    if pattern_id is None:
+        conn.execute("INSERT OR IGNORE INTO patterns (pattern) VALUES (?)", (pattern,))
+        pattern_id = conn.execute("SELECT id FROM patterns WHERE pattern = ?", (pattern,)).fetchone()[0]
+        cache[pattern] = pattern_id
+    return pattern_id
+
+class OperationRecord(namedtuple("OperationRecord", (
+        "id", "operation_type", "original_path", "new_path", "timestamp", "is_reverted", "session_id",
+        "details", "reason_code", "detail_args", "pattern", "reversible", "status_code"))):
+    """一条操作记录；details 只保存旧版本写入且无法转换的文本，显示时使用 describe()"""
+    __slots__ = ()
+    
+    def describe(self):
+        return format_details(self.reason_code, self.detail_args, self.details, self.pattern)
 
 class HistoryDatabase:
-    def __init__(self):
-        self.db_file = "cleaner_history.db"
+    # 数据库结构版本（保存在 PRAGMA user_version 中），每个迁移函数把版本号加一
+    MIGRATIONS = (
+        "_migrate_create_tables",
+        "_migrate_integer_timestamps",
+        "_migrate_add_indexes",
+        "_migrate_directory_state",
+        "_migrate_path_search",
+        "_migrate_path_index_trigger",
+        "_migrate_detail_codes",
+        "_migrate_operation_codes",
+        "_migrate_session_metrics",
+    )
+    # 查询操作记录时的列，顺序与 OperationRecord 的字段一致
+    OPERATION_COLUMNS = ", ".join(
+        "operations." + column for column in (
+            "id", "operation_type", "original_path", "new_path", "timestamp",
+            "is_reverted", "session_id", "details", "reason_code", "detail_args"
+        )
+    ) + (", (SELECT pattern FROM patterns WHERE patterns.id = operations.pattern_id)"
+         ", operations.reversible, operations.status_code")
+    ARCHIVE_FORMAT = "filecleaner-archive/2"
+    
+    def __init__(self, db_file="cleaner_history.db"):
+        self.db_file = db_file
         self.init_database()
     
+    def connect(self, synchronous="NORMAL"):
+        """打开数据库连接，并设置每个连接都需要的 pragma
+
+        WAL 模式下 NORMAL 同步级别在程序崩溃时不会丢失已提交的事务，同时避免每次提交都 fsync；
+        但断电或系统崩溃时可能丢失最后提交的几个事务。必须在文件操作之前落盘的记录使用 FULL。
+        sqlite3 在第一次打开数据库时才导入，不访问历史记录的启动路径不需要它。
+        """
+        import sqlite3
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -16000")
+        return conn
+    
     def init_database(self):
-        with sqlite3.connect(self.db_file) as conn:
-            # 使用字符串格式存储时间戳
-            def adapt_datetime(dt):
-                return dt.strftime("%Y-%m-%d %H:%M:%S")
-            
-            def convert_datetime(s):
-                return datetime.strptime(s.decode(), "%Y-%m-%d %H:%M:%S")
-            
-            sqlite3.register_adapter(datetime, adapt_datetime)
-            sqlite3.register_converter("timestamp", convert_datetime)
-            
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS operations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    operation_type TEXT NOT NULL,
-                    original_path TEXT NOT NULL,
-                    new_path TEXT,
-                    timestamp timestamp NOT NULL,
-                    is_reverted INTEGER DEFAULT 0,
-                    session_id TEXT,
-                    details TEXT
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS cleaning_sessions (
-                    session_id TEXT PRIMARY KEY,
-                    start_time timestamp NOT NULL,
-                    end_time timestamp,
-                    target_directory TEXT NOT NULL,
-                    files_renamed INTEGER DEFAULT 0,
-                    files_deleted INTEGER DEFAULT 0,
-                    status TEXT NOT NULL
+        with self.connect() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                # 只能在建表和切换 WAL 之前设置；之后删除记录释放的页面可以用 incremental_vacuum 归还给文件系统
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            # journal_mode 是持久化设置，写入数据库文件后对所有连接生效
+            conn.execute("PRAGMA journal_mode = WAL")
+            for target in range(version + 1, len(self.MIGRATIONS) + 1):
+                # 每个迁移在单独的事务中执行，失败时回滚并保持原版本号
+                conn.execute("BEGIN")
+                try:
+                    getattr(self, self.MIGRATIONS[target - 1])(conn)
+                    conn.execute(f"PRAGMA user_version = {target}")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            # SQLite 不支持 FTS5 或 trigram 分词器时没有全文索引，路径搜索退回 LIKE
+            self.has_path_index = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'operations_fts'"
+            ).fetchone() is not None
+    
+    def _migrate_create_tables(self, conn):
+        """版本 1：最初的表结构（时间戳以文本形式保存）"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS operations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                operation_type TEXT NOT NULL,
+                original_path TEXT NOT NULL,
+                new_path TEXT,
+                timestamp timestamp NOT NULL,
+                is_reverted INTEGER DEFAULT 0,
+                session_id TEXT,
+                details TEXT
+            )
+        ''')
+        
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cleaning_sessions (
+                session_id TEXT PRIMARY KEY,
+                start_time timestamp NOT NULL,
+                end_time timestamp,
+                target_directory TEXT NOT NULL,
+                files_renamed INTEGER DEFAULT 0,
+                files_deleted INTEGER DEFAULT 0,
+                status TEXT NOT NULL
+            )
+        ''')
+    
+    def _migrate_integer_timestamps(self, conn):
+        """版本 2：时间戳改为可排序的整数（Unix 时间，秒）
+
+        旧数据库中的 "%Y-%m-%d %H:%M:%S" 本地时间文本会被转换；SQLite 不支持修改列类型，因此重建表。
+        """
+        conn.execute('''
+            CREATE TABLE operations_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                operation_type TEXT NOT NULL,
+                original_path TEXT NOT NULL,
+                new_path TEXT,
+                timestamp INTEGER NOT NULL,
+                is_reverted INTEGER DEFAULT 0,
+                session_id TEXT,
+                details TEXT
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO operations_new
+            SELECT id, operation_type, original_path, new_path,
+                   COALESCE(CAST(strftime('%s', timestamp, 'utc') AS INTEGER), 0),
+                   is_reverted, session_id, details
+            FROM operations
+        ''')
+        conn.execute('DROP TABLE operations')
+        conn.execute('ALTER TABLE operations_new RENAME TO operations')
+        
+        conn.execute('''
+            CREATE TABLE cleaning_sessions_new (
+                session_id TEXT PRIMARY KEY,
+                start_time INTEGER NOT NULL,
+                end_time INTEGER,
+                target_directory TEXT NOT NULL,
+                files_renamed INTEGER DEFAULT 0,
+                files_deleted INTEGER DEFAULT 0,
+                status TEXT NOT NULL
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO cleaning_sessions_new
+            SELECT session_id,
+                   COALESCE(CAST(strftime('%s', start_time, 'utc') AS INTEGER), 0),
+                   CAST(strftime('%s', end_time, 'utc') AS INTEGER),
+                   target_directory, files_renamed, files_deleted, status
+            FROM cleaning_sessions
+        ''')
+        conn.execute('DROP TABLE cleaning_sessions')
+        conn.execute('ALTER TABLE cleaning_sessions_new RENAME TO cleaning_sessions')
+    
+    def _migrate_add_indexes(self, conn):
+        """版本 3：为历史记录列表、按会话撤销和按路径查找添加索引"""
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_operations_reverted_time ON operations (is_reverted, timestamp)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_operations_session ON operations (session_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_operations_original_path ON operations (original_path)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON cleaning_sessions (start_time)')
+    
+    def _migrate_directory_state(self, conn):
+        """版本 4：增量扫描使用的目录状态缓存"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS directory_state (
+                path TEXT PRIMARY KEY,
+                root TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                entry_count INTEGER NOT NULL,
+                subdirs TEXT NOT NULL,
+                rules_hash TEXT NOT NULL,
+                last_seen INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_directory_state_root ON directory_state (root, last_seen)')
+    
+    def _migrate_path_search(self, conn):
+        """版本 5：原路径和新路径的 FTS5 trigram 全文索引，用于按路径片段搜索历史记录
+
+        索引不保存路径本身（content='operations'），插入、删除和修改路径都由触发器同步。
+        触发器的写入比在写入方显式写入索引慢（合成数据上每条记录约 36 us，没有索引时约 6 us），
+        但不经过本程序写入的记录（例如旧版本程序写入的记录）也会进入索引；外部内容的 FTS5 索引中
+        缺少的记录被删除触发器删除时会损坏索引。
+        """
+        import sqlite3
+        try:
+            conn.execute('''
+                CREATE VIRTUAL TABLE operations_fts USING fts5(
+                    original_path, new_path,
+                    content='operations', content_rowid='id', tokenize='trigram'
                 )
             ''')
-            conn.commit()
+        except sqlite3.OperationalError as e:
+            print(f"当前 SQLite 不支持 FTS5 trigram 索引，路径搜索将使用 LIKE: {e}")
+            return
+        conn.execute('''
+            CREATE TRIGGER operations_fts_insert AFTER INSERT ON operations BEGIN
+                INSERT INTO operations_fts (rowid, original_path, new_path)
+                VALUES (new.id, new.original_path, new.new_path);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER operations_fts_delete AFTER DELETE ON operations BEGIN
+                INSERT INTO operations_fts (operations_fts, rowid, original_path, new_path)
+                VALUES ('delete', old.id, old.original_path, old.new_path);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER operations_fts_update AFTER UPDATE OF original_path, new_path ON operations BEGIN
+                INSERT INTO operations_fts (operations_fts, rowid, original_path, new_path)
+                VALUES ('delete', old.id, old.original_path, old.new_path);
+                INSERT INTO operations_fts (rowid, original_path, new_path)
+                VALUES (new.id, new.original_path, new.new_path);
+            END
+        ''')
+        conn.execute("INSERT INTO operations_fts (operations_fts) VALUES ('rebuild')")
+    
+    def _migrate_path_index_trigger(self, conn):
+        """版本 6：为没有插入触发器的路径索引补上触发器
+
+        开发期间有一版的版本 5 由写入方显式写入索引，没有插入触发器，只有这样的数据库需要补上触发器
+        并重建一次索引；由现在的版本 5 创建的索引已经有触发器，这里不做任何事，升级时索引只建立一次。
+        """
+        if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'operations_fts'"
+        ).fetchone() is None:
+            return
+        if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'operations_fts_insert'"
+        ).fetchone() is not None:
+            return
+        conn.execute('''
+            CREATE TRIGGER operations_fts_insert AFTER INSERT ON operations BEGIN
+                INSERT INTO operations_fts (rowid, original_path, new_path)
+                VALUES (new.id, new.original_path, new.new_path);
+            END
+        ''')
+        conn.execute("INSERT INTO operations_fts (operations_fts) VALUES ('rebuild')")
     
-    def add_operation(self, operation_type, original_path, new_path=None, session_id=None, details=None):
+    def _migrate_detail_codes(self, conn):
+        """版本 7：详情改为原因编码加参数（见 format_details），以及保存维护时间等状态的 meta 表
+
+        已有记录的详情文本由 compact_details 在历史记录维护时分批转换。
+        """
+        conn.execute('ALTER TABLE operations ADD COLUMN reason_code INTEGER')
+        conn.execute('ALTER TABLE operations ADD COLUMN detail_args TEXT')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+    
+    def _migrate_operation_codes(self, conn):
+        """版本 8：状态编码、模式引用和可撤销标记
+
+        撤销前是否可以恢复改为查询 reversible 列，不再在详情文本中查找"不可撤销"；
+        移除的模式保存在 patterns 表中，每条记录只保存它的 id。
+        """
+        conn.execute('ALTER TABLE operations ADD COLUMN status_code INTEGER')
+        conn.execute('ALTER TABLE operations ADD COLUMN pattern_id INTEGER')
+        conn.execute('ALTER TABLE operations ADD COLUMN reversible INTEGER NOT NULL DEFAULT 0')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS patterns (
+                id INTEGER PRIMARY KEY,
+                pattern TEXT UNIQUE NOT NULL
+            )
+        ''')
+        # 旧记录：重命名都可以撤销；直接删除的文件无法恢复（尚未转换编码的记录只能看详情文本）
+        conn.execute('''
+            UPDATE operations SET
+                reversible = CASE
+                    WHEN operation_type = 'rename' THEN 1
+                    WHEN operation_type = 'delete' AND reason_code IN (?, ?) THEN 0
+                    WHEN operation_type = 'delete' AND details LIKE '%不可撤销%' THEN 0
+                    WHEN operation_type = 'delete' THEN 1
+                    ELSE 0
+                END,
+                status_code = CASE operation_type
+                    WHEN 'skip' THEN ? WHEN 'error' THEN ? ELSE ?
+                END
+        ''', (REASON_SHORTCUT_DELETED, REASON_SHORTCUT_DELETED_NO_RECYCLE_BIN,
+              STATUS_SKIPPED, STATUS_FAILED, STATUS_DONE))
+        conn.execute('''
+            INSERT OR IGNORE INTO patterns (pattern)
+            SELECT DISTINCT json_extract(detail_args, '$[0]') FROM operations
+            WHERE reason_code = ? AND json_array_length(detail_args) = 1
+        ''', (REASON_PATTERNS_REMOVED,))
+        conn.execute('''
+            UPDATE operations SET
+                pattern_id = (SELECT id FROM patterns WHERE pattern = json_extract(operations.detail_args, '$[0]')),
+                detail_args = NULL
+            WHERE reason_code = ? AND json_array_length(detail_args) = 1
+        ''', (REASON_PATTERNS_REMOVED,))
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_operations_type_reversible ON operations (operation_type, reversible)')
+    
+    def _migrate_session_metrics(self, conn):
+        """版本 9：每个清理会话各阶段的耗时统计（见 PhaseTimer）"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS session_metrics (
+                session_id TEXT NOT NULL,
+                phase TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (session_id, phase)
+            ) WITHOUT ROWID
+        ''')
+    
+    def _operation_rows(self, rows):
+        """把查询结果转换为 OperationRecord"""
+        return [OperationRecord._make(row) for row in rows]
+    
+    def add_operation(self, operation_type, original_path, new_path=None, session_id=None,
+                      reason_code=None, detail_args=None, reversible=None):
+        """在清理会话之外单独记录一条操作；detail_args 是详情参数的列表"""
         try:
-            with sqlite3.connect(self.db_file) as conn:
-                cursor = conn.cursor()
-                # 将 datetime 对象转换为字符串
-                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                cursor.execute(
-                    '''INSERT INTO operations 
-                       (operation_type, original_path, new_path, timestamp, session_id, details) 
-                       VALUES (?, ?, ?, ?, ?, ?)''',
-                    (operation_type, str(original_path), str(new_path) if new_path else None, 
-                     current_time, session_id, details)
-                )
-                conn.commit()
+            writer = self.open_session_writer(session_id)
+            try:
+                writer.add_operation(operation_type, original_path, new_path, reason_code, detail_args,
+                                     reversible=reversible)
+            finally:
+                writer.close()
         except Exception as e:
             print(f"添加操作记录时生: {e}")
     
     def start_cleaning_session(self, directory):
         try:
-            session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-            with sqlite3.connect(self.db_file, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
+            session_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     '''INSERT INTO cleaning_sessions 
                        (session_id, start_time, target_directory, status) 
                        VALUES (?, ?, ?, ?)''',
-                    (session_id, datetime.now(), directory, "进行中")
+                    (session_id, int(time.time()), directory, "进行中")
                 )
                 conn.commit()
             return session_id
@@ -142,15 +885,15 @@ class HistoryDatabase:
             print(f"开始清理会话时发生错误: {e}")
             return None
     
-    def end_cleaning_session(self, session_id, files_renamed, files_deleted):
+    def end_cleaning_session(self, session_id, files_renamed, files_deleted, status="已完成"):
         try:
-            with sqlite3.connect(self.db_file, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     '''UPDATE cleaning_sessions 
                        SET end_time = ?, files_renamed = ?, files_deleted = ?, status = ? 
                        WHERE session_id = ?''',
-                    (datetime.now(), files_renamed, files_deleted, "已完成", session_id)
+                    (int(time.time()), files_renamed, files_deleted, status, session_id)
                 )
                 conn.commit()
         except Exception as e:
@@ -158,23 +901,190 @@ class HistoryDatabase:
     
     def get_recent_operations(self, limit=100):
         try:
-            with sqlite3.connect(self.db_file, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    '''SELECT * FROM operations 
+                    f'''SELECT {self.OPERATION_COLUMNS} FROM operations 
                        WHERE is_reverted = 0 
-                       ORDER BY timestamp DESC 
+                       ORDER BY timestamp DESC, id DESC 
                        LIMIT ?''',
                     (limit,)
                 )
-                return cursor.fetchall()
+                return self._operation_rows(cursor.fetchall())
         except Exception as e:
             print(f"获取最近操作记录时发生错误: {e}")
             return []
     
+    def count_operations(self):
+        """未撤销的操作记录总数，用于历史记录列表的滚动条"""
+        with self.connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM operations WHERE is_reverted = 0').fetchone()[0]
+    
+    def get_operations_page(self, limit=200, before=None, after=None, offset=None):
+        """按 (timestamp, id) 从新到旧分页读取未撤销的操作记录
+
+        before: (timestamp, id)，返回比它更早的 limit 条（向下翻页）。
+        after: (timestamp, id)，返回比它更新的 limit 条（向上翻页），结果仍按从新到旧排列。
+        offset: 两者都为空时从第 offset 条开始读取，只用于滚动条直接跳转到远处。
+        键集分页沿 (is_reverted, timestamp) 索引定位，耗时与翻到第几页无关。
+        """
+        with self.connect() as conn:
+            if before is not None:
+                rows = conn.execute(
+                    f'''SELECT {self.OPERATION_COLUMNS} FROM operations
+                       WHERE is_reverted = 0 AND (timestamp, id) < (?, ?)
+                       ORDER BY timestamp DESC, id DESC
+                       LIMIT ?''',
+                    (before[0], before[1], limit)
+                ).fetchall()
+            elif after is not None:
+                rows = conn.execute(
+                    f'''SELECT {self.OPERATION_COLUMNS} FROM operations
+                       WHERE is_reverted = 0 AND (timestamp, id) > (?, ?)
+                       ORDER BY timestamp ASC, id ASC
+                       LIMIT ?''',
+                    (after[0], after[1], limit)
+                ).fetchall()
+                rows.reverse()
+            else:
+                rows = conn.execute(
+                    f'''SELECT {self.OPERATION_COLUMNS} FROM operations
+                       WHERE is_reverted = 0
+                       ORDER BY timestamp DESC, id DESC
+                       LIMIT ? OFFSET ?''',
+                    (limit, offset or 0)
+                ).fetchall()
+        return self._operation_rows(rows)
+    
+    def _search_query(self, text, operation_type, session_id, since, until, reverted, reversible, reason_code):
+        """生成搜索条件；返回 (FROM 子句, 排序键, WHERE 条件列表, 参数列表)"""
+        conditions = []
+        params = []
+        if text and len(text) >= 3 and self.has_path_index:
+            # trigram 索引按子串匹配，整个搜索词作为一个短语
+            source = "operations_fts JOIN operations ON operations.id = operations_fts.rowid"
+            key = "operations_fts.rowid"
+            conditions.append("operations_fts MATCH ?")
+            params.append('"' + text.replace('"', '""') + '"')
+        else:
+            source = "operations"
+            key = "operations.id"
+            if text:
+                # 少于 3 个字符时 trigram 索引无法使用，按 id 倒序扫描直到凑够一页
+                pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                conditions.append("(original_path LIKE ? ESCAPE '\\' OR new_path LIKE ? ESCAPE '\\')")
+                params.extend((pattern, pattern))
+        if operation_type is not None:
+            conditions.append("operation_type = ?")
+            params.append(operation_type)
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(int(since.timestamp() if isinstance(since, datetime) else since))
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(int(until.timestamp() if isinstance(until, datetime) else until))
+        if reverted is not None:
+            conditions.append("is_reverted = ?")
+            params.append(1 if reverted else 0)
+        if reversible is not None:
+            conditions.append("reversible = ?")
+            params.append(1 if reversible else 0)
+        if reason_code is not None:
+            conditions.append("reason_code = ?")
+            params.append(reason_code)
+        return source, key, conditions, params
+    
+    def search_operations(self, text=None, operation_type=None, session_id=None, since=None, until=None,
+                          reverted=None, reversible=None, reason_code=None,
+                          limit=200, before=None, after=None, offset=None):
+        """按条件搜索操作记录，结果按 id 从新到旧排列
+
+        text: 原路径或新路径中包含的片段（不区分大小写），3 个字符以上时使用 FTS5 trigram 索引。
+        operation_type: "rename"、"delete" 等；session_id: 清理会话；
+        since / until: 时间范围 [since, until)，Unix 时间戳或 datetime；
+        reverted: True 只返回已撤销的记录，False 只返回未撤销的记录，None 不限。
+        reversible: False 只返回无法撤销的记录（例如直接删除的文件）；reason_code: REASON_* 原因编码。
+        before / after: 操作 id，用于键集分页（含义与 get_operations_page 相同）；offset 只用于直接跳转。
+        """
+        source, key, conditions, params = self._search_query(
+            text, operation_type, session_id, since, until, reverted, reversible, reason_code
+        )
+        order = "DESC"
+        if before is not None:
+            conditions.append(f"{key} < ?")
+            params.append(before)
+        elif after is not None:
+            conditions.append(f"{key} > ?")
+            params.append(after)
+            order = "ASC"
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.extend((limit, offset or 0))
+        with self.connect() as conn:
+            rows = conn.execute(
+                f"SELECT {self.OPERATION_COLUMNS} FROM {source} {where} ORDER BY {key} {order} LIMIT ? OFFSET ?",
+                params
+            ).fetchall()
+        if order == "ASC":
+            rows.reverse()
+        return self._operation_rows(rows)
+    
+    def count_search_results(self, text=None, operation_type=None, session_id=None, since=None, until=None,
+                             reverted=None, reversible=None, reason_code=None, cap=10000):
+        """统计搜索结果数量，最多数到 cap 条（常见片段的匹配数可能有数百万条）"""
+        source, _, conditions, params = self._search_query(
+            text, operation_type, session_id, since, until, reverted, reversible, reason_code
+        )
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.connect() as conn:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {source} {where} LIMIT ?)",
+                params + [cap]
+            ).fetchone()[0]
+    
+    def update_session_counts(self, session_id, files_renamed, files_deleted):
+        """更新仍在进行的会话（例如监视模式）的统计"""
+        with self.connect() as conn:
+            conn.execute(
+                'UPDATE cleaning_sessions SET files_renamed = ?, files_deleted = ? WHERE session_id = ?',
+                (files_renamed, files_deleted, session_id)
+            )
+    
+    def save_session_metrics(self, session_id, metrics):
+        """保存会话的阶段耗时统计（PhaseTimer.summary() 的格式），覆盖同名阶段之前的值"""
+        try:
+            with self.connect() as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO session_metrics (session_id, phase, seconds, count) VALUES (?, ?, ?, ?)',
+                    [(session_id, phase, item["seconds"], item["count"]) for phase, item in metrics.items()]
+                )
+        except Exception as e:
+            print(f"保存会话耗时统计时发生错误: {e}")
+    
+    def get_session_metrics(self, session_id):
+        """返回会话的阶段耗时统计 {阶段: {"seconds": 秒, "count": 次数}}，没有统计时返回空字典"""
+        with self.connect() as conn:
+            return {
+                phase: {"seconds": seconds, "count": count}
+                for phase, seconds, count in conn.execute(
+                    'SELECT phase, seconds, count FROM session_metrics WHERE session_id = ?', (session_id,)
+                )
+            }
+    
+    def estimate_entry_count(self, path):
+        """根据目录状态缓存估算目录树中的条目数，没有缓存时返回 None"""
+        with self.connect() as conn:
+            return conn.execute(
+                '''SELECT SUM(entry_count) FROM directory_state
+                   WHERE path = ? OR (path >= ? AND path < ?)''',
+                _subtree_range(os.path.abspath(path))
+            ).fetchone()[0]
+    
     def get_cleaning_sessions(self, limit=50):
         """获取清理会话历史"""
-        with sqlite3.connect(self.db_file) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM cleaning_sessions
@@ -183,9 +1093,239 @@ class HistoryDatabase:
             ''', (limit,))
             return cursor.fetchall()
     
+    def open_session_writer(self, session_id, batch_size=500, flush_interval=2.0, executor=None, metrics=None):
+        """为一次清理会话创建批量写入器，调用方负责在结束时 close()
+
+        metrics: 可选的 PhaseTimer，累计写入数据库和执行文件操作的耗时。
+        写入器的连接使用 synchronous = FULL：撤销依赖先于文件操作提交的待执行记录，
+        这些记录在断电或系统崩溃后也必须存在。每批只提交一次，额外的 fsync 开销按批分摊。
+        """
+        return HistorySessionWriter(self.connect(synchronous="FULL"), session_id, batch_size, flush_interval,
+                                    executor, metrics)
+    
+    def open_directory_cache(self, root, rules_hash, use_cache=True, max_age_days=90, scope=None, recursive=True):
+        """为一次扫描打开目录状态缓存，调用方负责在结束时 close()
+
+        scope / recursive: 本次实际扫描的目录（默认为 root）以及是否包含其子目录。
+        """
+        self.evict_directory_cache(max_age_days)
+        return DirectoryStateCache(self.connect(), root, rules_hash, use_cache, scope=scope, recursive=recursive)
+    
+    def evict_directory_cache(self, max_age_days=90):
+        """清除已不存在的扫描根目录，以及超过 max_age_days 天没有扫描到的目录的缓存"""
+        try:
+            with self.connect() as conn:
+                roots = [row[0] for row in conn.execute('SELECT DISTINCT root FROM directory_state')]
+                missing = [(root,) for root in roots if not os.path.isdir(root)]
+                if missing:
+                    conn.executemany('DELETE FROM directory_state WHERE root = ?', missing)
+                cutoff = int(time.time()) - int(max_age_days * 86400)
+                conn.execute('DELETE FROM directory_state WHERE last_seen < ?', (cutoff,))
+                conn.commit()
+        except Exception as e:
+            print(f"清理目录缓存时发生错误: {e}")
+    
+    def clear_directory_cache(self, root=None):
+        """删除某个目录树（或全部）的目录状态缓存，返回删除的目录数；root 可以是扫描根目录中的子目录"""
+        with self.connect() as conn:
+            if root is None:
+                cursor = conn.execute('DELETE FROM directory_state')
+            else:
+                cursor = conn.execute(
+                    'DELETE FROM directory_state WHERE path = ? OR (path >= ? AND path < ?)',
+                    _subtree_range(os.path.abspath(root))
+                )
+            conn.commit()
+        return cursor.rowcount
+    
+    def compact_details(self, chunk_size=5000):
+        """把旧记录中的详情文本转换为原因编码和参数，返回转换的记录数
+
+        按 id 分块处理，每块一个事务，不会长时间阻塞正在进行的清理。
+        """
+        compacted = 0
+        last_id = 0
+        pattern_ids = {}
+        with self.connect() as conn:
+            while True:
+                rows = conn.execute(
+                    '''SELECT id, details FROM operations
+                       WHERE id > ? AND reason_code IS NULL AND details IS NOT NULL
+                       ORDER BY id LIMIT ?''',
+                    (last_id, chunk_size)
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                with conn:
+                    updates = []
+                    for op_id, details in rows:
+                        parsed = parse_details(details)
+                        if not parsed:
+                            continue
+                        code, detail_args = parsed
+                        detail_args, pattern = _split_pattern(code, json.loads(detail_args) if detail_args else None)
+                        pattern_id = _pattern_id(conn, pattern_ids, pattern) if pattern is not None else None
+                        updates.append((code, detail_args, pattern_id, op_id))
+                    conn.executemany(
+                        '''UPDATE operations SET reason_code = ?, detail_args = ?, pattern_id = ?, details = NULL
+                           WHERE id = ?''',
+                        updates
+                    )
+                compacted += len(updates)
+        return compacted
+    
+    def apply_retention(self, max_age_days=None, max_sessions=None, type_max_age_days=None, archive_dir=None):
+        """按保留策略清理历史记录，返回各项清理的数量
+
+        max_age_days: 开始时间早于这么多天的会话（以及同样旧的无会话记录）被归档后删除。
+        max_sessions: 只保留最近的这么多个会话，更早的会话被归档后删除。
+        type_max_age_days: {操作类型: 天数}，例如 {"skip": 30}，超过天数的这类记录直接删除，不归档。
+        archive_dir: 归档目录，每个会话保存为一个 .jsonl.gz 文件；为空时不归档直接删除。
+        取值为空或 0 的策略不生效。没有结束时间的会话（仍在进行，例如很早开始的监视会话，
+        或程序异常退出而没有结束的会话）不会被归档或删除，但计入 max_sessions 的数量。
+        """
+        now = int(time.time())
+        summary = {"dropped_operations": 0, "archived_sessions": 0, "archived_operations": 0}
+        with self.connect() as conn:
+            for operation_type, days in (type_max_age_days or {}).items():
+                if not days:
+                    continue
+                with conn:
+                    cursor = conn.execute(
+                        'DELETE FROM operations WHERE operation_type = ? AND timestamp < ?',
+                        (operation_type, now - int(days * 86400))
+                    )
+                summary["dropped_operations"] += cursor.rowcount
+            
+            expired = set()
+            if max_age_days:
+                cutoff = now - int(max_age_days * 86400)
+                expired.update(row[0] for row in conn.execute(
+                    'SELECT session_id FROM cleaning_sessions WHERE start_time < ?', (cutoff,)
+                ))
+            if max_sessions:
+                expired.update(row[0] for row in conn.execute(
+                    '''SELECT session_id FROM cleaning_sessions
+                       ORDER BY start_time DESC LIMIT -1 OFFSET ?''',
+                    (int(max_sessions),)
+                ))
+            expired.difference_update(row[0] for row in conn.execute(
+                'SELECT session_id FROM cleaning_sessions WHERE end_time IS NULL'
+            ))
+            
+            for (session_id,) in conn.execute(
+                'SELECT session_id FROM cleaning_sessions ORDER BY start_time'
+            ).fetchall():
+                if session_id not in expired:
+                    continue
+                session = conn.execute(
+                    'SELECT * FROM cleaning_sessions WHERE session_id = ?', (session_id,)
+                ).fetchone()
+                if archive_dir:
+                    self._archive_operations(
+                        conn,
+                        os.path.join(archive_dir, f"{session_id}.jsonl.gz"),
+                        dict(zip(("session_id", "start_time", "end_time", "target_directory",
+                                  "files_renamed", "files_deleted", "status"), session)),
+                        'operations.session_id = ?',
+                        (session_id,)
+                    )
+                with conn:
+                    cursor = conn.execute('DELETE FROM operations WHERE session_id = ?', (session_id,))
+                    conn.execute('DELETE FROM cleaning_sessions WHERE session_id = ?', (session_id,))
+                    conn.execute('DELETE FROM session_metrics WHERE session_id = ?', (session_id,))
+                summary["archived_sessions"] += 1
+                summary["archived_operations"] += cursor.rowcount
+            
+            if max_age_days:
+                # 不属于任何会话的记录（单独写入的记录）按时间归档
+                cutoff = now - int(max_age_days * 86400)
+                condition = 'operations.session_id IS NULL AND operations.timestamp < ?'
+                if conn.execute(f'SELECT 1 FROM operations WHERE {condition} LIMIT 1', (cutoff,)).fetchone():
+                    if archive_dir:
+                        self._archive_operations(
+                            conn,
+                            os.path.join(archive_dir, f"unsessioned_{datetime.now():%Y%m%d_%H%M%S}.jsonl.gz"),
+                            None,
+                            condition,
+                            (cutoff,)
+                        )
+                    with conn:
+                        cursor = conn.execute(f'DELETE FROM operations WHERE {condition}', (cutoff,))
+                    summary["archived_operations"] += cursor.rowcount
+        return summary
+    
+    def _archive_operations(self, conn, file_path, session, condition, params):
+        """把符合条件的操作记录写入 gzip 压缩的 JSON Lines 文件
+
+        第一行是 {"format", "session"}，之后每行一条记录：OperationRecord 的各字段，details 为还原后的文本，
+        归档文件脱离数据库和 patterns 表也能阅读。
+        先写入临时文件再改名，写入完成之前不会删除数据库中的记录。
+        """
+        import gzip
+        
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        temp_path = file_path + ".tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"format": self.ARCHIVE_FORMAT, "session": session}, ensure_ascii=False) + "\n")
+            cursor = conn.execute(
+                f'SELECT {self.OPERATION_COLUMNS} FROM operations WHERE {condition} ORDER BY id', params
+            )
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for record in self._operation_rows(rows):
+                    data = record._asdict()
+                    data["details"] = record.describe()
+                    f.write(json.dumps(data, ensure_ascii=False) + "\n")
+        os.replace(temp_path, file_path)
+    
+    def vacuum(self):
+        """把空闲页面归还给文件系统，返回释放的页数
+
+        新数据库使用 auto_vacuum = INCREMENTAL，只需执行 incremental_vacuum；
+        旧数据库第一次执行时切换模式，需要做一次完整的 VACUUM。
+        """
+        with self.connect() as conn:
+            free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            else:
+                # 每执行一步只释放一个页面，用 executescript 一次执行到底
+                conn.executescript("PRAGMA incremental_vacuum")
+            free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # 截断 WAL 文件，否则删除大量记录后 -wal 文件仍然很大
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA optimize")
+        return free_before - free_after
+    
+    def get_meta(self, key, default=None):
+        with self.connect() as conn:
+            row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+    
+    def set_meta(self, key, value):
+        with self.connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+    
+    def run_maintenance(self, max_age_days=None, max_sessions=None, type_max_age_days=None, archive_dir=None):
+        """历史记录维护：保留策略、详情压缩和空间回收，返回汇总"""
+        summary = self.apply_retention(max_age_days, max_sessions, type_max_age_days, archive_dir)
+        if self.has_path_index and (summary["dropped_operations"] or summary["archived_operations"]):
+            # 删除记录只会在全文索引中追加删除标记，合并索引段之后空间才能回收
+            with self.connect() as conn:
+                conn.execute("INSERT INTO operations_fts (operations_fts) VALUES ('optimize')")
+        summary["compacted"] = self.compact_details()
+        summary["freed_pages"] = self.vacuum()
+        self.set_meta("last_maintenance", int(time.time()))
+        return summary
+    
     def mark_as_reverted(self, operation_id):
         """标记操作为已撤销"""
-        with sqlite3.connect(self.db_file) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'UPDATE operations SET is_reverted = 1 WHERE id = ?',
@@ -193,158 +1333,2199 @@ class HistoryDatabase:
             )
             conn.commit()
 
-class FileCleaner:
-    def __init__(self):
-        self.config = FileCleanerConfig()
-        self.history_db = HistoryDatabase()
+    def mark_many_as_reverted(self, operation_ids):
+        """在一个事务中把多条操作标记为已撤销"""
+        with self.connect() as conn:
+            conn.executemany(
+                'UPDATE operations SET is_reverted = 1 WHERE id = ?',
+                ((op_id,) for op_id in operation_ids)
+            )
     
-    def clean_directory(self, directory):
-        results = {"renamed": [], "deleted": [], "skipped": []}
-        session_id = self.history_db.start_cleaning_session(directory)
+    def get_session_operations(self, session_id):
+        """一次查询取出会话中尚未撤销的重命名和删除记录，按执行顺序排列"""
+        with self.connect() as conn:
+            return self._operation_rows(conn.execute(
+                f'''SELECT {self.OPERATION_COLUMNS} FROM operations
+                   WHERE session_id = ? AND is_reverted = 0
+                     AND operation_type IN ('rename', 'delete')
+                   ORDER BY id''',
+                (session_id,)
+            ).fetchall())
+    
+    def set_session_status(self, session_id, status):
+        with self.connect() as conn:
+            conn.execute(
+                'UPDATE cleaning_sessions SET status = ? WHERE session_id = ?',
+                (status, session_id)
+            )
+
+class HistorySessionWriter:
+    """清理会话期间使用的批量历史记录写入器
+
+    整个会话只使用一个数据库连接。操作记录先缓存在内存中，累计 batch_size 条
+    或距上次提交超过 flush_interval 秒时，用 executemany 在一个事务中写入。
+
+    会修改磁盘的操作（重命名、删除）以回调的形式随记录一起登记，回调只在对应记录
+    提交之后才执行（先写日志再改磁盘），因此任何已经发生的重命名都能在历史记录中
+    找到撤销信息。这些记录以 STATUS_PENDING 写入，执行后改为 STATUS_DONE；回调返回
+    (operation_type, status_code, reason_code, detail_args, reversible) 时用它更新该条记录。
+    """
+
+    def __init__(self, conn, session_id, batch_size=500, flush_interval=2.0, executor=None, metrics=None):
+        self.conn = conn
+        self.session_id = session_id
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        # 执行文件操作的引擎；数据库始终只由当前线程写入
+        self.executor = executor or OperationExecutor()
+        self.metrics = metrics if metrics is not None else PhaseTimer()
+        self._pending = []
+        self._pattern_ids = {}
+        self._last_flush = time.monotonic()
+    
+    def add_operation(self, operation_type, original_path, new_path=None, reason_code=None, detail_args=None,
+                      action=None, shard=None, reversible=None):
+        """登记一条操作记录
+
+        reason_code / detail_args: 详情的原因编码（REASON_*）和参数列表，显示时由 format_details 拼成文本。
+        reversible: 默认重命名和删除可以撤销；删除时回收站不可用会由回调的返回值改为不可撤销。
+        shard: 文件操作的分片键（通常是所在目录），同一分片内的操作按登记顺序执行。
+        """
+        if reversible is None:
+            reversible = operation_type in ("rename", "delete")
+        if action is not None:
+            status_code = STATUS_PENDING
+        else:
+            status_code = {"skip": STATUS_SKIPPED, "error": STATUS_FAILED}.get(operation_type, STATUS_DONE)
+        detail_args, pattern = _split_pattern(reason_code, detail_args)
+        row = (operation_type, str(original_path), str(new_path) if new_path else None,
+               int(time.time()), self.session_id, reason_code, detail_args, pattern,
+               1 if reversible else 0, status_code)
+        self._pending.append((row, action, shard))
+        if (len(self._pending) >= self.batch_size or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+    
+    def flush(self):
+        """提交缓存的记录，然后依次执行这些记录对应的文件操作"""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        first_id, last_id = self.insert_rows([row for row, _, _ in pending])
         
-        try:
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    file_path = Path(root) / file
-                    
-                    # 处理视频文件重命名
-                    if any(file.lower().endswith(ext) for ext in self.config.config["target_extensions"]):
-                        for pattern in self.config.config["remove_patterns"]:
-                            if pattern in file:
-                                new_name = file.replace(pattern, "")
-                                new_path = file_path.parent / new_name
-                                
-                                # 检查目标文件是否已存在
-                                if new_path.exists():
-                                    results["skipped"].append((file, new_name, "目标文件已存在"))
-                                    self.history_db.add_operation(
-                                        "skip",
-                                        file_path,
-                                        new_path,
-                                        session_id,
-                                        f"跳过重命名：目标文件 '{new_name}' 已存在"
-                                    )
-                                    continue
-                                
-                                file_path.rename(new_path)
-                                results["renamed"].append((file, new_name))
-                                self.history_db.add_operation(
-                                    "rename",
-                                    file_path,
-                                    new_path,
-                                    session_id,
-                                    f"从文件名中移除了 '{pattern}'"
-                                )
-                    
-                    # 删除快捷方式文件
-                    if any(file.lower().endswith(ext) for ext in self.config.config["cleanup_extensions"]):
-                        try:
-                            # 尝试使用回收站删除
-                            try:
-                                winshell.delete_file(str(file_path))
-                                results["deleted"].append(file)
-                                self.history_db.add_operation(
-                                    "delete",
-                                    file_path,
-                                    None,
-                                    session_id,
-                                    f"删除了快捷方式文件 (已移至回收站)"
-                                )
-                            except ImportError:
-                                file_path.unlink()
-                                results["deleted"].append(file)
-                                self.history_db.add_operation(
-                                    "delete",
-                                    file_path,
-                                    None,
-                                    session_id,
-                                    f"删除了快捷方式文件 (直接删除，不可撤销)"
-                                )
-                            except Exception as e:
-                                print(f"删除文件到回收站失败: {e}")
-                                file_path.unlink()
-                                results["deleted"].append(file)
-                                self.history_db.add_operation(
-                                    "delete",
-                                    file_path,
-                                    None,
-                                    session_id,
-                                    f"删除了快捷方式文件 (回收站不可用，直接删除，不可撤销)"
-                                )
-                        except Exception as e:
-                            print(f"删除文件失败: {e}")
-                            self.history_db.add_operation(
-                                "error",
-                                file_path,
-                                None,
-                                session_id,
-                                f"删除文件失败: {str(e)}"
-                            )
-                    
-                if not self.config.config["scan_subdirectories"]:
-                    break
-            
-            self.history_db.end_cleaning_session(
-                session_id,
-                len(results["renamed"]),
-                len(results["deleted"])
+        tasks = [(first_id + offset, shard, action)
+                 for offset, (_, action, shard) in enumerate(pending) if action is not None]
+        if not tasks:
+            return
+        outcomes = self.executor.run([(shard, action) for _, shard, action in tasks])
+        updates = []
+        for (op_id, _, _), outcome in zip(tasks, outcomes):
+            if outcome:
+                operation_type, status_code, reason_code, detail_args, reversible = outcome
+                updates.append((operation_type, status_code, reason_code, _encode_args(detail_args),
+                                1 if reversible else 0, op_id))
+        self.apply_outcomes(updates, first_id, last_id)
+    
+    def insert_rows(self, rows):
+        """在一个事务中插入 add_operation 生成的记录，返回 (第一条 id, 最后一条 id)"""
+        with self.metrics.measure("history", len(rows)), self.conn:
+            encoded = []
+            for row in rows:
+                pattern = row[7]
+                if pattern is not None:
+                    row = row[:7] + (_pattern_id(self.conn, self._pattern_ids, pattern),) + row[8:]
+                encoded.append(row)
+            self.conn.executemany(
+                '''INSERT INTO operations 
+                   (operation_type, original_path, new_path, timestamp, session_id,
+                    reason_code, detail_args, pattern_id, reversible, status_code) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                encoded
             )
-        except Exception as e:
-            self.history_db.add_operation(
-                "error",
-                directory,
-                None,
-                session_id,
-                f"清理过程中发生错误: {str(e)}"
+            # 同一事务内由单个连接插入，AUTOINCREMENT 分配的 id 是连续的
+            last_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return last_id - len(rows) + 1, last_id
+    
+    def apply_outcomes(self, updates, first_id, last_id):
+        """写入文件操作的结果：updates 中的记录按回调返回值更新，其余待执行的记录标记为已完成"""
+        with self.metrics.measure("history", 0), self.conn:
+            if updates:
+                self.conn.executemany(
+                    '''UPDATE operations
+                       SET operation_type = ?, status_code = ?, reason_code = ?, detail_args = ?,
+                           pattern_id = NULL, reversible = ?
+                       WHERE id = ?''',
+                    updates
+                )
+            # 其余执行成功的记录一次更新
+            self.conn.execute(
+                'UPDATE operations SET status_code = ? WHERE id BETWEEN ? AND ? AND status_code = ?',
+                (STATUS_DONE, first_id, last_id, STATUS_PENDING)
             )
-            raise e
-        
-        return results
     
-    def revert_operation(self, operation):
-        op_id, op_type, original_path, new_path, _, is_reverted, _, details = operation
-        
-        if is_reverted:
-            return False
-        
+    def discard_pending(self):
+        """丢弃尚未提交的记录及其文件操作（用于取消清理）"""
+        self._pending = []
+    
+    def close(self):
         try:
-            if op_type == "rename":
-                new_path = Path(new_path)
-                original_path = Path(original_path)
-                if new_path.exists():
-                    new_path.rename(original_path)
-                    self.history_db.mark_as_reverted(op_id)
-                    return True
-            elif op_type == "delete":
-                # 检查操作详情是否包"不可撤销"标记
-                if "不可撤销" in details:
-                    self.history_db.mark_as_reverted(op_id)
-                    return False
-                
-                # 尝试从回收站恢复文件
-                original_path = Path(original_path)
+            self.flush()
+        finally:
+            self.conn.close()
+
+class QueueSessionWriter(HistorySessionWriter):
+    """多进程清理时工作进程使用的写入器
+
+    记录通过 requests 队列发送给父进程，由父进程中唯一的 HistorySessionWriter 写入数据库；
+    插入记录要等父进程在 replies 队列中返回 id 之后才执行文件操作，仍然是先写日志再改磁盘。
+    """
+
+    def __init__(self, requests, replies, worker_id, session_id, batch_size=500, flush_interval=2.0, executor=None,
+                 metrics=None, abort=None):
+        super().__init__(None, session_id, batch_size, flush_interval, executor, metrics)
+        self.requests = requests
+        self.replies = replies
+        self.worker_id = worker_id
+        # 父进程出错退出时设置，此后不会再有回复，等待中的插入请求直接失败
+        self.abort = abort
+    
+    def insert_rows(self, rows):
+        if self.abort is not None and self.abort.is_set():
+            raise RuntimeError("清理已中止，不再写入历史记录")
+        self.requests.put(("insert", self.worker_id, rows))
+        while True:
+            try:
+                reply = self.replies.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if self.abort is not None and self.abort.is_set():
+                    raise RuntimeError("清理已中止，不再写入历史记录")
+        if reply[0] == "error":
+            raise RuntimeError(f"写入历史记录失败: {reply[1]}")
+        return reply[1], reply[2]
+    
+    def apply_outcomes(self, updates, first_id, last_id):
+        self.requests.put(("outcomes", updates, first_id, last_id))
+    
+    def close(self):
+        self.flush()
+
+class BulkAction(namedtuple("BulkAction", ("handler", "item"))):
+    """可以合并执行的文件操作：一次 run() 中 handler 相同的操作只调用一次 handler(items)，
+    它返回与 items 一一对应的回调结果（与普通回调的返回值相同）"""
+    __slots__ = ()
+
+class OperationExecutor:
+    """执行文件操作回调的引擎
+
+    操作按分片键（所在目录）分组：同一目录内的操作在同一个任务中按原顺序执行，
+    冲突检查依赖这个顺序；不同目录的分组在有界线程池中并行执行。网络文件系统上
+    每次 rename/unlink 主要耗在往返延迟上，并行执行可以明显提高吞吐量。
+    BulkAction 不分片，按 handler 合并后在其他操作之前执行。
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max(1, int(max_workers))
+        self._pool = None
+        if self.max_workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+    
+    def run(self, tasks):
+        """执行 [(shard, action), ...]，返回与 tasks 一一对应的回调结果"""
+        outcomes = [None] * len(tasks)
+        
+        def run_shard(items):
+            for index, action in items:
                 try:
-                    # 尝试访问回收站
-                    recycle_bin = winshell.recycle_bin()
-                    # 取过去24小时内删除的文件
-                    recent_time = datetime.now() - timedelta(days=1)
-                    
-                    for item in recycle_bin:
-                        if (item.original_filename() == str(original_path) and 
-                            item.recycle_date() > recent_time):
-                            try:
-                                item.undelete()  # 恢复文件
-                                self.history_db.mark_as_reverted(op_id)
-                                return True
-                            except Exception as e:
-                                print(f"从回收站恢复文件失败: {e}")
-                                break
-                    
-                    # 如果没有找到文件或恢复失败
-                    print("在回收站中未找到文件或恢复失败")
-                    self.history_db.mark_as_reverted(op_id)
+                    outcomes[index] = action()
+                except Exception as e:
+                    outcomes[index] = ("error", STATUS_FAILED, REASON_OPERATION_FAILED, [str(e)], False)
+        
+        shards = {}
+        bulk = {}
+        for index, (shard, action) in enumerate(tasks):
+            if isinstance(action, BulkAction):
+                bulk.setdefault(action.handler, []).append((index, action.item))
+            else:
+                shards.setdefault(shard, []).append((index, action))
+        
+        # 合并的操作（批量删除）先执行：删除不依赖同一批中的其他操作，先删除还能腾出同名的目标名称
+        for handler, items in bulk.items():
+            try:
+                for (index, _), outcome in zip(items, handler([item for _, item in items])):
+                    outcomes[index] = outcome
+            except Exception as e:
+                for index, _ in items:
+                    outcomes[index] = ("error", STATUS_FAILED, REASON_OPERATION_FAILED, [str(e)], False)
+        
+        if self._pool is None or len(shards) <= 1:
+            for items in shards.values():
+                run_shard(items)
+        else:
+            for future in [self._pool.submit(run_shard, items) for items in shards.values()]:
+                future.result()
+        return outcomes
+    
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+class LocalFileOperations:
+    """清理时使用的文件系统操作；基准测试可以替换为模拟网络延迟的实现"""
+    
+    def __init__(self, trash=None):
+        self.trash = trash or default_trash_backend()
+    
+    def rename(self, src, dst):
+        """重命名，目标已存在时抛出 FileExistsError，不会覆盖"""
+        _rename_noreplace(src, dst)
+    
+    def unlink(self, path):
+        os.unlink(path)
+    
+    def recycle(self, path):
+        """移至回收站；系统不支持时抛出 ImportError"""
+        self.trash.recycle(path)
+    
+    def recycle_many(self, paths):
+        """批量移至回收站，返回与 paths 一一对应的结果：None 表示成功，否则是该文件的异常；
+        系统不支持时抛出 ImportError"""
+        recycle_many = getattr(self.trash, "recycle_many", None)
+        if recycle_many is None:
+            return _recycle_each(self.trash.recycle, paths)
+        return recycle_many(paths)
+
+# renameat2 的参数：相对当前目录解析路径；目标已存在时失败而不是覆盖
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+@lru_cache(maxsize=None)
+def _libc_renameat2():
+    """返回 libc 中的 renameat2（Linux，glibc 2.28 以上），不可用时返回 None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+    import ctypes.util
+    try:
+        renameat2 = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+    renameat2.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint)
+    return renameat2
+
+def _rename_noreplace(src, dst):
+    """重命名 src，dst 已存在时抛出 FileExistsError（POSIX 上 os.rename 会直接覆盖已有的文件）
+
+    Windows 上 os.rename 本身不覆盖；Linux 使用 renameat2(RENAME_NOREPLACE)，检查和重命名在同一个系统调用中完成。
+    文件系统不支持时（例如 vfat、部分网络文件系统）退回硬链接加删除原名，不支持硬链接时最后退回先检查再重命名。
+    不区分大小写的文件系统上只改变大小写时，目标就是源文件本身，直接重命名。
+    """
+    if sys.platform == "win32" or _same_file(src, dst):
+        os.rename(src, dst)
+        return
+    renameat2 = _libc_renameat2()
+    if renameat2 is not None:
+        import ctypes
+        
+        if renameat2(AT_FDCWD, os.fsencode(src), AT_FDCWD, os.fsencode(dst), RENAME_NOREPLACE) == 0:
+            return
+        code = ctypes.get_errno()
+        if code not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            raise OSError(code, os.strerror(code), src, None, dst)
+    try:
+        os.link(src, dst, follow_symlinks=False)
+    except FileExistsError:
+        raise
+    except OSError:
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(src, dst)
+        return
+    try:
+        os.unlink(src)
+    except OSError:
+        os.unlink(dst)
+        raise
+
+def _recycle_each(recycle, paths):
+    """逐个调用 recycle，返回与 paths 一一对应的结果（None 或异常）；ImportError 直接抛出"""
+    errors = []
+    for path in paths:
+        try:
+            recycle(path)
+        except ImportError:
+            raise
+        except Exception as e:
+            errors.append(e)
+        else:
+            errors.append(None)
+    return errors
+
+def default_trash_backend():
+    """Windows 使用 winshell 操作回收站，macOS 不支持回收站，其他系统使用 freedesktop 规范的 ~/.local/share/Trash"""
+    if sys.platform == "win32":
+        return WinshellTrash()
+    if sys.platform == "darwin":
+        return UnsupportedTrash("macOS 的回收站暂不支持")
+    return FreedesktopTrash()
+
+def _local_naive_datetime(value):
+    """把回收站返回的时间统一转换为不带时区的本地时间"""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return datetime(value.year, value.month, value.day, value.hour, value.minute, value.second)
+
+class WinshellTrash:
+    """Windows 回收站（需要 winshell）
+
+    items() 产出 (原路径, 删除时间, 回收站项目)，restore() 接收其中的回收站项目。
+    """
+    
+    def recycle(self, path):
+        import winshell
+        winshell.delete_file(str(path))
+    
+    def recycle_many(self, paths):
+        """用一次多文件的 Shell 操作把 paths 移至回收站，返回与 paths 一一对应的结果（None 或异常）"""
+        import winshell
+        paths = [str(path) for path in paths]
+        try:
+            winshell.delete_file(paths)
+        except Exception:
+            # 整批操作失败时逐个重试，得到每个文件各自的错误
+            return _recycle_each(self.recycle, paths)
+        # Shell 操作不返回单个文件的结果，仍然存在的文件视为失败
+        return [OSError(f"未能移至回收站: {path}") if os.path.lexists(path) else None for path in paths]
+    
+    def items(self):
+        import winshell
+        for item in winshell.recycle_bin():
+            yield item.original_filename(), _local_naive_datetime(item.recycle_date()), item
+    
+    def restore(self, handle, original_path):
+        handle.undelete()
+
+class UnsupportedTrash:
+    """没有可用回收站的系统：所有操作抛出 ImportError，与缺少 winshell 时一样按不支持回收站处理
+    （快捷方式直接删除并记录为不可撤销，重名时被替换的文件保留）
+
+    macOS 的回收站是 ~/.Trash，Finder 只能"放回"由它自己记录了原位置的文件；
+    freedesktop 的 ~/.local/share/Trash 在 Finder 中既看不到也无法恢复，所以不在 macOS 上使用。
+    """
+    
+    def __init__(self, reason):
+        self.reason = reason
+    
+    def recycle(self, path):
+        raise ImportError(self.reason)
+    
+    def recycle_many(self, paths):
+        raise ImportError(self.reason)
+    
+    def items(self):
+        raise ImportError(self.reason)
+    
+    def restore(self, handle, original_path):
+        raise ImportError(self.reason)
+
+class FreedesktopTrash:
+    """freedesktop.org 回收站规范的主目录回收站（Linux 桌面环境共用）
+
+    files/ 下保存被删除的文件，info/ 下同名的 .trashinfo 记录原路径和删除时间。
+    restore() 接收的是 files/ 中的文件名。
+    """
+    
+    def __init__(self, trash_dir=None):
+        if trash_dir is None:
+            data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+            trash_dir = os.path.join(data_home, "Trash")
+        self.trash_dir = trash_dir
+        self.files_dir = os.path.join(trash_dir, "files")
+        self.info_dir = os.path.join(trash_dir, "info")
+        # 批量删除时已知被占用的名称（不含 .trashinfo），第一次批量删除时从 info/ 读取；
+        # 以及每个原文件名上次使用的编号，同名文件从这个编号继续找空闲名称
+        self._taken = None
+        self._counters = {}
+    
+    def recycle(self, path):
+        os.makedirs(self.files_dir, mode=0o700, exist_ok=True)
+        os.makedirs(self.info_dir, mode=0o700, exist_ok=True)
+        self._move_to_trash(os.path.abspath(path), set(), {}, f"{datetime.now():%Y-%m-%dT%H:%M:%S}")
+    
+    def recycle_many(self, paths):
+        """批量移至回收站，返回与 paths 一一对应的结果（None 或异常）
+
+        回收站目录只检查一次，已占用的名称只列出一次并在实例中复用，大量同名文件（例如
+        每个文件夹里的同名快捷方式）不会为找空闲名称反复尝试创建 .trashinfo。
+        """
+        os.makedirs(self.files_dir, mode=0o700, exist_ok=True)
+        os.makedirs(self.info_dir, mode=0o700, exist_ok=True)
+        if self._taken is None:
+            self._taken = {name[:-len(".trashinfo")] for name in os.listdir(self.info_dir)
+                           if name.endswith(".trashinfo")}
+        deleted_at = f"{datetime.now():%Y-%m-%dT%H:%M:%S}"
+        errors = []
+        for path in paths:
+            try:
+                self._move_to_trash(os.path.abspath(path), self._taken, self._counters, deleted_at)
+            except Exception as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+        return errors
+    
+    def _move_to_trash(self, path, taken, counters, deleted_at):
+        """写入 .trashinfo 并把文件移入 files/；taken 中的名称直接跳过，使用的名称加入 taken，编号记录到 counters"""
+        import shutil
+        from urllib.parse import quote
+        
+        # 先用 O_EXCL 创建 .trashinfo 占住名称，避免与其他程序同时删除同名文件时互相覆盖
+        base = os.path.basename(path)
+        stem, ext = os.path.splitext(base)
+        counter = counters.get(base, 1)
+        name = base if counter == 1 else f"{stem} ({counter}){ext}"
+        while True:
+            if name not in taken:
+                info_path = os.path.join(self.info_dir, name + ".trashinfo")
+                try:
+                    fd = os.open(info_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+                    break
+                except FileExistsError:
+                    taken.add(name)
+            counter += 1
+            name = f"{stem} ({counter}){ext}"
+        
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(f"[Trash Info]\nPath={quote(path)}\nDeletionDate={deleted_at}\n")
+            shutil.move(path, os.path.join(self.files_dir, name))
+        except BaseException:
+            os.unlink(info_path)
+            raise
+        taken.add(name)
+        counters[base] = counter
+    
+    def items(self):
+        from urllib.parse import unquote
+        
+        try:
+            entries = list(os.scandir(self.info_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.name.endswith(".trashinfo"):
+                continue
+            original_path = deleted_at = None
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.startswith("Path="):
+                            original_path = unquote(line[5:].strip())
+                        elif line.startswith("DeletionDate="):
+                            deleted_at = datetime.fromisoformat(line[13:].strip())
+            except (OSError, ValueError):
+                continue
+            if original_path and deleted_at:
+                yield original_path, deleted_at, entry.name[:-len(".trashinfo")]
+    
+    def restore(self, handle, original_path):
+        import shutil
+        
+        if os.path.lexists(original_path):
+            raise FileExistsError(f"目标文件已存在: {original_path}")
+        os.makedirs(os.path.dirname(original_path), exist_ok=True)
+        shutil.move(os.path.join(self.files_dir, handle), original_path)
+        os.unlink(os.path.join(self.info_dir, handle + ".trashinfo"))
+
+class TrashIndex:
+    """回收站内容的索引，按原路径和删除时间查找，供多次撤销复用
+
+    遍历回收站的开销与回收站中的项目数成正比，因此只在构建时遍历一次；
+    恢复成功的项目通过 take() 从索引中移除。
+    """
+    
+    # 历史记录在文件操作执行之前提交，回收站中的删除时间会稍晚于记录中的时间戳；
+    # 两者都是秒级精度，另外留出时钟误差
+    EARLY_SLACK = 60
+    LATE_SLACK = 24 * 3600
+    
+    def __init__(self, backend):
+        self.built_at = time.time()
+        self._entries = {}
+        for original_path, deleted_at, handle in backend.items():
+            key = self._key(original_path)
+            self._entries.setdefault(key, []).append((deleted_at.timestamp(), handle))
+        for entries in self._entries.values():
+            entries.sort(key=lambda entry: entry[0])
+    
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+    
+    @staticmethod
+    def _key(path):
+        # 历史记录中可能保存的是相对路径，回收站中保存的是绝对路径
+        return os.path.normcase(os.path.abspath(str(path)))
+    
+    def take(self, original_path, timestamp=None):
+        """取出与一次删除记录对应的回收站项目并从索引中移除，没有找到时返回 None
+
+        timestamp: 删除记录的 Unix 时间戳；选取该时间之后最早删除的项目。
+                   为空时（例如旧版本的记录）选取最近删除的项目。
+        """
+        entries = self._entries.get(self._key(original_path))
+        if not entries:
+            return None
+        if not timestamp:
+            return entries.pop()[1]
+        for i, (deleted_at, handle) in enumerate(entries):
+            if deleted_at < timestamp - self.EARLY_SLACK:
+                continue
+            if deleted_at > timestamp + self.LATE_SLACK:
+                break
+            del entries[i]
+            return handle
+        return None
+
+class DirectoryStateCache:
+    """持久化的目录状态缓存，用于增量扫描
+
+    每个目录保存 mtime、条目数和子目录列表（directory_state 表）。目录中增删或重命名条目都会改变
+    它的 mtime，因此 mtime 未变化的目录不需要重新列出内容，只需按缓存的子目录列表继续检查子目录。
+    只有扫描时没有产生重命名/删除操作的目录才会被记录，保证未执行的操作不会因缓存而被跳过。
+    """
+    
+    # mtime 距扫描开始不足该时长（纳秒）的目录不记录：同一时间戳内可能还有后续修改
+    RACY_WINDOW_NS = 2_000_000_000
+    
+    def __init__(self, conn, root, rules_hash, use_cache=True, flush_size=1000, scope=None, recursive=True):
+        self.conn = conn
+        self.root = os.path.abspath(root)
+        # 本次扫描覆盖的范围：完整扫描结束时只清除这个范围内没有遇到的目录
+        self.scope = os.path.abspath(scope) if scope is not None else self.root
+        self.recursive = recursive
+        self.rules_hash = rules_hash
+        # 为 False 时不跳过任何目录（强制完整扫描），但仍然更新缓存
+        self.use_cache = use_cache
+        self.flush_size = flush_size
+        self.scan_started_ns = time.time_ns()
+        self.scan_started = int(time.time())
+        self.reused_dirs = 0
+        self._upserts = []
+        self._seen = []
+        self._forgotten = []
+    
+    def unchanged_subdirs(self, path, mtime_ns):
+        """目录自上次记录后未变化时返回缓存的子目录名列表，否则返回 None"""
+        if not self.use_cache:
+            return None
+        row = self.conn.execute(
+            'SELECT mtime_ns, subdirs, rules_hash FROM directory_state WHERE path = ?',
+            (os.path.abspath(path),)
+        ).fetchone()
+        if row is None or row[0] != mtime_ns or row[2] != self.rules_hash:
+            return None
+        self.reused_dirs += 1
+        self._seen.append((self.root, self.scan_started, os.path.abspath(path)))
+        self._maybe_flush()
+        return json.loads(row[1])
+    
+    def record(self, batch):
+        """记录一个已完整处理、没有待执行操作的目录"""
+        if batch.mtime_ns is None or batch.mtime_ns >= self.scan_started_ns - self.RACY_WINDOW_NS:
+            self.forget(batch.path)
+            return
+        self._upserts.append((
+            os.path.abspath(batch.path), self.root, batch.mtime_ns, len(batch.names),
+            json.dumps(batch.subdirs, ensure_ascii=False), self.rules_hash, self.scan_started
+        ))
+        self._maybe_flush()
+    
+    def forget(self, path):
+        """目录有待执行的操作（执行后 mtime 会变化），删除其缓存，下次重新扫描"""
+        self._forgotten.append((os.path.abspath(path),))
+        self._maybe_flush()
+    
+    def _maybe_flush(self):
+        if len(self._upserts) + len(self._seen) + len(self._forgotten) >= self.flush_size:
+            self.flush()
+    
+    def flush(self):
+        with self.conn:
+            if self._upserts:
+                self.conn.executemany(
+                    '''INSERT OR REPLACE INTO directory_state
+                       (path, root, mtime_ns, entry_count, subdirs, rules_hash, last_seen)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    self._upserts
+                )
+            if self._seen:
+                self.conn.executemany(
+                    'UPDATE directory_state SET root = ?, last_seen = ? WHERE path = ?',
+                    self._seen
+                )
+            if self._forgotten:
+                self.conn.executemany('DELETE FROM directory_state WHERE path = ?', self._forgotten)
+        self._upserts = []
+        self._seen = []
+        self._forgotten = []
+    
+    def close(self, complete):
+        """结束扫描；完整扫描后删除本次没有遇到的目录（已被删除或移走）"""
+        try:
+            self.flush()
+            if complete:
+                with self.conn:
+                    if self.recursive:
+                        self.conn.execute(
+                            '''DELETE FROM directory_state
+                               WHERE root = ? AND last_seen < ? AND (path = ? OR (path >= ? AND path < ?))''',
+                            (self.root, self.scan_started) + _subtree_range(self.scope)
+                        )
+                    else:
+                        self.conn.execute(
+                            'DELETE FROM directory_state WHERE root = ? AND last_seen < ? AND path = ?',
+                            (self.root, self.scan_started, self.scope)
+                        )
+        finally:
+            self.conn.close()
+
+class DirectoryBatch:
+    """单个目录的扫描结果：文件条目列表以及该目录下所有条目名称的集合"""
+    __slots__ = ("path", "files", "names", "subdirs", "mtime_ns", "entries", "_by_name", "_fold", "_folded")
+
+    def __init__(self, path, files, names, subdirs=None, mtime_ns=None, entries=None):
+        self.path = path
+        # os.DirEntry 列表，条目类型和 stat 结果由 DirEntry 自身缓存
+        self.files = files
+        # 目录下所有条目（含子目录）的名称，保持原样（目录状态缓存记录它的条目数）
+        self.names = names
+        # 子目录名列表和目录的 mtime，仅在使用目录状态缓存时填写
+        self.subdirs = subdirs
+        self.mtime_ns = mtime_ns
+        # 查找重名文件时使用的条目，默认就是 files；监视模式只处理部分文件时传入目录中的全部条目
+        self.entries = files if entries is None else entries
+        self._by_name = None
+        # 目录所在的文件系统是否忽略大小写，第一次需要比较名称时才探测
+        self._fold = None
+        # 不区分大小写时用于查找的小写名称集合；区分大小写时就是 names
+        self._folded = None
+
+    def _keys(self):
+        if self._folded is None:
+            self._fold = _folds_case(self.path, self.names)
+            self._folded = {entry.lower() for entry in self.names} if self._fold else self.names
+        return self._folded
+
+    def key(self, name):
+        """名称索引中使用的键：不区分大小写的文件系统上为小写"""
+        self._keys()
+        return name.lower() if self._fold else name
+
+    def contains(self, name):
+        """检查目录中是否已存在同名条目，无需额外的系统调用（第一次调用时探测大小写除外）"""
+        return self.key(name) in self._keys()
+
+    def record_rename(self, old_name, new_name):
+        """重命名成功后同步更新名称集合"""
+        self.record_delete(old_name)
+        self._keys().add(self.key(new_name))
+        self.names.add(new_name)
+
+    def record_delete(self, name):
+        """删除成功后同步更新名称集合"""
+        self._keys().discard(self.key(name))
+        self.names.discard(name)
+
+    def file_entry(self, name):
+        """返回扫描时名为 name 的普通文件条目；不存在或不是普通文件（目录、符号链接）时返回 None"""
+        if self._by_name is None:
+            self._by_name = {self.key(entry.name): entry for entry in self.entries}
+        entry = self._by_name.get(self.key(name))
+        try:
+            if entry is not None and entry.is_file(follow_symlinks=False):
+                return entry
+        except OSError:
+            pass
+        return None
+
+    def free_name(self, name):
+        """返回 "名称 (2).扩展名" 形式的第一个未被占用的名称"""
+        stem, ext = os.path.splitext(name)
+        counter = 2
+        while True:
+            candidate = f"{stem} ({counter}){ext}"
+            if not self.contains(candidate):
+                return candidate
+            counter += 1
+
+class DirectoryScanner:
+    """基于 os.scandir 的流式目录扫描器，逐个目录产出 DirectoryBatch
+
+    提供 state_cache（DirectoryStateCache）时进行增量扫描：mtime 未变化的目录不再列出内容，
+    也不会产出 DirectoryBatch，只按缓存的子目录列表继续向下检查。
+    """
+
+    def __init__(self, recursive=True, state_cache=None):
+        self.recursive = recursive
+        self.state_cache = state_cache
+
+    def scan(self, directory):
+        # 使用显式栈代替递归，遍历顺序与 os.walk(topdown=True) 一致；
+        # 栈中保存 (路径, DirEntry)，子目录的 stat 可以复用 DirEntry 的缓存
+        stack = [(os.fspath(directory), None)]
+        while stack:
+            current, dir_entry = stack.pop()
+            mtime_ns = None
+            if self.state_cache is not None:
+                try:
+                    st = dir_entry.stat() if dir_entry is not None else os.stat(current)
+                    mtime_ns = st.st_mtime_ns
+                except OSError as e:
+                    print(f"扫描目录失败: {current}: {e}")
+                    continue
+                cached_subdirs = self.state_cache.unchanged_subdirs(current, mtime_ns)
+                if cached_subdirs is not None:
+                    if self.recursive:
+                        stack.extend((os.path.join(current, name), None) for name in reversed(cached_subdirs))
+                    continue
+            
+            try:
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except OSError as e:
+                print(f"扫描目录失败: {current}: {e}")
+                continue
+
+            files = []
+            names = set()
+            subdirs = []
+            for entry in entries:
+                names.add(entry.name)
+                try:
+                    # is_dir() 在大多数平台上直接使用 scandir 返回的类型信息
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    # 与 os.walk 相同：不进入指向目录的符号链接
+                    if not entry.is_symlink():
+                        subdirs.append(entry)
+                else:
+                    files.append(entry)
+
+            yield DirectoryBatch(current, files, names, [entry.name for entry in subdirs], mtime_ns)
+            if self.recursive:
+                stack.extend((entry.path, entry) for entry in reversed(subdirs))
+
+def _walk_files(directory, recursive):
+    """列出目录（及子目录）中现有的文件，产出 (路径, DirEntry)"""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if recursive:
+                    stack.append(entry.path)
+            else:
+                yield entry.path, entry
+
+def open_watcher(directory, recursive=True, poll_interval=5.0):
+    """创建目录监视器：Linux 上使用 inotify，不可用时退回定时轮询"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory, recursive)
+        except OSError as e:
+            print(f"inotify 不可用，改为每 {poll_interval} 秒轮询: {e}")
+    return PollingWatcher(directory, recursive, poll_interval)
+
+class InotifyWatcher:
+    """通过 ctypes 调用 inotify 监视目录树
+
+    poll() 返回期间写入完成（IN_CLOSE_WRITE）或移入（IN_MOVED_TO）的文件路径。
+    新建的子目录会自动加入监视，并报告其中已经存在的文件（加入监视之前写入的文件不会产生事件）。
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    
+    def __init__(self, directory, recursive=True):
+        import ctypes
+        import ctypes.util
+        
+        self.directory = os.fspath(directory)
+        self.recursive = recursive
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches = {}
+        try:
+            self._add_tree(self.directory)
+        except OSError:
+            self.close()
+            raise
+    
+    def _add_watch(self, path):
+        import ctypes
+        
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self._watches[wd] = path
+    
+    def _add_tree(self, directory):
+        """监视目录及其子目录，返回其中已有的文件"""
+        self._add_watch(directory)
+        files = []
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry.path)
+                elif self.recursive:
+                    try:
+                        self._add_watch(entry.path)
+                    except OSError as e:
+                        # 子目录可能已被删除，或超出了 max_user_watches
+                        print(f"无法监视目录: {entry.path}: {e}")
+                        continue
+                    stack.append(entry.path)
+        return files
+    
+    def poll(self, timeout):
+        """等待最多 timeout 秒，返回新出现的文件路径列表"""
+        import select
+        import struct
+        
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        paths = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+                offset += 16
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    # 事件队列溢出，丢失的事件无法找回，把所有现有文件重新交给调用方检查
+                    paths.extend(path for path, _ in _walk_files(self.directory, self.recursive))
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                parent = self._watches.get(wd)
+                if parent is None or not name:
+                    continue
+                path = os.path.join(parent, name)
+                if mask & self.IN_ISDIR:
+                    if self.recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        try:
+                            paths.extend(self._add_tree(path))
+                        except OSError as e:
+                            print(f"无法监视目录: {path}: {e}")
+                elif mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE):
+                    # IN_CREATE 时文件可能仍在写入，调用方的防抖等待会被随后的 IN_CLOSE_WRITE 延长
+                    paths.append(path)
+        return paths
+    
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    """不支持 inotify 时的监视器：每隔 interval 秒列出目录树，报告新出现或大小、修改时间变化的文件"""
+    
+    def __init__(self, directory, recursive=True, interval=5.0):
+        self.directory = os.fspath(directory)
+        self.recursive = recursive
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+    
+    def _scan(self):
+        snapshot = {}
+        for path, entry in _walk_files(self.directory, self.recursive):
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+    
+    def poll(self, timeout):
+        """等待最多 timeout 秒，到达扫描时间时返回变化的文件路径列表"""
+        remaining = self._next_scan - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return []
+        if remaining > 0:
+            time.sleep(remaining)
+        snapshot = self._scan()
+        self._next_scan = time.monotonic() + self.interval
+        changed = [path for path, state in snapshot.items() if self._snapshot.get(path) != state]
+        self._snapshot = snapshot
+        return changed
+    
+    def close(self):
+        self._snapshot = {}
+
+# 保存的清理计划文件头中的格式标识；/1 是保存详情文本的旧格式，仍然可以读取
+PLAN_FORMAT = "filecleaner-plan/2"
+LEGACY_PLAN_FORMATS = ("filecleaner-plan/1",)
+
+class PlannedOperation:
+    """FileCleaner.plan() 产出的一条计划操作
+
+    kind 为 "rename"、"skip" 或 "delete"；reason_code 和 detail_args（参数列表）是写入历史记录的详情编码。
+    """
+    __slots__ = ("kind", "path", "new_path", "reason_code", "detail_args")
+
+    def __init__(self, kind, path, new_path=None, reason_code=None, detail_args=None):
+        self.kind = kind
+        self.path = path
+        self.new_path = new_path
+        self.reason_code = reason_code
+        self.detail_args = detail_args
+
+    @property
+    def directory(self):
+        return os.path.dirname(self.path)
+
+    @property
+    def reason(self):
+        """跳过的简短原因"""
+        return SKIP_REASONS.get(self.reason_code)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    @classmethod
+    def from_dict(cls, data):
+        if "details" in data:
+            # 旧格式的计划保存的是详情文本
+            data = dict(data)
+            data.pop("reason", None)
+            parsed = parse_details(data.pop("details"))
+            if parsed:
+                data["reason_code"] = parsed[0]
+                data["detail_args"] = json.loads(parsed[1]) if parsed[1] else None
+        return cls(**data)
+
+# 清理会话各阶段的显示名称，也决定输出顺序
+PHASE_LABELS = {
+    "scan": "遍历目录",
+    "match": "匹配规则",
+    "verify": "检查文件",
+    "history": "写入历史记录",
+    "rename": "重命名",
+    "recycle": "移至回收站",
+    "unlink": "直接删除",
+    "maintenance": "维护历史记录",
+    "total": "总计",
+}
+
+# PhaseTimer.iterate 中表示迭代结束的哨兵
+_END = object()
+
+class PhaseTimer:
+    """按阶段累计耗时（秒）和次数，定位慢的清理会话把时间花在了哪里
+
+    文件操作在多个线程中执行，各线程的耗时累加在一起，所以各阶段之和可能超过总计。
+    每次计时只有两次 perf_counter 调用和一次加锁。
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, count=1):
+        with self._lock:
+            totals = self.phases.setdefault(phase, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += count
+
+    @contextlib.contextmanager
+    def measure(self, phase, count=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start, count)
+
+    def iterate(self, phase, iterable):
+        """逐个产出 iterable 的元素，取每个元素的耗时累计到 phase"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            item = next(iterator, _END)
+            if item is _END:
+                self.add(phase, time.perf_counter() - start, 0)
+                return
+            self.add(phase, time.perf_counter() - start)
+            yield item
+
+    def merge(self, summary, exclude=("total",)):
+        """累加另一个 PhaseTimer 的 summary()（例如工作进程的统计）"""
+        for phase, item in (summary or {}).items():
+            if phase not in exclude:
+                self.add(phase, item["seconds"], item["count"])
+
+    def summary(self):
+        """返回 {阶段: {"seconds": 秒, "count": 次数}}"""
+        with self._lock:
+            return {phase: {"seconds": seconds, "count": count}
+                    for phase, (seconds, count) in self.phases.items()}
+
+def format_metrics(metrics):
+    """把 PhaseTimer.summary() 格式化为 ["遍历目录: 0.120 秒 (35 次)", ...]，按 PHASE_LABELS 的顺序"""
+    order = list(PHASE_LABELS)
+    lines = []
+    for phase in sorted(metrics or {}, key=lambda name: order.index(name) if name in order else len(order)):
+        item = metrics[phase]
+        line = f"{PHASE_LABELS.get(phase, phase)}: {item['seconds']:.3f} 秒"
+        if phase != "total":
+            line += f" ({item['count']} 次)"
+        lines.append(line)
+    return lines
+
+class ResultRecords:
+    """结果汇总中的一类记录（重命名、删除、跳过、错误等），只支持追加、计数和按顺序遍历
+
+    前 memory_limit 条保存在内存中，之后的记录每 SPILL_CHUNK 条作为一行 JSON 数组追加到临时文件，
+    内存占用不随记录总数增长。可以在多个线程中同时追加（执行器的工作线程会写入结果）。
+    每个对象只删除自己创建的临时文件：被 pickle 时（多进程清理的工作进程返回结果）复制一份临时文件，
+    副本由反序列化得到的对象拥有。
+    """
+    __slots__ = ("memory_limit", "_items", "_buffer", "_count", "_spill_path", "_spill_size", "_lock")
+    SPILL_CHUNK = 1000
+
+    def __init__(self, memory_limit=10000):
+        self.memory_limit = memory_limit
+        self._items = []
+        self._buffer = []
+        self._count = 0
+        self._spill_path = None
+        # 临时文件中已经写完的字节数，遍历时只读到这里
+        self._spill_size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def append(self, item):
+        with self._lock:
+            self._count += 1
+            if len(self._items) < self.memory_limit:
+                self._items.append(item)
+                return
+            self._buffer.append(item)
+            if len(self._buffer) >= self.SPILL_CHUNK:
+                self._flush()
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def _flush(self):
+        """把缓冲的记录写入临时文件，调用方持有 _lock"""
+        if not self._buffer:
+            return
+        if self._spill_path is None:
+            self._spill_path = _spill_file()
+        with open(self._spill_path, "ab") as f:
+            f.write(json.dumps(self._buffer, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._spill_size = f.tell()
+        self._buffer.clear()
+
+    def __iter__(self):
+        with self._lock:
+            self._flush()
+            items = list(self._items)
+            spilled = self._count - len(items)
+            spill_path, spill_size = self._spill_path, self._spill_size
+        yield from items
+        if spilled:
+            with open(spill_path, "rb") as f:
+                # 只读取遍历开始时已经写完的部分，之后追加的记录不包括在内
+                remaining = spill_size
+                for line in f:
+                    remaining -= len(line)
+                    if remaining < 0:
+                        break
+                    for item in json.loads(line):
+                        # JSON 没有元组，记录中的元组读回来是列表
+                        yield tuple(item) if isinstance(item, list) else item
+                    if not remaining:
+                        break
+
+    def __reduce__(self):
+        with self._lock:
+            self._flush()
+            spill_path = None
+            if self._spill_path is not None:
+                import shutil
+                spill_path = _spill_file()
+                with open(self._spill_path, "rb") as src, open(spill_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+            return (_restore_records, (self.memory_limit, list(self._items), self._count, spill_path,
+                                       self._spill_size))
+
+    def __del__(self):
+        if self._spill_path is not None:
+            try:
+                os.remove(self._spill_path)
+            except OSError:
+                pass
+
+def _spill_file():
+    fd, path = tempfile.mkstemp(prefix="filecleaner_results_", suffix=".jsonl")
+    os.close(fd)
+    return path
+
+def _restore_records(memory_limit, items, count, spill_path, spill_size):
+    records = ResultRecords(memory_limit)
+    records._items = items
+    records._count = count
+    records._spill_path = spill_path
+    records._spill_size = spill_size
+    return records
+
+class CleaningProgress:
+    """扫描和执行阶段共享的进度计数，按时间节流后通知回调；metrics 累计各阶段的耗时"""
+
+    def __init__(self, callback=None, interval=0.1):
+        self.callback = callback
+        self.interval = interval
+        self.scanned = 0
+        self.directory = None
+        self.results = None
+        self.metrics = PhaseTimer()
+        self._last_report = 0.0
+
+    def report(self, force=False):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        results = self.results or {}
+        self.callback({
+            "scanned": self.scanned,
+            "renamed": len(results.get("renamed", ())),
+            "skipped": len(results.get("skipped", ())),
+            "deleted": len(results.get("deleted", ())),
+            "directory": self.directory
+        })
+
+class RevertProgress(CleaningProgress):
+    """撤销会话时的进度，回调收到包含 total/done/renamed/restored/skipped/errors 的字典"""
+
+    def __init__(self, callback=None, interval=0.1, total=0):
+        super().__init__(callback, interval)
+        self.total = total
+        self.done = 0
+
+    def report(self, force=False):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        results = self.results or {}
+        self.callback({
+            "total": self.total,
+            "done": self.done,
+            "renamed": len(results.get("renamed", ())),
+            "restored": len(results.get("restored", ())),
+            "skipped": len(results.get("skipped", ())),
+            "errors": len(results.get("errors", ()))
+        })
+
+class WatchProgress(CleaningProgress):
+    """监视模式的统计
+
+    pending: 等待防抖结束的文件数；processed: 已处理的文件数；
+    latency: 从第一次收到文件事件到对应的文件操作执行完毕的时间（秒）。
+    回调收到包含 pending/processed/renamed/deleted/skipped/errors 和
+    last_latency/avg_latency/max_latency 的字典。
+    """
+
+    def __init__(self, callback=None, interval=1.0):
+        super().__init__(callback, interval)
+        self.pending = 0
+        self.processed = 0
+        self.counts = {"renamed": 0, "deleted": 0, "skipped": 0, "errors": 0}
+        self.last_latency = None
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+    def add_batch(self, results, latencies):
+        for key in self.counts:
+            self.counts[key] += len(results[key])
+        for latency in latencies:
+            self._total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.last_latency = latency
+        self.processed += len(latencies)
+
+    def snapshot(self):
+        return {
+            "pending": self.pending,
+            "processed": self.processed,
+            **self.counts,
+            "last_latency": self.last_latency,
+            "avg_latency": self._total_latency / self.processed if self.processed else None,
+            "max_latency": self.max_latency if self.processed else None
+        }
+
+    def report(self, force=False):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        self.callback(self.snapshot())
+
+class FileCleaner:
+    def __init__(self, file_ops=None, config_file="cleaner_config.json", db_file="cleaner_history.db", trash=None):
+        self.config = FileCleanerConfig(config_file)
+        self.db_file = db_file
+        self._history_db = None
+        self.trash = trash or default_trash_backend()
+        self._trash_index = None
+        self.file_ops = file_ops or LocalFileOperations(self.trash)
+    
+    @property
+    def history_db(self):
+        """历史数据库在第一次使用时才打开（包括执行结构迁移），不拖慢程序启动"""
+        if self._history_db is None:
+            self._history_db = HistoryDatabase(self.db_file)
+        return self._history_db
+    
+    def run_history_maintenance(self, force=False):
+        """按配置的保留策略维护历史数据库；距离上次维护不到间隔时间时跳过（返回 None）"""
+        config = self.config.config
+        if not force:
+            interval = config["history_maintenance_interval_hours"]
+            last = int(self.history_db.get_meta("last_maintenance", 0))
+            if not interval or time.time() - last < interval * 3600:
+                return None
+        return self.history_db.run_maintenance(
+            max_age_days=config["history_max_age_days"],
+            max_sessions=config["history_max_sessions"],
+            type_max_age_days=config["history_type_max_age_days"],
+            archive_dir=config["history_archive_dir"]
+        )
+    
+    def clean_directory(self, directory, progress=None, cancel_event=None):
+        """清理目录：扫描生成计划并立即执行
+
+        progress: 可选回调，定期收到包含 scanned/renamed/skipped/deleted/directory 的进度字典，
+                  在调用 clean_directory 的线程中执行。
+        cancel_event: 可选的 threading.Event，被设置后在下一个检查点停止扫描，
+                      尚未提交的操作会被丢弃，会话以"已取消"状态结束。
+        """
+        tracker = CleaningProgress(progress)
+        return self.apply(self.plan(directory, tracker, cancel_event), directory, tracker, cancel_event)
+    
+    def dry_run(self, directory, progress=None, cancel_event=None):
+        """只生成计划并汇总，不修改任何文件，也不写入历史记录"""
+        start = time.perf_counter()
+        tracker = CleaningProgress(progress)
+        results = self.new_results(dry_run=True)
+        tracker.results = results
+        for op in self.plan(directory, tracker, cancel_event):
+            name = os.path.basename(op.path)
+            if op.kind == "rename":
+                results["renamed"].append((name, os.path.basename(op.new_path)))
+            elif op.kind == "skip":
+                results["skipped"].append((name, os.path.basename(op.new_path), op.reason))
+            elif op.kind == "delete":
+                results["deleted"].append(name)
+            tracker.report()
+        results["cancelled"] = cancel_event is not None and cancel_event.is_set()
+        tracker.metrics.add("total", time.perf_counter() - start)
+        results["metrics"] = tracker.metrics.summary()
+        tracker.report(force=True)
+        return results
+    
+    def clean_roots(self, roots, processes=None, progress=None, cancel_event=None):
+        """用进程池清理多个根目录，所有操作记录到同一个清理会话，返回汇总结果
+        
+        roots: 目录列表；元素也可以是 (目录, 是否扫描子目录)，默认使用配置中的 scan_subdirectories。
+        processes: 工作进程数，默认为 CPU 核数。根目录（估算条目数过大时拆成顶层子目录）按估算的
+                   条目数从大到小分配给进程；工作进程把操作记录发送给当前进程，由唯一的写入器写入数据库。
+        progress: 可选回调，收到所有工作进程合计的进度字典（同 clean_directory）。
+        返回的结果在 clean_directory 的基础上增加 "roots"：{根目录: 该目录的结果汇总}。
+        工作进程使用默认的文件操作和回收站，不使用 file_ops / trash 参数。
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+        
+        start = time.perf_counter()
+        processes = max(1, int(processes or os.cpu_count() or 1))
+        units = self._plan_units(roots, processes)
+        processes = min(processes, len(units)) or 1
+        root_names = list(dict.fromkeys(unit.root for unit in units))
+        session_id = self.history_db.start_cleaning_session(os.pathsep.join(root_names))
+        tracker = CleaningProgress(progress)
+        results = self.new_results()
+        results["roots"] = {root: self.new_results() for root in root_names}
+        tracker.results = results
+        unit_progress = {}
+        finished = set()
+        
+        context = multiprocessing.get_context()
+        requests = context.Queue()
+        replies = [context.Queue() for _ in range(processes)]
+        stop = context.Event()
+        abort = context.Event()
+        writer = self.history_db.open_session_writer(session_id, metrics=tracker.metrics)
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=context,
+            initializer=_init_root_worker,
+            initargs=(self.config.config_file, self.db_file, self.config.config,
+                      requests, replies, context.Value("i", 0), stop, abort)
+        )
+        
+        def handle(message):
+            kind = message[0]
+            if kind == "insert":
+                _, worker_id, rows = message
+                try:
+                    replies[worker_id].put(("ok",) + writer.insert_rows(rows))
+                except Exception as e:
+                    replies[worker_id].put(("error", str(e)))
+            elif kind == "outcomes":
+                writer.apply_outcomes(*message[1:])
+            elif kind == "progress":
+                unit_progress[message[1]] = message[2]
+                tracker.scanned = sum(event["scanned"] for event in unit_progress.values())
+                tracker.directory = message[2]["directory"]
+                tracker.report()
+            elif kind == "done":
+                finished.add(message[1])
+        
+        def drain():
+            """处理队列中剩余的消息：退出的工作进程在退出前发出的记录结果可能还没有读取"""
+            while True:
+                try:
+                    handle(requests.get(timeout=0.1))
+                except queue.Empty:
+                    return
+        
+        failed = False
+        try:
+            futures = {pool.submit(_clean_unit, unit, session_id): unit for unit in units}
+            remaining = dict(futures)
+            while remaining:
+                if cancel_event is not None and cancel_event.is_set():
+                    stop.set()
+                try:
+                    handle(requests.get(timeout=0.05))
+                    continue
+                except queue.Empty:
+                    pass
+                for future, unit in list(remaining.items()):
+                    if not future.done():
+                        continue
+                    # 任务结束（包括出错）时最后发出 "done" 消息，收到后它的所有记录都已写入；
+                    # 工作进程意外退出时不会有这条消息，先处理完队列中剩余的消息再汇总
+                    if unit.index not in finished:
+                        if not isinstance(future.exception(), BrokenProcessPool):
+                            continue
+                        drain()
+                    del remaining[future]
+                    self._merge_unit_results(results, unit, future, tracker.metrics)
+        except BaseException:
+            failed = True
+            # 不再回复插入请求：等待回复的工作进程直接失败，进程池才能退出
+            abort.set()
+            raise
+        finally:
+            stop.set()
+            try:
+                pool.shutdown(wait=True, cancel_futures=True)
+                writer.close()
+            finally:
+                if failed:
+                    self._trash_index = None
+                    self.history_db.end_cleaning_session(
+                        session_id, len(results["renamed"]), len(results["deleted"]), status="出错"
+                    )
+        
+        results["cancelled"] = results["cancelled"] or (cancel_event is not None and cancel_event.is_set())
+        if results["deleted"]:
+            self._trash_index = None
+        tracker.directory = None
+        tracker.report(force=True)
+        self.history_db.end_cleaning_session(
+            session_id,
+            len(results["renamed"]),
+            len(results["deleted"]),
+            status="已取消" if results["cancelled"] else "已完成"
+        )
+        tracker.metrics.add("total", time.perf_counter() - start)
+        self._finish_session(session_id, results, tracker.metrics)
+        return results
+    
+    def _plan_units(self, roots, processes):
+        """把根目录划分为工作单元，按估算条目数从大到小排列
+        
+        估算条目数超过平均每个进程的工作量、且扫描子目录的根目录拆分为：根目录本身（不递归）加每个顶层子目录。
+        """
+        candidates = []
+        for item in roots:
+            if isinstance(item, (str, os.PathLike)):
+                root, recursive = item, None
+            else:
+                root, recursive = item
+            if recursive is None:
+                recursive = self.config.config["scan_subdirectories"]
+            root = os.fspath(root)
+            candidates.append((root, recursive, self._estimate_entries(root, recursive)))
+        fair_share = sum(estimate for _, _, estimate in candidates) / processes
+        
+        units = []
+        for root, recursive, estimate in candidates:
+            if recursive and processes > 1 and estimate > fair_share:
+                try:
+                    with os.scandir(root) as it:
+                        entries = list(it)
+                except OSError:
+                    entries = []
+                subdirs = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+                if subdirs:
+                    units.append(WorkUnit(len(units), root, root, False, len(entries)))
+                    for subdir in subdirs:
+                        units.append(WorkUnit(len(units), subdir, root, True, self._estimate_entries(subdir, True)))
+                    continue
+            units.append(WorkUnit(len(units), root, root, recursive, estimate))
+        # 进程池按提交顺序取任务，大的单元先开始，最后完成的时间更均衡
+        units.sort(key=lambda unit: unit.estimate, reverse=True)
+        return units
+    
+    def _estimate_entries(self, path, recursive):
+        """估算扫描一个目录要处理的条目数：优先使用目录状态缓存，没有缓存时只能数第一层"""
+        if recursive:
+            cached = self.history_db.estimate_entry_count(path)
+            if cached:
+                return cached
+        try:
+            with os.scandir(path) as it:
+                return sum(1 for _ in it) + 1
+        except OSError:
+            return 1
+    
+    def _merge_unit_results(self, results, unit, future, metrics):
+        error = future.exception()
+        if error is not None:
+            unit_results = self.new_results()
+            unit_results["errors"].append((unit.path, str(error)))
+        else:
+            unit_results = future.result()
+            # 工作进程的 QueueSessionWriter 不统计写入耗时，历史记录的写入由父进程的写入器统计
+            metrics.merge(unit_results.get("metrics"))
+        for target in (results, results["roots"][unit.root]):
+            for key in ("renamed", "skipped", "deleted", "errors"):
+                target[key].extend(unit_results[key])
+            target["cancelled"] = target["cancelled"] or unit_results["cancelled"]
+
+    def new_results(self, dry_run=False):
+        """清理结果汇总：各类记录为 ResultRecords，超过 results_memory_limit 条后写入临时文件"""
+        records = self.new_records
+        return {"renamed": records(), "deleted": records(), "skipped": records(), "errors": records(),
+                "cancelled": False, "dry_run": dry_run}
+    
+    def new_records(self):
+        return ResultRecords(self.config.config["results_memory_limit"])
+    
+    def plan(self, directory, progress=None, cancel_event=None, incremental=None, recursive=None, cache_root=None):
+        """扫描目录，逐个产出 PlannedOperation，不修改磁盘
+
+        progress: 可选的 CleaningProgress，每扫描完一个目录更新一次；遍历和匹配的耗时累计到 progress.metrics。
+        cancel_event: 被设置后在下一个目录处停止扫描。
+        incremental: 是否使用目录状态缓存跳过未变化的目录，默认取配置中的 incremental_scan；
+                     传入 False 强制完整扫描（仍会更新缓存）。
+        recursive: 是否扫描子目录，默认取配置中的 scan_subdirectories。
+        cache_root: 目录状态缓存所属的根目录；只扫描根目录中的一棵子树时传入根目录，默认为 directory。
+        """
+        # 整个扫描使用同一个规则集；配置文件在扫描过程中被修改时，下一次扫描才使用新的规则
+        rules = self.config.rules()
+        if incremental is None:
+            incremental = rules.incremental
+        if recursive is None:
+            recursive = rules.recursive
+        state_cache = self.history_db.open_directory_cache(
+            cache_root or directory,
+            rules.fingerprint,
+            use_cache=incremental,
+            max_age_days=self.config.config["directory_cache_max_age_days"],
+            scope=directory,
+            recursive=recursive
+        )
+        scanner = DirectoryScanner(recursive=recursive, state_cache=state_cache)
+        metrics = progress.metrics if progress is not None else PhaseTimer()
+        complete = False
+        
+        try:
+            for batch in metrics.iterate("scan", scanner.scan(directory)):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                
+                # 先算出整个目录的操作再逐个产出，产出之后调用方执行操作的时间不计入匹配
+                with metrics.measure("match", len(batch.files)):
+                    ops = list(self._plan_batch(batch, rules))
+                actionable = False
+                for op in ops:
+                    actionable = actionable or op.kind != "skip"
+                    yield op
+                
+                if actionable:
+                    state_cache.forget(batch.path)
+                else:
+                    state_cache.record(batch)
+                
+                if progress is not None:
+                    progress.scanned += len(batch.files)
+                    progress.directory = batch.path
+                    progress.report()
+            complete = True
+        finally:
+            state_cache.close(complete)
+    
+    def _plan_batch(self, batch, rules):
+        """为一个目录中的文件生成计划操作，返回 PlannedOperation 列表
+
+        先计划快捷方式的删除（执行时批量删除也在重命名之前），腾出的名称可以被重命名使用；
+        再按扫描顺序计划重命名。目标名称已被占用时按配置的 collision_strategy 处理，
+        名称索引（batch.names）随计划同步更新，所以同一目录中的计划之间不会冲突。
+        """
+        ops = []
+        renames = []
+        renamer = rules.renamer(batch.path)
+        for entry in batch.files:
+            file = entry.name
+            kind = rules.kind(file)
+            
+            # 删除快捷方式文件
+            if kind == "delete":
+                batch.record_delete(file)
+                ops.append(PlannedOperation("delete", entry.path, None, REASON_SHORTCUT_RECYCLED))
+            # 处理视频文件重命名
+            elif kind == "rename":
+                # 每个规则组只扫描文件名一遍，依次算出最终文件名
+                match = renamer.apply(file)
+                if match:
+                    renames.append((entry, match[0], match[1]))
+        
+        strategy = rules.collision_strategy
+        # 名称键 -> (计划重命名为该名称的条目, 它在 ops 中的位置)
+        claimed = {}
+        for entry, new_name, matched_patterns in renames:
+            new_path = os.path.join(batch.path, new_name)
+            reason_code = REASON_PATTERNS_REMOVED
+            
+            # 检查目标文件是否已存在（使用扫描得到的名称集合，无需 stat）；
+            # 不区分大小写的文件系统上只改变大小写的重命名，目标就是文件自己，不算冲突
+            if batch.contains(new_name) and batch.key(new_name) != batch.key(entry.name):
+                if strategy == "suffix":
+                    new_name = batch.free_name(new_name)
+                    new_path = os.path.join(batch.path, new_name)
+                    reason_code = REASON_RENAMED_WITH_SUFFIX
+                elif strategy in ("keep_newer", "keep_larger"):
+                    replaced = self._resolve_collision(batch, entry, new_name, claimed, ops, strategy)
+                    if replaced is None:
+                        ops.append(PlannedOperation("skip", entry.path, new_path, REASON_TARGET_EXISTS, [new_name]))
+                        continue
+                    if not replaced:
+                        # 保留已有的文件，当前文件移至回收站
+                        ops.append(PlannedOperation("delete", entry.path, None, self._replaced_reason(strategy),
+                                                    [new_name]))
+                        batch.record_delete(entry.name)
+                        continue
+                    reason_code = REASON_TARGET_REPLACED
+                else:
+                    ops.append(PlannedOperation("skip", entry.path, new_path, REASON_TARGET_EXISTS, [new_name]))
+                    continue
+            
+            # 名称集合在计划重命名时就更新，同一目录中后续文件的冲突检查才能看到它
+            batch.record_rename(entry.name, new_name)
+            claimed[batch.key(new_name)] = (entry, len(ops))
+            ops.append(PlannedOperation("rename", entry.path, new_path, reason_code, matched_patterns))
+        return ops
+    
+    def _resolve_collision(self, batch, entry, new_name, claimed, ops, strategy):
+        """按 keep_newer / keep_larger 比较 entry 与占用 new_name 的文件
+
+        返回 True 表示 entry 胜出：占用者的删除已加入 ops（占用者是同一批中计划重命名的文件时，
+        它的重命名改为删除），entry 可以重命名为 new_name；返回 False 表示保留占用者；
+        占用者不是普通文件或无法读取文件信息时返回 None（跳过）。
+        只有发生冲突的文件才需要 stat，Windows 上 DirEntry 自带这些信息。
+        """
+        rival, index = claimed.get(batch.key(new_name), (None, None))
+        if rival is None:
+            rival = batch.file_entry(new_name)
+            if rival is None:
+                return None
+        try:
+            if strategy == "keep_newer":
+                wins = entry.stat(follow_symlinks=False).st_mtime_ns > rival.stat(follow_symlinks=False).st_mtime_ns
+            else:
+                wins = entry.stat(follow_symlinks=False).st_size > rival.stat(follow_symlinks=False).st_size
+        except OSError:
+            return None
+        if not wins:
+            return False
+        loser = PlannedOperation("delete", rival.path, None, self._replaced_reason(strategy), [new_name])
+        if index is not None:
+            # 同一批中的重命名还没有产出，直接替换；它的原名已经在计划重命名时从名称集合中移除
+            ops[index] = loser
+        else:
+            ops.append(loser)
+        return True
+    
+    @staticmethod
+    def _replaced_reason(strategy):
+        return REASON_REPLACED_BY_NEWER if strategy == "keep_newer" else REASON_REPLACED_BY_LARGER
+    
+    def apply(self, plan, directory, progress=None, cancel_event=None, verify=False):
+        """执行计划中的操作，返回结果汇总
+
+        plan: PlannedOperation 的可迭代对象，可以是 plan() 的生成器，也可以是 load_plan() 读取的计划。
+        directory: 记录到清理会话中的目标目录。
+        progress: 可选的 CleaningProgress。
+        cancel_event: 被设置后停止执行，尚未提交的操作会被丢弃。
+        verify: 执行前重新检查源文件和目标文件；应用之前保存的计划时磁盘可能已经变化。
+        结果中的 "metrics" 是各阶段的耗时统计（PhaseTimer.summary()），同时保存到历史数据库。
+        """
+        start = time.perf_counter()
+        results = self.new_results()
+        if progress is None:
+            progress = CleaningProgress()
+        progress.results = results
+        
+        session_id = self.history_db.start_cleaning_session(directory)
+        executor = OperationExecutor(self.config.config["worker_threads"])
+        writer = self.history_db.open_session_writer(
+            session_id,
+            batch_size=self.config.config["history_batch_size"],
+            flush_interval=self.config.config["history_flush_interval"],
+            executor=executor,
+            metrics=progress.metrics
+        )
+        
+        failed = False
+        try:
+            self._apply_to_writer(plan, writer, results, progress, cancel_event, verify)
+            if results["deleted"]:
+                # 回收站内容已经变化，下次撤销时重新建立索引
+                self._trash_index = None
+            progress.directory = None
+            progress.report(force=True)
+            self.history_db.end_cleaning_session(
+                session_id,
+                len(results["renamed"]),
+                len(results["deleted"]),
+                status="已取消" if results["cancelled"] else "已完成"
+            )
+        except Exception as e:
+            failed = True
+            writer.add_operation(
+                "error",
+                directory,
+                None,
+                REASON_CLEANING_ERROR,
+                [str(e)]
+            )
+            raise e
+        finally:
+            try:
+                writer.close()
+                executor.shutdown()
+            finally:
+                if failed:
+                    # 已登记的操作在 close() 中执行完毕后再结束会话，统计包括这些操作；
+                    # 没有结束时间的会话不会被历史记录保留策略清理
+                    self._trash_index = None
+                    self.history_db.end_cleaning_session(
+                        session_id, len(results["renamed"]), len(results["deleted"]), status="出错"
+                    )
+        progress.metrics.add("total", time.perf_counter() - start)
+        
+        self._finish_session(session_id, results, progress.metrics)
+        return results
+    
+    def _finish_session(self, session_id, results, metrics):
+        """会话结束后维护历史数据库，并保存会话的耗时统计"""
+        try:
+            with metrics.measure("maintenance"):
+                self.run_history_maintenance()
+        except Exception as e:
+            print(f"维护历史记录时发生错误: {e}")
+        results["metrics"] = metrics.summary()
+        self.history_db.save_session_metrics(session_id, results["metrics"])
+    
+    def _apply_to_writer(self, plan, writer, results, progress, cancel_event=None, verify=False):
+        """把计划中的操作逐条登记到写入器，结束时提交剩余记录（取消时丢弃）"""
+        for op in plan:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if verify:
+                with progress.metrics.measure("verify"):
+                    op = self._verify_planned(op)
+            
+            self._record_planned(writer, op, results)
+            progress.report()
+        
+        results["cancelled"] = cancel_event is not None and cancel_event.is_set()
+        if results["cancelled"]:
+            # 未提交的记录对应的文件操作还没有执行，直接丢弃即可
+            writer.discard_pending()
+        else:
+            # 提交剩余的记录并执行对应的文件操作，之后统计结果才是完整的
+            writer.flush()
+    
+    def _record_planned(self, writer, op, results):
+        """把一条计划操作登记到历史记录写入器，文件操作在记录提交后执行"""
+        if op.kind == "skip":
+            results["skipped"].append(
+                (os.path.basename(op.path), os.path.basename(op.new_path), op.reason)
+            )
+            writer.add_operation("skip", op.path, op.new_path, op.reason_code, op.detail_args)
+        elif op.kind == "rename":
+            writer.add_operation(
+                "rename",
+                op.path,
+                op.new_path,
+                op.reason_code,
+                op.detail_args,
+                action=self._rename_action(op.path, op.new_path, results, writer.metrics),
+                shard=op.directory
+            )
+        elif op.kind == "delete":
+            writer.add_operation(
+                "delete",
+                op.path,
+                None,
+                op.reason_code,
+                op.detail_args,
+                action=self._delete_action(op.path, results, writer.metrics,
+                                           allow_unlink=op.reason_code == REASON_SHORTCUT_RECYCLED),
+                shard=op.directory
+            )
+    
+    def watch(self, directory, progress=None, cancel_event=None, debounce=None, poll_interval=None, on_batch=None):
+        """持续监视目录，对新出现或移入的文件执行与清理相同的重命名和删除规则，直到 cancel_event 被设置
+        
+        整个监视过程记录为一个清理会话（状态为"监视中"，结束后为"已停止"），可以像普通会话一样撤销。
+        同一个文件在 debounce 秒内没有新的事件后才处理，避免处理仍在写入的文件。
+        progress: 可选的 WatchProgress，报告等待中的事件数和处理延迟。
+        on_batch: 可选回调，每处理完一批文件后收到这一批的结果汇总（格式与 clean_directory 相同）。
+        返回 WatchProgress.snapshot() 的最终统计。
+        """
+        config = self.config.config
+        if debounce is None:
+            debounce = config["watch_debounce_seconds"]
+        if poll_interval is None:
+            poll_interval = config["watch_poll_interval"]
+        if progress is None:
+            progress = WatchProgress()
+        
+        watcher = open_watcher(directory, config["scan_subdirectories"], poll_interval)
+        session_id = self.history_db.start_cleaning_session(directory)
+        self.history_db.set_session_status(session_id, "监视中")
+        executor = OperationExecutor(config["worker_threads"])
+        writer = self.history_db.open_session_writer(
+            session_id,
+            batch_size=config["history_batch_size"],
+            flush_interval=config["history_flush_interval"],
+            executor=executor,
+            metrics=progress.metrics
+        )
+        # 路径 -> (第一次收到事件的时间, 最近一次事件的时间)
+        pending = {}
+        # 自己重命名产生的新文件名，收到对应的事件时忽略一次
+        own_renames = set()
+        
+        try:
+            while cancel_event is None or not cancel_event.is_set():
+                # 每一轮都取一次规则集，配置文件被修改后不需要重新启动监视
+                rules = self.config.rules()
+                # 最多等待 0.5 秒，保证能及时响应取消
+                timeout = 0.5
+                if pending:
+                    next_ready = min(last for _, last in pending.values()) + debounce
+                    timeout = min(timeout, max(0.0, next_ready - time.monotonic()))
+                for path in watcher.poll(timeout):
+                    if path in own_renames:
+                        own_renames.discard(path)
+                    elif rules.kind(os.path.basename(path)) is not None:
+                        now = time.monotonic()
+                        pending[path] = (pending.get(path, (now,))[0], now)
+                
+                now = time.monotonic()
+                ready = [path for path, (_, last) in pending.items() if now - last >= debounce]
+                if ready:
+                    arrived = [pending.pop(path)[0] for path in ready]
+                    results = self._watch_batch(writer, ready, rules, own_renames)
+                    done = time.monotonic()
+                    progress.add_batch(results, [done - first for first in arrived])
+                    self.history_db.update_session_counts(
+                        session_id, progress.counts["renamed"], progress.counts["deleted"]
+                    )
+                    if on_batch is not None:
+                        on_batch(results)
+                progress.pending = len(pending)
+                progress.report(force=bool(ready))
+        finally:
+            try:
+                writer.close()
+            finally:
+                watcher.close()
+                executor.shutdown()
+                self.history_db.end_cleaning_session(
+                    session_id, progress.counts["renamed"], progress.counts["deleted"], status="已停止"
+                )
+                self.history_db.save_session_metrics(session_id, progress.metrics.summary())
+        progress.report(force=True)
+        return progress.snapshot()
+    
+    def _watch_batch(self, writer, paths, rules, own_renames):
+        """对一批防抖结束的文件执行清理规则，返回这一批的结果汇总；重命名的目标路径加入 own_renames"""
+        results = self.new_results()
+        by_directory = {}
+        for path in paths:
+            by_directory.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+        
+        for directory, wanted in by_directory.items():
+            # 列出整个目录：检查重命名冲突需要目录中所有条目的名称
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError as e:
+                print(f"扫描目录失败: {directory}: {e}")
+                continue
+            names = {entry.name for entry in entries}
+            files = []
+            for entry in entries:
+                if entry.name not in wanted:
+                    continue
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        files.append(entry)
+                except OSError:
+                    pass
+            with writer.metrics.measure("match", len(files)):
+                ops = list(self._plan_batch(DirectoryBatch(directory, files, names, entries=entries), rules))
+            for op in ops:
+                if op.kind == "rename":
+                    own_renames.add(op.new_path)
+                self._record_planned(writer, op, results)
+        
+        # 立即提交并执行，不等待批量写入的阈值
+        writer.flush()
+        if results["deleted"]:
+            self._trash_index = None
+        return results
+    
+    def _verify_planned(self, op):
+        """针对保存过的计划，重新确认操作在当前磁盘状态下仍然可以执行"""
+        if op.kind in ("rename", "delete") and not os.path.lexists(op.path):
+            return PlannedOperation("skip", op.path, op.new_path or op.path, REASON_SOURCE_MISSING,
+                                    [os.path.basename(op.path)])
+        # 替换同名文件的重命名：目标要等同一批的删除执行后才会消失，由重命名回调在执行时检查；
+        # 只改变大小写的重命名在不区分大小写的文件系统上目标就是源文件
+        if (op.kind == "rename" and op.reason_code != REASON_TARGET_REPLACED and os.path.lexists(op.new_path)
+                and not _same_file(op.path, op.new_path)):
+            return PlannedOperation("skip", op.path, op.new_path, REASON_TARGET_EXISTS,
+                                    [os.path.basename(op.new_path)])
+        return op
+    
+    def save_plan(self, plan, file_path, directory):
+        """把计划保存为 JSON Lines 文件，第一行是文件头；返回写入的操作数"""
+        count = 0
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"format": PLAN_FORMAT, "directory": directory}, ensure_ascii=False) + "\n")
+            for op in plan:
+                f.write(json.dumps(op.to_dict(), ensure_ascii=False) + "\n")
+                count += 1
+        return count
+    
+    def load_plan(self, file_path):
+        """读取 save_plan() 保存的计划，返回 (目标目录, PlannedOperation 迭代器)"""
+        f = open(file_path, 'r', encoding='utf-8')
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("format") not in (PLAN_FORMAT,) + LEGACY_PLAN_FORMATS:
+            f.close()
+            raise ValueError(f"不是有效的清理计划文件: {file_path}")
+        
+        def operations():
+            with f:
+                for line in f:
+                    if line.strip():
+                        yield PlannedOperation.from_dict(json.loads(line))
+        return header["directory"], operations()
+    
+    def _rename_action(self, path, new_path, results, metrics):
+        """生成重命名回调，由历史记录写入器在记录提交后执行
+
+        重命名从不覆盖已有的文件：计划之后出现的目标文件（保存的计划、同时写入的其他程序、监视模式），
+        以及替换同名文件时没能移走的目标文件，都会使这次重命名失败。
+        """
+        def action():
+            try:
+                try:
+                    with metrics.measure("rename"):
+                        self.file_ops.rename(path, new_path)
+                except FileExistsError:
+                    raise FileExistsError(f"目标文件已存在: {os.path.basename(new_path)}") from None
+            except Exception as e:
+                print(f"重命名文件失败: {e}")
+                results["errors"].append((os.path.basename(path), str(e)))
+                return "error", STATUS_FAILED, REASON_RENAME_FAILED, [str(e)], False
+            results["renamed"].append((os.path.basename(path), os.path.basename(new_path)))
+            return None
+        return action
+    
+    def _delete_action(self, path, results, metrics, allow_unlink=True):
+        """生成删除操作；同一批提交的删除由 _delete_many 合并为一次回收站调用
+
+        allow_unlink: 未能移至回收站时是否直接删除；只有快捷方式允许，重名时被替换的文件只能移至回收站。
+        """
+        return BulkAction(self._delete_many, (path, results, metrics, allow_unlink))
+    
+    def _delete_many(self, items):
+        """批量删除 [(路径, 结果汇总, PhaseTimer, 是否允许直接删除)]，全部文件一次交给回收站
+
+        返回与 items 一一对应的回调结果：未能移至回收站的文件直接删除，返回需要更新到历史记录中的编码（此时不可撤销）。
+        """
+        paths = [item[0] for item in items]
+        metrics = items[0][2]
+        try:
+            with metrics.measure("recycle", len(paths)):
+                recycle_many = getattr(self.file_ops, "recycle_many", None)
+                if recycle_many is not None:
+                    errors = recycle_many(paths)
+                else:
+                    errors = _recycle_each(self.file_ops.recycle, paths)
+        except Exception as e:
+            errors = [e] * len(paths)
+        
+        outcomes = []
+        for (path, results, _, allow_unlink), error in zip(items, errors):
+            outcome = None
+            if error is not None and not allow_unlink:
+                message = str(error) or "回收站不可用"
+                print(f"移至回收站失败: {message}")
+                results["errors"].append((os.path.basename(path), message))
+                outcomes.append(("error", STATUS_FAILED, REASON_DELETE_FAILED, [message], False))
+                continue
+            if error is not None:
+                if isinstance(error, ImportError):
+                    outcome = ("delete", STATUS_DONE, REASON_SHORTCUT_DELETED, None, False)
+                else:
+                    print(f"删除文件到回收站失败: {error}")
+                    outcome = ("delete", STATUS_DONE, REASON_SHORTCUT_DELETED_NO_RECYCLE_BIN, None, False)
+                try:
+                    with metrics.measure("unlink"):
+                        self.file_ops.unlink(path)
+                except Exception as e:
+                    print(f"删除文件失败: {e}")
+                    results["errors"].append((os.path.basename(path), str(e)))
+                    outcomes.append(("error", STATUS_FAILED, REASON_DELETE_FAILED, [str(e)], False))
+                    continue
+            results["deleted"].append(os.path.basename(path))
+            outcomes.append(outcome)
+        return outcomes
+    
+    def get_trash_index(self, rebuild=False):
+        """返回回收站索引，多次撤销之间复用"""
+        if self._trash_index is None or rebuild:
+            self._trash_index = TrashIndex(self.trash)
+        return self._trash_index
+    
+    def restore_from_trash(self, original_path, timestamp=None):
+        """从回收站恢复一次删除记录对应的文件，成功返回 True
+
+        回收站不可用时抛出 ImportError。
+        """
+        index = self.get_trash_index()
+        handle = index.take(original_path, timestamp)
+        if handle is None and (not timestamp or index.built_at < timestamp + TrashIndex.EARLY_SLACK):
+            # 索引可能建立在这次删除之前（例如删除发生在另一个进程中），重新建立一次
+            index = self.get_trash_index(rebuild=True)
+            handle = index.take(original_path, timestamp)
+        if handle is None:
+            return False
+        try:
+            self.trash.restore(handle, str(original_path))
+        except Exception as e:
+            print(f"从回收站恢复文件失败: {e}")
+            return False
+        return True
+    
+    def revert_session(self, session_id, progress=None, cancel_event=None):
+        """撤销一次清理会话中的全部操作，返回结果汇总
+
+        按执行顺序的逆序处理：重命名改回原名（原文件名已被其他文件占用时跳过），
+        删除的文件通过同一个回收站索引恢复。成功撤销的记录在结束时用一个事务标记为已撤销。
+        progress: 可选回调，定期收到 RevertProgress 的进度字典。
+        cancel_event: 被设置后停止，已经撤销的操作仍会被标记。
+        """
+        operations = self.history_db.get_session_operations(session_id)
+        records = self.new_records
+        results = {"renamed": records(), "restored": records(), "skipped": records(), "errors": records(),
+                   "cancelled": False}
+        tracker = RevertProgress(progress, total=len(operations))
+        tracker.results = results
+        reverted_ids = []
+        index = None
+        trash_error = None
+        
+        try:
+            for op in reversed(operations):
+                if cancel_event is not None and cancel_event.is_set():
+                    results["cancelled"] = True
+                    break
+                name = os.path.basename(op.original_path)
+                
+                if op.operation_type == "rename":
+                    if self._revert_rename(op.original_path, op.new_path, results):
+                        reverted_ids.append(op.id)
+                elif not op.reversible:
+                    results["skipped"].append((name, "直接删除，不可撤销"))
+                    reverted_ids.append(op.id)
+                else:
+                    if index is None and trash_error is None:
+                        try:
+                            # 整个会话只遍历一次回收站
+                            index = self.get_trash_index(rebuild=True)
+                        except ImportError:
+                            trash_error = "系统不支持回收站操作"
+                        except Exception as e:
+                            trash_error = f"访问回收站时发生错误: {e}"
+                    if trash_error is not None:
+                        results["skipped"].append((name, trash_error))
+                    else:
+                        handle = index.take(op.original_path, op.timestamp)
+                        if handle is None:
+                            results["skipped"].append((name, "在回收站中未找到文件"))
+                        else:
+                            try:
+                                self.trash.restore(handle, op.original_path)
+                                results["restored"].append(name)
+                            except Exception as e:
+                                results["errors"].append((name, f"从回收站恢复文件失败: {e}"))
+                    # 与单条撤销一致：无法恢复的删除记录也标记为已撤销
+                    reverted_ids.append(op.id)
+                
+                tracker.done += 1
+                tracker.report()
+        finally:
+            self.history_db.mark_many_as_reverted(reverted_ids)
+        
+        if reverted_ids:
+            complete = len(reverted_ids) == len(operations)
+            self.history_db.set_session_status(session_id, "已撤销" if complete else "部分撤销")
+        tracker.report(force=True)
+        return results
+    
+    def _revert_rename(self, original_path, new_path, results):
+        """把文件改回原名，成功返回 True"""
+        name = os.path.basename(new_path)
+        if not os.path.lexists(new_path):
+            results["skipped"].append((name, "文件已不存在"))
+            return False
+        # 大小写不敏感的文件系统上只改大小写时，原文件名指向的就是同一个文件
+        if os.path.lexists(original_path):
+            try:
+                same_file = os.path.samefile(original_path, new_path)
+            except OSError:
+                same_file = False
+            if not same_file:
+                results["skipped"].append((name, "原文件名已被占用"))
+                return False
+        try:
+            self.file_ops.rename(new_path, original_path)
+        except Exception as e:
+            results["errors"].append((name, f"撤销重命名失败: {e}"))
+            return False
+        results["renamed"].append((name, os.path.basename(original_path)))
+        return True
+    
+    def revert_operation(self, operation):
+        op_id, op_type, original_path, new_path, timestamp, is_reverted = operation[:6]
+        
+        if is_reverted:
+            return False
+        
+        try:
+            if op_type == "rename":
+                # 与撤销整个会话相同：原文件名已被其他文件占用时不覆盖它
+                results = {"renamed": [], "skipped": [], "errors": []}
+                if self._revert_rename(original_path, new_path, results):
+                    self.history_db.mark_as_reverted(op_id)
+                    return True
+                for name, reason in results["skipped"] + results["errors"]:
+                    print(f"无法撤销重命名 {name}: {reason}")
+                return False
+            elif op_type == "delete":
+                # 直接删除（未经过回收站）的文件无法恢复
+                if not operation.reversible:
+                    self.history_db.mark_as_reverted(op_id)
                     return False
-                    
+                
+                # 尝试从回收站恢复文件
+                try:
+                    restored = self.restore_from_trash(original_path, timestamp)
                 except ImportError:
                     # 系统不支持回收站操作
                     print("系统不支持回收站操作")
@@ -355,16 +3536,435 @@ class FileCleaner:
                     self.history_db.mark_as_reverted(op_id)
                     return False
                 
+                if not restored:
+                    # 如果没有找到文件或恢复失败
+                    print("在回收站中未找到文件或恢复失败")
+                self.history_db.mark_as_reverted(op_id)
+                return restored
+                
+        except Exception as e:
+            print(f"撤销操作失败: {e}")
+            return False
+        return False
+
+# 多进程清理的工作单元：index 是提交顺序之外的唯一编号，root 是所属的根目录（目录状态缓存按它分组）
+WorkUnit = namedtuple("WorkUnit", ("index", "path", "root", "recursive", "estimate"))
+
+# 工作进程中的状态，由 _init_root_worker 在进程启动时设置
+_root_worker = {}
+
+def _init_root_worker(config_file, db_file, config, requests, replies, counter, stop, abort):
+    # Ctrl+C 由父进程处理，通过 stop 事件通知工作进程
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with counter.get_lock():
+        worker_id = counter.value
+        counter.value += 1
+    cleaner = FileCleaner(config_file=config_file, db_file=db_file)
+    # 使用父进程中的配置（包括命令行参数的覆盖），整个会话中不随配置文件重新加载
+    for key, value in config.items():
+        cleaner.config.override(key, value)
+    _root_worker.update(
+        cleaner=cleaner,
+        requests=requests,
+        replies=replies[worker_id],
+        worker_id=worker_id,
+        stop=stop,
+        abort=abort,
+        executor=OperationExecutor(config["worker_threads"])
+    )
+
+def _clean_unit(unit, session_id):
+    """在工作进程中扫描并清理一个工作单元，返回结果汇总
+
+    结束时（包括出错）总是最后发出 "done" 消息：同一进程发出的消息按顺序到达，父进程收到它时
+    这个单元的所有记录和执行结果都已经写入。
+    """
+    worker = _root_worker
+    cleaner = worker["cleaner"]
+    config = cleaner.config.config
+    requests = worker["requests"]
+    progress = CleaningProgress(lambda event: requests.put(("progress", unit.index, event)), interval=0.5)
+    writer = QueueSessionWriter(
+        requests,
+        worker["replies"],
+        worker["worker_id"],
+        session_id,
+        batch_size=config["history_batch_size"],
+        flush_interval=config["history_flush_interval"],
+        executor=worker["executor"],
+        metrics=progress.metrics,
+        abort=worker["abort"]
+    )
+    results = cleaner.new_results()
+    progress.results = results
+    try:
+        try:
+            plan = cleaner.plan(unit.path, progress, worker["stop"], recursive=unit.recursive, cache_root=unit.root)
+            cleaner._apply_to_writer(plan, writer, results, progress, worker["stop"])
+        except Exception as e:
+            writer.add_operation("error", unit.path, None, REASON_CLEANING_ERROR, [str(e)])
+            raise
+        finally:
+            writer.close()
+    finally:
+        requests.put(("done", unit.index))
+    results["metrics"] = progress.metrics.summary()
+    return results
+
+class HistoryRow:
+    """历史记录列表中的一行；控件只创建一次，滚动时通过 show() 换成其他记录的内容"""
+    
+    def __init__(self, parent, fonts, height, on_revert, on_revert_session):
+        self.operation = None
+        self.on_revert = on_revert
+        self.on_revert_session = on_revert_session
+        
+        self.frame = ctk.CTkFrame(
+            parent,
+            height=height,
+            corner_radius=8,
+            fg_color=("gray85", "gray15")
+        )
+        # 行高固定，内容超出时截断，这样每条记录在列表中的位置可以直接计算
+        self.frame.pack_propagate(False)
+        
+        self.time_label = ctk.CTkLabel(self.frame, text="", font=fonts["time"], height=18)
+        self.time_label.pack(anchor="w", padx=10, pady=(5, 0))
+        
+        self.details_label = ctk.CTkLabel(
+            self.frame,
+            text="",
+            font=fonts["text"],
+            justify="left",
+            anchor="w",
+            wraplength=250
+        )
+        self.details_label.pack(anchor="w", fill="x", padx=10, pady=(2, 2))
+        
+        button_frame = ctk.CTkFrame(self.frame, fg_color="transparent", height=25)
+        button_frame.pack(side="bottom", anchor="w", padx=10, pady=(0, 5))
+        
+        self.revert_btn = ctk.CTkButton(
+            button_frame,
+            text="撤销",
+            command=lambda: self.on_revert(self.operation),
+            width=80,
+            height=25,
+            corner_radius=6,
+            font=fonts["text"],
+            fg_color="#dc3545",
+            hover_color="#c82333"
+        )
+        self.revert_btn.pack(side="left")
+        
+        self.session_btn = ctk.CTkButton(
+            button_frame,
+            text="撤销本次清理",
+            command=lambda: self.on_revert_session(self.operation[6]),
+            width=110,
+            height=25,
+            corner_radius=6,
+            font=fonts["text"],
+            fg_color=("gray60", "gray35"),
+            hover_color=("gray50", "gray45")
+        )
+        self.status_label = ctk.CTkLabel(
+            button_frame,
+            text="已撤销",
+            font=fonts["text"],
+            text_color="gray",
+            height=25
+        )
+        self.session_visible = False
+        self.reverted = False
+    
+    def show(self, operation):
+        if operation is self.operation:
+            return
+        self.operation = operation
+        _, op_type, original_path, new_path, timestamp_value, is_reverted, session_id = operation[:7]
+        
+        # 数据库中保存的是 Unix 时间戳（秒）
+        try:
+            timestamp = datetime.fromtimestamp(timestamp_value)
+        except (TypeError, ValueError, OSError):
+            timestamp = None
+        self.time_label.configure(text=f"{timestamp:%Y-%m-%d %H:%M:%S}" if timestamp else "")
+        
+        if op_type == "rename":
+            details_text = f"重命名: {os.path.basename(original_path)} → {os.path.basename(new_path)}"
+        else:
+            details_text = f"删除: {os.path.basename(original_path)}"
+        details = operation.describe()
+        if details:
+            details_text += f"\n详情: {details}"
+        self.details_label.configure(text=details_text)
+        
+        # 搜索结果中可能包含已撤销的记录，只显示状态，不显示撤销按钮
+        if bool(is_reverted) != self.reverted:
+            if is_reverted:
+                self.revert_btn.pack_forget()
+                self.session_btn.pack_forget()
+                self.session_visible = False
+                self.status_label.pack(side="left")
+            else:
+                self.status_label.pack_forget()
+                self.revert_btn.pack(side="left")
+            self.reverted = bool(is_reverted)
+        show_session = bool(session_id) and not self.reverted
+        if show_session != self.session_visible:
+            if show_session:
+                self.session_btn.pack(side="left", padx=(8, 0))
+            else:
+                self.session_btn.pack_forget()
+            self.session_visible = show_session
+
+class HistoryListView:
+    """虚拟化的历史记录列表
+
+    只为可见区域创建行控件（HistoryRow），滚动时复用这些控件；记录按 (timestamp, id)
+    键集分页从数据库读取，内存中最多缓存 MAX_CACHED_ROWS 条，历史记录再多也不会变慢。
+    set_filters() 之后改为显示 HistoryDatabase.search_operations 的结果（按 id 分页）。
+    """
+    
+    ROW_HEIGHT = 104
+    ROW_GAP = 6
+    PAGE_SIZE = 200
+    MAX_CACHED_ROWS = 1000
+    # 搜索结果只数到这么多条，滚动接近末尾时再继续数
+    SEARCH_COUNT_CAP = 10000
+    
+    def __init__(self, parent, history_db, on_revert, on_revert_session):
+        self.history_db = history_db
+        self.on_revert = on_revert
+        self.on_revert_session = on_revert_session
+        
+        self.filters = None
+        self.total = 0
+        self.total_capped = False
+        self.start = 0       # rows[0] 在整个列表中的序号
+        self.rows = []
+        self.top = 0         # 视口顶部在整个列表中的像素位置
+        self.pool = []
+        self.render_pending = False
+        
+        self.fonts = {
+            "time": ctk.CTkFont(family="Microsoft YaHei UI", size=12, weight="bold"),
+            "text": ctk.CTkFont(family="Microsoft YaHei UI", size=11)
+        }
+        
+        self.frame = ctk.CTkFrame(parent, corner_radius=8)
+        self.frame.grid_rowconfigure(0, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+        
+        self.viewport = ctk.CTkFrame(self.frame, fg_color="transparent")
+        self.viewport.grid(row=0, column=0, sticky="nsew", padx=(5, 0), pady=5)
+        self.scrollbar = ctk.CTkScrollbar(self.frame, command=self.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns", pady=5)
+        
+        self.message_label = ctk.CTkLabel(self.viewport, text="", font=ctk.CTkFont(family="Microsoft YaHei UI", size=14))
+        
+        self.viewport.bind("<Configure>", lambda event: self.schedule_render())
+        # 鼠标在列表上时才接管滚轮事件，行控件由多个子控件组成，无法逐个绑定
+        self.viewport.bind("<Enter>", self.bind_mousewheel)
+        self.viewport.bind("<Leave>", self.unbind_mousewheel)
+    
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+    
+    def set_filters(self, filters):
+        """filters: search_operations 的关键字参数；为 None 时显示全部未撤销的记录"""
+        self.filters = filters
+        self.top = 0
+        self.refresh()
+    
+    def refresh(self):
+        """重新读取记录总数，并从数据库重新加载当前位置附近的记录"""
+        try:
+            self.count_rows(self.SEARCH_COUNT_CAP)
+        except Exception as e:
+            print(f"更新历史记录时发生错误: {e}")
+            self.total = 0
+            self.show_message(f"加载历史记录时发生错误: {str(e)}", "red")
+            return
+        self.rows = []
+        for row in self.pool:
+            row.operation = None
+        self.schedule_render()
+    
+    def show_message(self, text, color=None):
+        self.message_label.configure(text=text, text_color=color or ("gray10", "gray90"))
+        self.message_label.place(relx=0.5, y=20, anchor="n")
+        for row in self.pool:
+            row.frame.place_forget()
+    
+    def count_rows(self, cap):
+        if self.filters is None:
+            self.total = self.history_db.count_operations()
+            self.total_capped = False
+        else:
+            self.total = self.history_db.count_search_results(cap=cap, **self.filters)
+            self.total_capped = self.total >= cap
+    
+    def fetch_page(self, before=None, after=None, offset=None):
+        """before / after 是缓存两端的记录；未搜索时按 (timestamp, id) 分页，搜索时按 id 分页"""
+        if self.filters is None:
+            key = (lambda op: (op[4], op[0]))
+            return self.history_db.get_operations_page(
+                self.PAGE_SIZE,
+                before=key(before) if before else None,
+                after=key(after) if after else None,
+                offset=offset
+            )
+        return self.history_db.search_operations(
+            limit=self.PAGE_SIZE,
+            before=before[0] if before else None,
+            after=after[0] if after else None,
+            offset=offset,
+            **self.filters
+        )
+    
+    def load_range(self, first, last):
+        """确保序号 first..last 的记录已经在缓存中"""
+        end = self.start + len(self.rows)
+        if not self.rows or first < self.start - self.PAGE_SIZE or last >= end + self.PAGE_SIZE:
+            # 直接跳转到远处（拖动滚动条）时才使用 OFFSET，其余情况都沿着缓存两端按键集翻页
+            self.start = max(0, first - self.PAGE_SIZE // 4)
+            self.rows = self.fetch_page(offset=self.start)
+        
+        while first < self.start and self.rows:
+            page = self.fetch_page(after=self.rows[0])
+            if not page:
+                self.start = 0
+                break
+            self.rows[:0] = page
+            self.start = max(0, self.start - len(page))
+        
+        while last >= self.start + len(self.rows) and self.rows:
+            page = self.fetch_page(before=self.rows[-1])
+            if not page:
+                # 记录总数在统计之后减少了（例如在其他窗口中撤销）
+                self.total = self.start + len(self.rows)
+                break
+            self.rows.extend(page)
+        
+        # 缓存超过上限时，优先丢弃离可见区域更远的一端
+        excess = len(self.rows) - self.MAX_CACHED_ROWS
+        if excess > 0:
+            front_slack = max(0, first - self.start)
+            back_slack = max(0, self.start + len(self.rows) - 1 - last)
+            drop_front = min(front_slack, excess if front_slack >= back_slack else max(0, excess - back_slack))
+            drop_back = min(back_slack, excess - drop_front)
+            if drop_back:
+                del self.rows[-drop_back:]
+            if drop_front:
+                del self.rows[:drop_front]
+                self.start += drop_front
+    
+    def schedule_render(self):
+        # 同一轮事件中的多次滚动只渲染一次
+        if not self.render_pending:
+            self.render_pending = True
+            self.viewport.after_idle(self.render)
+    
+    def render(self):
+        self.render_pending = False
+        height = self.viewport.winfo_height()
+        content_height = self.total * self.ROW_HEIGHT
+        self.top = max(0, min(self.top, content_height - height))
+        
+        if self.total == 0:
+            self.show_message("暂无操作记录" if self.filters is None else "没有匹配的记录")
+            self.scrollbar.set(0, 1)
+            return
+        self.message_label.place_forget()
+        
+        first = self.top // self.ROW_HEIGHT
+        last = min(self.total - 1, (self.top + height) // self.ROW_HEIGHT)
+        try:
+            if self.total_capped and last + self.PAGE_SIZE >= self.total:
+                self.count_rows(self.total * 2)
+            self.load_range(first, last)
         except Exception as e:
-            print(f"撤销操作失败: {e}")
-            return False
-        return False
+            print(f"更新历史记录时发生错误: {e}")
+            self.show_message(f"加载历史记录时发生错误: {str(e)}", "red")
+            return
+        last = min(last, self.total - 1)
+        
+        visible = max(0, last - first + 1)
+        while len(self.pool) < visible:
+            self.pool.append(HistoryRow(
+                self.viewport, self.fonts, self.ROW_HEIGHT - self.ROW_GAP,
+                self.on_revert, self.on_revert_session
+            ))
+        
+        for slot, row in enumerate(self.pool):
+            index = first + slot
+            if slot < visible and self.start <= index < self.start + len(self.rows):
+                row.show(self.rows[index - self.start])
+                row.frame.place(relx=0, y=index * self.ROW_HEIGHT - self.top, relwidth=0.98)
+            else:
+                row.frame.place_forget()
+        
+        content_height = max(content_height, 1)
+        self.scrollbar.set(self.top / content_height, min(1.0, (self.top + height) / content_height))
+    
+    def scroll_to(self, top):
+        self.top = max(0, int(top))
+        self.schedule_render()
+    
+    def yview(self, *args):
+        """滚动条回调：("moveto", 比例) 或 ("scroll", 数量, "units"/"pages")"""
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * self.total * self.ROW_HEIGHT)
+        elif args[0] == "scroll":
+            step = self.ROW_HEIGHT if args[2] == "units" else self.viewport.winfo_height()
+            self.scroll_to(self.top + int(args[1]) * step)
+    
+    def bind_mousewheel(self, event):
+        self.viewport.bind_all("<MouseWheel>", self.on_mousewheel)
+        self.viewport.bind_all("<Button-4>", self.on_mousewheel)
+        self.viewport.bind_all("<Button-5>", self.on_mousewheel)
+    
+    def unbind_mousewheel(self, event):
+        self.viewport.unbind_all("<MouseWheel>")
+        self.viewport.unbind_all("<Button-4>")
+        self.viewport.unbind_all("<Button-5>")
+    
+    def on_mousewheel(self, event):
+        if event.num == 4:
+            delta = -1
+        elif event.num == 5:
+            delta = 1
+        elif sys.platform == "darwin":
+            delta = -event.delta
+        else:
+            delta = -event.delta / 120
+        self.scroll_to(self.top + delta * self.ROW_HEIGHT // 2)
 
 class FileCleanerGUI:
+    # 日志每类结果最多显示的条数，其余的通过"保存完整报告"查看
+    LOG_SECTION_LINES = 1000
+    # 日志文本框最多保留的行数，超出时删除最早的行
+    LOG_MAX_LINES = 5000
+    # 每次插入日志的行数，两次插入之间让出主线程处理界面事件
+    LOG_CHUNK_LINES = 200
+    
     def __init__(self):
+        load_gui_modules()
         self.cleaner = FileCleaner()
         self.current_sidebar = None
         self.sidebar_showing = False
+        # 后台清理（或撤销）线程及其通信对象
+        self.cleaning_thread = None
+        self.progress_queue = None
+        self.cancel_event = None
+        self.task_handlers = None
+        self.history_search_job = None
+        # 清空日志时加一，使还没插入完的旧内容停止插入
+        self.log_generation = 0
+        # 返回上一次清理或撤销的完整报告（逐行）的函数
+        self.full_report = None
         self.setup_gui()
     
     def ease_out_cubic(self, x):
@@ -407,13 +4007,7 @@ class FileCleanerGUI:
                     
                     # 如果是切换到历史记录，确保内容是最新的
                     if sidebar_frame == self.history_sidebar:
-                        for child in sidebar_frame.winfo_children():
-                            if isinstance(child, ctk.CTkFrame):
-                                for subchild in child.winfo_children():
-                                    if isinstance(subchild, ctk.CTkScrollableFrame):
-                                        self.update_history_content(subchild)
-                                        break
-                                break
+                        self.history_view.refresh()
             else:
                 # 如果当前没有显示侧边栏，则显示新的
                 self.show_sidebar(sidebar_frame)
@@ -496,6 +4090,7 @@ class FileCleanerGUI:
         
         # 添加窗口大小变化事件处理
         self.root.bind("<Configure>", self.on_window_configure)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # 创建背景框架
         self.bg_frame = ctk.CTkFrame(
@@ -645,7 +4240,7 @@ class FileCleanerGUI:
         self.settings_btn = ctk.CTkButton(
             buttons_frame,
             text="规则设置",
-            command=lambda: self.toggle_sidebar(self.settings_sidebar),
+            command=self.open_settings_sidebar,
             width=120,
             height=35,
             corner_radius=8,
@@ -659,7 +4254,7 @@ class FileCleanerGUI:
         self.history_btn = ctk.CTkButton(
             buttons_frame,
             text="历史记录",
-            command=lambda: self.toggle_sidebar(self.history_sidebar),
+            command=self.open_history_sidebar,
             width=120,
             height=35,
             corner_radius=8,
@@ -683,6 +4278,48 @@ class FileCleanerGUI:
         )
         self.clean_btn.pack(pady=5)
         
+        # 预览按钮：只显示将要执行的操作，不修改文件
+        self.preview_btn = ctk.CTkButton(
+            buttons_frame,
+            text="预览",
+            command=self.start_preview,
+            width=120,
+            height=35,
+            corner_radius=8,
+            font=ctk.CTkFont(family="Microsoft YaHei UI", size=12),
+            fg_color="#17a2b8",
+            hover_color="#138496"
+        )
+        self.preview_btn.pack(pady=5)
+        
+        # 把上一次的完整结果保存为文本文件（日志中每类结果只显示前面一部分）
+        self.report_btn = ctk.CTkButton(
+            buttons_frame,
+            text="保存完整报告",
+            command=self.save_full_report,
+            width=120,
+            height=35,
+            corner_radius=8,
+            font=ctk.CTkFont(family="Microsoft YaHei UI", size=12),
+            fg_color=("#6c757d", "#495057"),
+            hover_color=("#5a6268", "#383d41"),
+            state="disabled"
+        )
+        self.report_btn.pack(pady=5)
+        
+        # 取消按钮，只在清理进行时显示
+        self.cancel_btn = ctk.CTkButton(
+            buttons_frame,
+            text="取消清理",
+            command=self.cancel_cleaning,
+            width=120,
+            height=35,
+            corner_radius=8,
+            font=ctk.CTkFont(family="Microsoft YaHei UI", size=12),
+            fg_color="#dc3545",
+            hover_color="#c82333"
+        )
+        
         # 右侧日志区域标题样式改进
         log_label = ctk.CTkLabel(
             self.right_frame,
@@ -704,13 +4341,29 @@ class FileCleanerGUI:
         )
         self.result_text.pack(pady=10, padx=15, fill="both", expand=True)
         
-        # 创建设置侧边栏
-        self.settings_sidebar = ctk.CTkFrame(self.root)
-        self.setup_settings_sidebar()
+        # 清理进度条，只在清理进行时显示（扫描前无法知道文件总数，使用不确定模式）
+        self.progress_bar = ctk.CTkProgressBar(
+            self.right_frame,
+            mode="indeterminate"
+        )
         
-        # 创建历史记录侧边栏
-        self.history_sidebar = ctk.CTkFrame(self.root)
-        self.setup_history_sidebar()
+        # 设置和历史记录侧边栏在第一次打开时才创建（见 open_settings_sidebar / open_history_sidebar）
+        self.settings_sidebar = None
+        self.history_sidebar = None
+    
+    def open_settings_sidebar(self):
+        if self.settings_sidebar is None:
+            self.settings_sidebar = ctk.CTkFrame(self.root)
+            self.setup_settings_sidebar()
+        self.toggle_sidebar(self.settings_sidebar)
+    
+    def open_history_sidebar(self):
+        if self.history_sidebar is None:
+            self.history_sidebar = ctk.CTkFrame(self.root)
+            self.setup_history_sidebar()
+        else:
+            self.history_view.refresh()
+        self.toggle_sidebar(self.history_sidebar)
     
     def setup_settings_sidebar(self):
         # 设置侧边栏样式
@@ -809,6 +4462,22 @@ class FileCleanerGUI:
             self.cleanup_ext_text
         )
         
+        # 重命名的目标文件已存在时的处理方式
+        strategy = self.cleaner.config.config["collision_strategy"]
+        self.collision_strategy_var = ctk.StringVar(value=COLLISION_STRATEGIES.get(strategy, COLLISION_STRATEGIES["skip"]))
+        collision_menu = ctk.CTkOptionMenu(
+            scroll_frame,
+            values=list(COLLISION_STRATEGIES.values()),
+            variable=self.collision_strategy_var,
+            width=250
+        )
+        self.add_setting_item(
+            scroll_frame,
+            "目标文件已存在时",
+            "保留较新/较大的文件时，另一个文件移至回收站",
+            collision_menu
+        )
+        
         # 是否扫描子目录
         self.scan_subdirs_var = ctk.BooleanVar(value=self.cleaner.config.config["scan_subdirectories"])
         scan_subdirs_checkbox = ctk.CTkCheckBox(
@@ -818,6 +4487,15 @@ class FileCleanerGUI:
         )
         scan_subdirs_checkbox.pack(pady=10)
         
+        # 是否使用增量扫描（跳过未变化的目录）
+        self.incremental_scan_var = ctk.BooleanVar(value=self.cleaner.config.config["incremental_scan"])
+        incremental_checkbox = ctk.CTkCheckBox(
+            scroll_frame,
+            text="增量扫描（跳过未变化的目录）",
+            variable=self.incremental_scan_var
+        )
+        incremental_checkbox.pack(pady=(0, 10))
+        
         # 创建底部按钮容器
         bottom_frame = ctk.CTkFrame(
             main_container,
@@ -860,7 +4538,8 @@ class FileCleanerGUI:
     
     def save_current_settings(self):
         """保存当前设置"""
-        new_config = {
+        new_config = dict(self.cleaner.config.config)
+        new_config.update({
             "target_extensions": [
                 ext.strip() for ext in self.target_ext_text.get("1.0", "end-1c").split("\n")
                 if ext.strip()  # 只保留非空行
@@ -873,9 +4552,17 @@ class FileCleanerGUI:
                 ext.strip() for ext in self.cleanup_ext_text.get("1.0", "end-1c").split("\n")
                 if ext.strip()  # 只保留非空行
             ],
-            "scan_subdirectories": self.scan_subdirs_var.get()
-        }
-        self.cleaner.config.save_config(new_config)
+            "scan_subdirectories": self.scan_subdirs_var.get(),
+            "incremental_scan": self.incremental_scan_var.get(),
+            "collision_strategy": next(
+                key for key, label in COLLISION_STRATEGIES.items() if label == self.collision_strategy_var.get()
+            )
+        })
+        try:
+            self.cleaner.config.save_config(new_config)
+        except Exception as e:
+            messagebox.showerror("错误", f"保存配置文件时出错: {e}")
+            return
         self.cleaner.config.config = new_config
         self.hide_sidebar()
         messagebox.showinfo("成功", "设置已保存")
@@ -897,7 +4584,7 @@ class FileCleanerGUI:
         main_container.pack(fill="both", expand=True)
         
         # 配置grid权重
-        main_container.grid_rowconfigure(2, weight=1)
+        main_container.grid_rowconfigure(3, weight=1)
         main_container.grid_columnconfigure(0, weight=1)
         
         # 标题栏
@@ -931,127 +4618,89 @@ class FileCleanerGUI:
         # 说明文字
         desc_label = ctk.CTkLabel(
             main_container,
-            text="这里显示最近的100条操作记录，您可以选择撤销某些操作。\n注意：已删除的文件无法恢复。",
+            text="这里显示所有未撤销的操作记录，您可以撤销单个操作或整次清理。\n注意：直接删除的文件无法恢复。",
             wraplength=250,
             font=ctk.CTkFont(family="Microsoft YaHei UI", size=11),
             text_color=("gray30", "gray80")
         )
         desc_label.grid(row=1, column=0, padx=10, pady=5, sticky="ew")
         
-        # 历史记录显示区域
-        history_frame = ctk.CTkScrollableFrame(
-            main_container,
-            corner_radius=8
+        # 搜索栏：输入时延迟查询，避免每个按键都查询一次数据库
+        search_frame = ctk.CTkFrame(main_container, fg_color="transparent")
+        search_frame.grid(row=2, column=0, sticky="ew", padx=10, pady=(5, 0))
+        search_frame.grid_columnconfigure(0, weight=1)
+        
+        self.history_search_entry = ctk.CTkEntry(
+            search_frame,
+            placeholder_text="搜索文件路径...",
+            height=30,
+            font=ctk.CTkFont(family="Microsoft YaHei UI", size=12)
         )
-        history_frame.grid(row=2, column=0, sticky="nsew", padx=10, pady=5)
+        self.history_search_entry.grid(row=0, column=0, columnspan=2, sticky="ew")
+        self.history_search_entry.bind("<KeyRelease>", lambda event: self.schedule_history_search())
         
-        # 添加历史记录内容
-        self.update_history_content(history_frame)
-    
-    def update_history_content(self, frame):
-        # 清除现有内容
-        for widget in frame.winfo_children():
-            widget.destroy()
+        self.history_type_var = ctk.StringVar(value="全部")
+        type_menu = ctk.CTkOptionMenu(
+            search_frame,
+            values=["全部", "重命名", "删除", "不可撤销的删除"],
+            variable=self.history_type_var,
+            width=120,
+            height=26,
+            font=ctk.CTkFont(family="Microsoft YaHei UI", size=11),
+            command=lambda value: self.schedule_history_search()
+        )
+        type_menu.grid(row=1, column=0, sticky="w", pady=(5, 0))
         
-        try:
-            operations = self.cleaner.history_db.get_recent_operations()
-            print(f"获取到 {len(operations)} 条历史记录")  # 添加调试信息
-            
-            if not operations:
-                no_records_label = ctk.CTkLabel(
-                    frame,
-                    text="暂无操作记录",
-                    font=ctk.CTkFont(family="Microsoft YaHei UI", size=14)
-                )
-                no_records_label.pack(pady=20)
-            else:
-                for op in operations:
-                    self.create_history_item(frame, op)
-        except Exception as e:
-            print(f"更新历史记录时发生错误: {e}")  # 添加错误日志
-            error_label = ctk.CTkLabel(
-                frame,
-                text=f"加载历史记录时发生错误: {str(e)}",
-                font=ctk.CTkFont(family="Microsoft YaHei UI", size=14),
-                text_color="red"
-            )
-            error_label.pack(pady=20)
+        self.history_reverted_var = ctk.BooleanVar(value=False)
+        reverted_check = ctk.CTkCheckBox(
+            search_frame,
+            text="包含已撤销",
+            variable=self.history_reverted_var,
+            font=ctk.CTkFont(family="Microsoft YaHei UI", size=11),
+            command=self.schedule_history_search
+        )
+        reverted_check.grid(row=1, column=1, sticky="e", pady=(5, 0))
+        
+        # 历史记录显示区域：只为可见的记录创建控件
+        self.history_view = HistoryListView(
+            main_container,
+            self.cleaner.history_db,
+            self.revert_history_operation,
+            self.revert_history_session
+        )
+        self.history_view.grid(row=3, column=0, sticky="nsew", padx=10, pady=5)
+        self.history_view.refresh()
     
-    def create_history_item(self, frame, operation):
-        try:
-            op_id, op_type, original_path, new_path, timestamp_str, is_reverted, session_id, details = operation
-            
-            # 将字符串转换为 datetime 对象
-            try:
-                timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-            except:
-                timestamp = datetime.now()  # 如果转换失败，使用当前时间
-            
-            # 为每个操作创建一个框架
-            op_frame = ctk.CTkFrame(
-                frame,
-                corner_radius=8,
-                fg_color=("gray85", "gray15")
-            )
-            op_frame.pack(fill="x", padx=5, pady=5)
-            
-            # 时间戳
-            time_label = ctk.CTkLabel(
-                op_frame,
-                text=f"{timestamp:%Y-%m-%d %H:%M:%S}",
-                font=ctk.CTkFont(family="Microsoft YaHei UI", size=12, weight="bold")
-            )
-            time_label.pack(anchor="w", padx=10, pady=(5, 0))
-            
-            # 操作详情
-            if op_type == "rename":
-                details_text = f"重命名:\n{os.path.basename(original_path)}\n→\n{os.path.basename(new_path)}"
-            else:
-                details_text = f"删除:\n{os.path.basename(original_path)}"
-            
-            if details:  # 如果有额外的详细信息
-                details_text += f"\n详情: {details}"
-            
-            op_details = ctk.CTkLabel(
-                op_frame,
-                text=details_text,
-                font=ctk.CTkFont(family="Microsoft YaHei UI", size=11),
-                justify="left",
-                wraplength=250
-            )
-            op_details.pack(anchor="w", padx=10, pady=(5, 5))
-            
-            # 只有未撤销的操作才显示撤销按钮
-            if not is_reverted:
-                revert_btn = ctk.CTkButton(
-                    op_frame,
-                    text="撤销",
-                    command=lambda o=operation: self.revert_history_operation(o),
-                    width=80,
-                    height=25,
-                    corner_radius=6,
-                    font=ctk.CTkFont(family="Microsoft YaHei UI", size=11),
-                    fg_color="#dc3545",
-                    hover_color="#c82333"
-                )
-                revert_btn.pack(anchor="w", padx=10, pady=(0, 5))
-            else:
-                status_label = ctk.CTkLabel(
-                    op_frame,
-                    text="已撤销",
-                    font=ctk.CTkFont(family="Microsoft YaHei UI", size=11),
-                    text_color="gray"
-                )
-                status_label.pack(anchor="w", padx=10, pady=(0, 5))
-        except Exception as e:
-            print(f"创建历史记录项时发生错误: {e}")
-            print(f"操作数据: {operation}")  # 添加更多调试信息
+    def schedule_history_search(self):
+        """输入停止 250 毫秒后再查询"""
+        if self.history_search_job is not None:
+            self.root.after_cancel(self.history_search_job)
+        self.history_search_job = self.root.after(250, self.apply_history_search)
+    
+    def apply_history_search(self):
+        self.history_search_job = None
+        text = self.history_search_entry.get().strip()
+        operation_type, reversible = {
+            "重命名": ("rename", None),
+            "删除": ("delete", None),
+            "不可撤销的删除": ("delete", False),
+        }.get(self.history_type_var.get(), (None, None))
+        include_reverted = self.history_reverted_var.get()
+        if not text and operation_type is None and not include_reverted:
+            self.history_view.set_filters(None)
+            return
+        self.history_view.set_filters({
+            "text": text or None,
+            "operation_type": operation_type,
+            "reversible": reversible,
+            "reverted": None if include_reverted else False
+        })
     
     def revert_history_operation(self, operation):
-        op_id, op_type, original_path, new_path, _, _, _, details = operation
+        op_type, original_path, new_path = operation[1:4]
         
         # 检查是否是不可撤销的删除操作
-        if op_type == "delete" and "不可撤销" in details:
+        if op_type == "delete" and not operation.reversible:
             messagebox.showwarning("警告", 
                 "此删除操作无法撤销，因为：\n"
                 "1. 系统不支持回收站功能\n"
@@ -1080,19 +4729,86 @@ class FileCleanerGUI:
                         "4. 恢复过程中发生错误\n\n"
                         "该操作已标记为已撤销。")
                 else:
-                    messagebox.showerror("错误", "撤销操作失败，可能是文件已经不存在或被移动")
+                    messagebox.showerror("错误", "撤销操作失败，可能是文件已经不存在、被移动，或原文件名已被其他文件占用")
             
             # 立即刷新历史记录
-            if self.current_sidebar == self.history_sidebar:
-                for child in self.history_sidebar.winfo_children():
-                    if isinstance(child, ctk.CTkFrame):
-                        for subchild in child.winfo_children():
-                            if isinstance(subchild, ctk.CTkScrollableFrame):
-                                self.update_history_content(subchild)
-                                # 强制更新显示
-                                self.history_sidebar.update()
-                                break
-                        break
+            self.refresh_history_sidebar()
+    
+    def revert_history_session(self, session_id):
+        """撤销一次清理会话中的全部操作，只确认一次，在后台线程中执行"""
+        if self.cleaning_thread is not None and self.cleaning_thread.is_alive():
+            messagebox.showwarning("警告", "请等待当前的清理或撤销完成")
+            return
+        
+        message = ("确定要撤销这次清理中的全部操作吗？\n"
+                   "重命名的文件将改回原名，删除的文件将尝试从回收站恢复。\n"
+                   "原文件名已被其他文件占用的重命名会被跳过。")
+        if not messagebox.askyesno("确认撤销", message):
+            return
+        
+        self.start_background_task(
+            lambda progress, cancel_event: self.cleaner.revert_session(session_id, progress, cancel_event),
+            "正在撤销...\n",
+            "取消撤销",
+            self.show_revert_progress,
+            self.show_revert_results,
+            "撤销过程中发生错误"
+        )
+    
+    def show_revert_progress(self, event):
+        self.result_text.delete("1.0", "end")
+        self.result_text.insert("end",
+            f"正在撤销... {event['done']}/{event['total']}\n\n"
+            f"改回原名: {event['renamed']} 个文件\n"
+            f"恢复: {event['restored']} 个文件\n"
+            f"跳过: {event['skipped']} 个文件\n"
+            f"错误: {event['errors']} 个\n"
+        )
+    
+    def show_revert_results(self, results):
+        title = "撤销已取消" if results["cancelled"] else "撤销完成"
+        self.full_report = lambda: self.iter_revert_report(results, title)
+        self.report_btn.configure(state="normal")
+        self.clear_log()
+        self.write_log(self.iter_revert_report(results, title, self.LOG_SECTION_LINES))
+        
+        self.refresh_history_sidebar()
+        
+        messagebox.showinfo("成功" if not results["cancelled"] else "已取消",
+            f"{title}！\n"
+            f"改回原名: {len(results['renamed'])} 个文件\n"
+            f"恢复: {len(results['restored'])} 个文件\n"
+            f"未能撤销: {len(results['skipped']) + len(results['errors'])} 个文件"
+        )
+    
+    def iter_revert_report(self, results, title, limit=None):
+        """逐行产生撤销结果的报告，limit 限制每类结果的条数"""
+        yield f"{title}！"
+        yield ""
+        sections = (
+            ("改回原名的文件：", results["renamed"], len(results["renamed"]),
+             lambda item: f"  {item[0]} -> {item[1]}"),
+            ("从回收站恢复的文件：", results["restored"], len(results["restored"]),
+             lambda name: f"  {name}"),
+            ("未能撤销的文件：", itertools.chain(results["skipped"], results["errors"]),
+             len(results["skipped"]) + len(results["errors"]), lambda item: f"  {item[0]} ({item[1]})"),
+        )
+        yield from self.iter_report_sections(sections, limit)
+    
+    def iter_report_sections(self, sections, limit):
+        """sections: [(标题, 记录, 记录数, 格式化函数)]；记录数超过 limit 时只列出前 limit 条"""
+        first = True
+        for heading, items, count, format_item in sections:
+            if not count:
+                continue
+            if not first:
+                yield ""
+            first = False
+            yield heading
+            for item in itertools.islice(items, limit):
+                yield format_item(item)
+            if limit is not None and count > limit:
+                yield f"  ……另有 {count - limit} 项，点击“保存完整报告”查看全部"
     
     def select_directory(self):
         directory = filedialog.askdirectory()
@@ -1120,61 +4836,241 @@ class FileCleanerGUI:
             text_color="#28a745"
         )
     
-    def start_cleaning(self):
+    def start_preview(self):
+        """预览（演练）模式：只生成清理计划并显示，不修改任何文件"""
+        self.start_cleaning(dry_run=True)
+    
+    def start_cleaning(self, dry_run=False):
         directory = self.path_entry.get().strip()
         if not directory or not os.path.isdir(directory):
             messagebox.showerror("错误", "请先选择有效的目录")
             return
         
-        try:
-            results = self.cleaner.clean_directory(directory)
-            
-            # 更新日志显示
-            self.result_text.delete("1.0", "end")
-            self.result_text.insert("end", "清理完成！\n\n")
-            
-            if results["renamed"]:
-                self.result_text.insert("end", "重命名的文件：\n")
-                for old_name, new_name in results["renamed"]:
-                    self.result_text.insert("end", f"  {old_name} -> {new_name}\n")
-            
-            if results["skipped"]:
-                self.result_text.insert("end", "\n跳过的文件：\n")
-                for old_name, new_name, reason in results["skipped"]:
-                    self.result_text.insert("end", f"  {old_name} -> {new_name} ({reason})\n")
-            
-            if results["deleted"]:
-                self.result_text.insert("end", "\n删除的快捷方式：\n")
-                for file in results["deleted"]:
-                    self.result_text.insert("end", f"  {file}\n")
-            
-            # 如果历史记录侧边栏已经打开，则更新其内容
-            if self.current_sidebar == self.history_sidebar:
-                for child in self.history_sidebar.winfo_children():
-                    if isinstance(child, ctk.CTkFrame):
-                        for subchild in child.winfo_children():
-                            if isinstance(subchild, ctk.CTkScrollableFrame):
-                                self.update_history_content(subchild)
-                                # 强制更新显示
-                                self.history_sidebar.update()
-                                break
-                        break
-            
-            # 显示成功消息，包含跳过的文件数量
-            messagebox.showinfo("成功", 
-                f"清理完成！\n"
-                f"重命名: {len(results['renamed'])} 个文件\n"
-                f"删除: {len(results['deleted'])} 个文件\n"
-                f"跳过: {len(results['skipped'])} 个文件"
-            )
+        run = self.cleaner.dry_run if dry_run else self.cleaner.clean_directory
+        self.start_background_task(
+            lambda progress, cancel_event: run(directory, progress=progress, cancel_event=cancel_event),
+            "正在生成预览...\n" if dry_run else "正在清理...\n",
+            "取消清理",
+            self.show_progress,
+            self.show_cleaning_results,
+            "清理过程中发生错误"
+        )
+    
+    def start_background_task(self, task, busy_text, cancel_text, on_progress, on_done, error_text):
+        """在后台线程中执行清理或撤销，主线程通过队列接收进度，界面保持响应
+
+        task(progress, cancel_event) 在后台线程中执行，返回值交给 on_done 在主线程中显示。
+        """
+        if self.cleaning_thread is not None and self.cleaning_thread.is_alive():
+            return False
+        
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.task_handlers = (on_progress, on_done, error_text)
+        self.cleaning_thread = threading.Thread(
+            target=self.cleaning_worker,
+            args=(task, self.progress_queue, self.cancel_event),
+            daemon=True
+        )
+        
+        self.clean_btn.configure(state="disabled")
+        self.preview_btn.configure(state="disabled")
+        self.cancel_btn.configure(state="normal", text=cancel_text)
+        self.cancel_btn.pack(pady=5)
+        self.progress_bar.pack(fill="x", padx=15, pady=(0, 5), before=self.result_text)
+        self.progress_bar.start()
+        self.clear_log()
+        self.result_text.insert("end", busy_text)
         
+        self.cleaning_thread.start()
+        self.root.after(100, self.poll_cleaning_progress)
+        return True
+    
+    def cleaning_worker(self, task, progress_queue, cancel_event):
+        """后台线程：执行任务，并把进度、结果或异常放入队列"""
+        try:
+            results = task(lambda event: progress_queue.put(("progress", event)), cancel_event)
+            progress_queue.put(("done", results))
         except Exception as e:
-            messagebox.showerror("错误", f"清理过程中发生错误：{str(e)}")
-            print(f"错误详情: {e}")
+            progress_queue.put(("error", e))
+    
+    def cancel_cleaning(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.cancel_btn.configure(state="disabled", text="正在取消...")
+    
+    def poll_cleaning_progress(self):
+        """在主线程中定期取出队列中的事件，只显示最新的进度"""
+        on_progress, on_done, error_text = self.task_handlers
+        latest = None
+        finished = None
+        try:
+            while True:
+                kind, payload = self.progress_queue.get_nowait()
+                if kind == "progress":
+                    latest = payload
+                else:
+                    finished = (kind, payload)
+        except queue.Empty:
+            pass
+        
+        if latest is not None:
+            on_progress(latest)
+        
+        if finished is None:
+            self.root.after(100, self.poll_cleaning_progress)
+            return
+        
+        self.progress_bar.stop()
+        self.progress_bar.pack_forget()
+        self.cancel_btn.pack_forget()
+        self.clean_btn.configure(state="normal")
+        self.preview_btn.configure(state="normal")
+        self.cleaning_thread = None
+        
+        kind, payload = finished
+        if kind == "error":
+            messagebox.showerror("错误", f"{error_text}：{str(payload)}")
+            print(f"错误详情: {payload}")
+        else:
+            on_done(payload)
+    
+    def show_progress(self, event):
+        self.result_text.delete("1.0", "end")
+        self.result_text.insert("end", 
+            f"正在清理...\n\n"
+            f"已扫描: {event['scanned']} 个文件\n"
+            f"重命名: {event['renamed']} 个文件\n"
+            f"跳过: {event['skipped']} 个文件\n"
+            f"删除: {event['deleted']} 个文件\n"
+        )
+        if event["directory"]:
+            self.result_text.insert("end", f"\n当前目录: {event['directory']}\n")
+    
+    def show_cleaning_results(self, results):
+        if results["dry_run"]:
+            title = "预览已取消" if results["cancelled"] else "预览完成（未修改任何文件）"
+            headings = ("将重命名的文件：", "将跳过的文件：", "将删除的快捷方式：")
+        else:
+            title = "清理已取消" if results["cancelled"] else "清理完成"
+            headings = ("重命名的文件：", "跳过的文件：", "删除的快捷方式：")
+        
+        # 更新日志显示：每类结果只显示前面一部分，分块插入，不阻塞界面
+        self.full_report = lambda: self.iter_cleaning_report(results, title, headings)
+        self.report_btn.configure(state="normal")
+        self.clear_log()
+        self.write_log(self.iter_cleaning_report(results, title, headings, self.LOG_SECTION_LINES))
+        
+        if results["dry_run"]:
+            return
+        
+        # 如果历史记录侧边栏已经打开，则更新其内容
+        self.refresh_history_sidebar()
+        
+        # 显示结果消息，包含跳过的文件数量
+        messagebox.showinfo("成功" if not results["cancelled"] else "已取消", 
+            f"{title}！\n"
+            f"重命名: {len(results['renamed'])} 个文件\n"
+            f"删除: {len(results['deleted'])} 个文件\n"
+            f"跳过: {len(results['skipped'])} 个文件\n"
+            f"耗时: {results['metrics']['total']['seconds']:.1f} 秒"
+        )
+    
+    def iter_cleaning_report(self, results, title, headings, limit=None):
+        """逐行产生清理（或预览）结果的报告，limit 限制每类结果的条数"""
+        yield f"{title}！"
+        yield ""
+        sections = (
+            (headings[0], results["renamed"], len(results["renamed"]),
+             lambda item: f"  {item[0]} -> {item[1]}"),
+            (headings[1], results["skipped"], len(results["skipped"]),
+             lambda item: f"  {item[0]} -> {item[1]} ({item[2]})"),
+            (headings[2], results["deleted"], len(results["deleted"]),
+             lambda name: f"  {name}"),
+            ("错误：", results["errors"], len(results["errors"]),
+             lambda item: f"  {item[0]}: {item[1]}"),
+        )
+        yield from self.iter_report_sections(sections, limit)
+        
+        metrics = format_metrics(results.get("metrics"))
+        if metrics:
+            yield ""
+            yield "耗时："
+            for line in metrics:
+                yield f"  {line}"
+    
+    def clear_log(self):
+        self.log_generation += 1
+        self.result_text.delete("1.0", "end")
+    
+    def write_log(self, lines):
+        """把 lines 中的文本行分块追加到日志
+
+        每次插入 LOG_CHUNK_LINES 行，之后通过 after 让出主线程，结果很多时界面也不会卡住；
+        日志超过 LOG_MAX_LINES 行时删除最早的行。clear_log 之后还没插入的行不再插入。
+        """
+        generation = self.log_generation
+        lines = iter(lines)
+        
+        def insert_chunk():
+            if generation != self.log_generation:
+                return
+            chunk = list(itertools.islice(lines, self.LOG_CHUNK_LINES))
+            if not chunk:
+                return
+            self.result_text.insert("end", "".join(f"{line}\n" for line in chunk))
+            excess = int(self.result_text.index("end-1c").split(".")[0]) - self.LOG_MAX_LINES
+            if excess > 0:
+                self.result_text.delete("1.0", f"{excess + 1}.0")
+            self.root.after(1, insert_chunk)
+        
+        insert_chunk()
+    
+    def save_full_report(self):
+        """把上一次清理或撤销的完整结果保存为文本文件，写入临时文件的记录在这里逐条读出"""
+        if self.full_report is None:
+            return
+        path = filedialog.asksaveasfilename(
+            title="保存完整报告",
+            initialfile="清理报告.txt",
+            defaultextension=".txt",
+            filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(f"{line}\n" for line in self.full_report())
+        except OSError as e:
+            messagebox.showerror("错误", f"保存报告失败：{e}")
+            return
+        messagebox.showinfo("成功", f"完整报告已保存到：{path}")
+    
+    def refresh_history_sidebar(self):
+        """历史记录侧边栏处于显示状态时刷新其内容"""
+        if self.history_sidebar is not None and self.current_sidebar == self.history_sidebar:
+            self.history_view.refresh()
+    
+    def on_close(self):
+        """关闭窗口时先取消正在进行的清理，等后台线程结束会话后再退出"""
+        if self.cleaning_thread is not None and self.cleaning_thread.is_alive():
+            self.cancel_cleaning()
+            self.root.after(100, self.on_close)
+            return
+        self.root.destroy()
     
     def run(self):
+        self.root.after_idle(self.report_first_frame)
         self.root.mainloop()
     
+    def report_first_frame(self):
+        """首帧绘制完成后记录启动耗时；设置 FILE_CLEANER_STARTUP_PROBE=1 时输出后立即退出（供启动耗时测量使用）"""
+        self.root.update_idletasks()
+        elapsed_ms = (time.perf_counter() - MODULE_START_TIME) * 1000
+        if os.environ.get("FILE_CLEANER_STARTUP_PROBE"):
+            print(f"first_frame_ms={elapsed_ms:.1f}", file=sys.stderr, flush=True)
+            self.root.destroy()
+    
     def save_settings(self, video_ext_entry, patterns_entry, shortcut_ext_entry, scan_subdirs_var, settings_window):
         new_config = {
             "video_extensions": [ext.strip() for ext in video_ext_entry.split(",")],
@@ -1199,6 +5095,465 @@ class FileCleanerGUI:
                     relheight=1.0
                 )
 
+def build_arg_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="file_cleaner",
+        description="批量清理文件名中的指定字符串并删除快捷方式文件。不带参数运行时启动图形界面。"
+    )
+    parser.add_argument("roots", nargs="*", help="要清理的目录，可以指定多个")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="只显示将要执行的操作，不修改任何文件")
+    parser.add_argument("--json", action="store_true", help="以 JSON Lines 格式输出每个操作和汇总")
+    parser.add_argument("-j", "--workers", type=int, help="并行执行文件操作的线程数（覆盖配置文件）")
+    parser.add_argument("-P", "--processes", type=int, metavar="N",
+                        help="用 N 个进程并行清理多个目录，全部目录记录为一个清理会话")
+    subdirs = parser.add_mutually_exclusive_group()
+    subdirs.add_argument("--subdirs", dest="scan_subdirectories", action="store_true", default=None,
+                         help="扫描子目录（覆盖配置文件）")
+    subdirs.add_argument("--no-subdirs", dest="scan_subdirectories", action="store_false",
+                         help="不扫描子目录（覆盖配置文件）")
+    parser.add_argument("--full-rescan", action="store_true", help="忽略目录状态缓存，完整扫描所有目录")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="清除指定目录（不指定时为全部目录）的目录状态缓存后退出，下次清理时完整扫描")
+    parser.add_argument("--on-conflict", choices=list(COLLISION_STRATEGIES),
+                        help="重命名的目标文件已存在时：skip 跳过，suffix 添加编号，keep_newer / keep_larger "
+                             "保留较新 / 较大的文件并把另一个移至回收站（覆盖配置文件）")
+    parser.add_argument("--config", default="cleaner_config.json", help="配置文件路径")
+    parser.add_argument("--history-db", default="cleaner_history.db", help="历史记录数据库路径")
+    parser.add_argument("--save-plan", metavar="FILE", help="把清理计划保存到文件而不执行（仅支持单个目录）")
+    parser.add_argument("--apply-plan", metavar="FILE", help="执行之前用 --save-plan 保存的计划")
+    parser.add_argument("--list-sessions", action="store_true", help="列出最近的清理会话")
+    parser.add_argument("--revert-session", metavar="SESSION_ID", help="撤销一次清理会话中的全部操作")
+    parser.add_argument("--maintenance", action="store_true",
+                        help="立即按保留策略归档旧的历史记录、压缩详情并回收数据库空间")
+    parser.add_argument("--watch", action="store_true",
+                        help="持续监视目录，清理新出现的文件，按 Ctrl+C 停止（仅支持单个目录）")
+    parser.add_argument("--debounce", type=float, metavar="SECONDS",
+                        help="监视模式下文件最后一次变化后等待的秒数（覆盖配置文件）")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="用 cProfile 分析本次运行，把 pstats 统计保存到 FILE 并在标准错误输出耗时最多的函数"
+                             "（文件操作线程中的调用不在统计中，需要时加 -j 1）")
+    return parser
+
+class CommandLineRunner:
+    """命令行模式：不加载任何图形界面模块，适合计划任务中批量清理多个目录"""
+    
+    # 退出码
+    EXIT_OK = 0
+    EXIT_ERRORS = 1       # 部分文件操作失败或某个目录清理出错
+    EXIT_USAGE = 2        # 参数错误或目录不存在
+    EXIT_CANCELLED = 130  # 被 Ctrl+C 取消
+    
+    def __init__(self, args, out=None):
+        self.args = args
+        self.out = out or sys.stdout
+        self.cancel_event = threading.Event()
+        self.cleaner = FileCleaner(config_file=args.config, db_file=args.history_db)
+        config = self.cleaner.config
+        if args.workers is not None:
+            config.override("worker_threads", args.workers)
+        if args.scan_subdirectories is not None:
+            config.override("scan_subdirectories", args.scan_subdirectories)
+        if args.full_rescan:
+            config.override("incremental_scan", False)
+        if args.on_conflict is not None:
+            config.override("collision_strategy", args.on_conflict)
+    
+    def check_conflicts(self):
+        """返回参数冲突的说明，没有冲突时返回 None；会被忽略的参数组合一律拒绝，而不是悄悄忽略"""
+        args = self.args
+        actions = [name for name, given in (
+            ("--list-sessions", args.list_sessions),
+            ("--maintenance", args.maintenance),
+            ("--clear-cache", args.clear_cache),
+            ("--revert-session", args.revert_session),
+            ("--apply-plan", args.apply_plan),
+            ("--save-plan", args.save_plan),
+            ("--watch", args.watch),
+        ) if given]
+        if len(actions) > 1:
+            return f"{actions[0]} 不能与 {actions[1]} 同时使用"
+        action = actions[0] if actions else None
+        if action in ("--list-sessions", "--maintenance", "--revert-session", "--apply-plan") and args.roots:
+            return f"{action} 不能与目录参数同时使用"
+        if action in ("--list-sessions", "--maintenance", "--clear-cache", "--revert-session", "--watch") and args.dry_run:
+            return f"{action} 不能与 --dry-run 同时使用"
+        if args.processes and (action or args.dry_run):
+            return f"-P/--processes 只用于直接清理目录，不能与 {action or '--dry-run'} 同时使用"
+        if action in ("--save-plan", "--watch") and len(args.roots) != 1:
+            return f"{action} 只能用于单个目录"
+        return None
+    
+    def run(self):
+        args = self.args
+        conflict = self.check_conflicts()
+        if conflict:
+            return self.usage_error(conflict)
+        if args.list_sessions:
+            return self.list_sessions()
+        if args.maintenance:
+            return self.run_maintenance()
+        if args.clear_cache:
+            return self.clear_cache()
+        if not args.apply_plan:
+            for root in args.roots:
+                if not os.path.isdir(root):
+                    return self.usage_error(f"目录不存在: {root}")
+        
+        # 第一次 Ctrl+C 只请求取消，让当前会话正常结束；第二次直接中断
+        previous_handler = signal.signal(signal.SIGINT, self.handle_interrupt)
+        try:
+            if args.watch:
+                # 监视模式只能通过 Ctrl+C 结束，正常停止不算取消
+                return self.watch_root(args.roots[0])
+            if args.revert_session:
+                exit_code = self.revert_session(args.revert_session)
+            elif args.apply_plan:
+                exit_code = self.run_saved_plan(args.apply_plan)
+            elif args.save_plan:
+                exit_code = self.save_plan(args.roots[0], args.save_plan)
+            elif args.processes:
+                exit_code = self.clean_roots(args.roots)
+            else:
+                exit_code = self.EXIT_OK
+                for root in args.roots:
+                    if self.cancel_event.is_set():
+                        break
+                    exit_code = max(exit_code, self.clean_root(root))
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+        
+        if self.cancel_event.is_set():
+            return self.EXIT_CANCELLED
+        return exit_code
+    
+    def handle_interrupt(self, signum, frame):
+        if self.cancel_event.is_set():
+            raise KeyboardInterrupt
+        self.cancel_event.set()
+        print("正在取消，再次按 Ctrl+C 强制退出...", file=sys.stderr)
+    
+    def usage_error(self, message):
+        print(f"错误: {message}", file=sys.stderr)
+        return self.EXIT_USAGE
+    
+    def clean_root(self, root):
+        try:
+            if self.args.dry_run:
+                if self.args.json:
+                    # 演练模式下直接输出计划中的每个操作（完整路径）
+                    results = self.cleaner.new_results(dry_run=True)
+                    for op in self.cleaner.plan(root, cancel_event=self.cancel_event):
+                        self.emit({"event": "planned", "root": root, **op.to_dict()})
+                        self.count_planned(results, op)
+                    self.report(root, results)
+                    return self.EXIT_OK
+                results = self.cleaner.dry_run(root, cancel_event=self.cancel_event)
+            else:
+                results = self.cleaner.clean_directory(root, cancel_event=self.cancel_event)
+        except Exception as e:
+            self.emit_error(root, e)
+            return self.EXIT_ERRORS
+        
+        self.report(root, results)
+        return self.EXIT_ERRORS if results["errors"] else self.EXIT_OK
+    
+    def clean_roots(self, roots):
+        try:
+            results = self.cleaner.clean_roots(roots, processes=self.args.processes, cancel_event=self.cancel_event)
+        except Exception as e:
+            self.emit_error(os.pathsep.join(roots), e)
+            return self.EXIT_ERRORS
+        
+        for root, root_results in results["roots"].items():
+            self.report(root, root_results)
+        if self.args.json:
+            self.emit({
+                "event": "session_summary",
+                "roots": list(results["roots"]),
+                "cancelled": results["cancelled"],
+                "renamed": len(results["renamed"]),
+                "skipped": len(results["skipped"]),
+                "deleted": len(results["deleted"]),
+                "errors": len(results["errors"]),
+                "metrics": results.get("metrics")
+            })
+        else:
+            print(f"全部 {len(results['roots'])} 个目录: 重命名 {len(results['renamed'])} 个文件, "
+                  f"删除 {len(results['deleted'])} 个文件, 跳过 {len(results['skipped'])} 个文件, "
+                  f"错误 {len(results['errors'])} 个", file=self.out)
+            self.report_metrics(results)
+        return self.EXIT_ERRORS if results["errors"] else self.EXIT_OK
+    
+    def save_plan(self, root, plan_file):
+        try:
+            count = self.cleaner.save_plan(self.cleaner.plan(root, cancel_event=self.cancel_event), plan_file, root)
+        except Exception as e:
+            self.emit_error(root, e)
+            return self.EXIT_ERRORS
+        if self.args.json:
+            self.emit({"event": "plan_saved", "root": root, "file": plan_file, "operations": count})
+        else:
+            print(f"已保存清理计划: {plan_file} ({count} 个操作)", file=self.out)
+        return self.EXIT_OK
+    
+    def run_saved_plan(self, plan_file):
+        try:
+            directory, operations = self.cleaner.load_plan(plan_file)
+            if self.args.dry_run:
+                results = self.cleaner.new_results(dry_run=True)
+                for op in operations:
+                    self.count_planned(results, op)
+            else:
+                results = self.cleaner.apply(operations, directory, cancel_event=self.cancel_event, verify=True)
+        except Exception as e:
+            self.emit_error(plan_file, e)
+            return self.EXIT_ERRORS
+        self.report(directory, results)
+        return self.EXIT_ERRORS if results["errors"] else self.EXIT_OK
+    
+    def list_sessions(self):
+        history_db = self.cleaner.history_db
+        for session_id, start_time, _, directory, renamed, deleted, status in history_db.get_cleaning_sessions():
+            metrics = history_db.get_session_metrics(session_id)
+            if self.args.json:
+                self.emit({"event": "session", "session_id": session_id, "start_time": start_time,
+                           "directory": directory, "renamed": renamed, "deleted": deleted, "status": status,
+                           "metrics": metrics or None})
+            else:
+                print(f"{session_id}  {datetime.fromtimestamp(start_time):%Y-%m-%d %H:%M:%S}  {status}  "
+                      f"重命名 {renamed}, 删除 {deleted}  {directory}", file=self.out)
+                lines = format_metrics(metrics)
+                if lines:
+                    print(f"  耗时: {', '.join(lines)}", file=self.out)
+        return self.EXIT_OK
+    
+    def run_maintenance(self):
+        try:
+            summary = self.cleaner.run_history_maintenance(force=True)
+        except Exception as e:
+            self.emit_error(self.args.history_db, e)
+            return self.EXIT_ERRORS
+        if self.args.json:
+            self.emit({"event": "maintenance", **summary})
+        else:
+            print(f"历史记录维护完成: 归档 {summary['archived_sessions']} 个会话 "
+                  f"({summary['archived_operations']} 条记录), 删除 {summary['dropped_operations']} 条记录, "
+                  f"压缩 {summary['compacted']} 条详情, 释放 {summary['freed_pages']} 个页面", file=self.out)
+        return self.EXIT_OK
+    
+    def clear_cache(self):
+        roots = [os.path.abspath(root) for root in self.args.roots]
+        try:
+            cleared = sum(self.cleaner.history_db.clear_directory_cache(root) for root in roots or [None])
+        except Exception as e:
+            self.emit_error(self.args.history_db, e)
+            return self.EXIT_ERRORS
+        if self.args.json:
+            self.emit({"event": "cache_cleared", "roots": roots, "directories": cleared})
+        else:
+            print(f"已清除 {cleared} 个目录的目录状态缓存", file=self.out)
+        return self.EXIT_OK
+    
+    def watch_root(self, root):
+        def show_status(status):
+            if self.args.json:
+                self.emit({"event": "watch_status", "root": root, **status})
+                return
+            line = f"\r等待中 {status['pending']} 个, 已处理 {status['processed']} 个"
+            if status["avg_latency"] is not None:
+                line += f", 平均延迟 {status['avg_latency']:.2f} s"
+            print(line, end="", file=sys.stderr, flush=True)
+        
+        def show_batch(results):
+            if not self.args.json:
+                # 结束状态行
+                print(file=sys.stderr)
+            self.report_operations(root, results)
+            self.out.flush()
+        
+        if not self.args.json:
+            print(f"正在监视 {root}，按 Ctrl+C 停止", file=sys.stderr)
+        try:
+            summary = self.cleaner.watch(
+                root,
+                progress=WatchProgress(show_status),
+                cancel_event=self.cancel_event,
+                debounce=self.args.debounce,
+                on_batch=show_batch
+            )
+        except Exception as e:
+            self.emit_error(root, e)
+            return self.EXIT_ERRORS
+        
+        if self.args.json:
+            self.emit({"event": "watch_summary", "root": root, **summary})
+        else:
+            print(file=sys.stderr)
+            print(f"{root}: 监视已停止", file=self.out)
+            print(f"  重命名: {summary['renamed']} 个文件, 删除: {summary['deleted']} 个文件, "
+                  f"跳过: {summary['skipped']} 个文件, 错误: {summary['errors']} 个", file=self.out)
+            if summary["processed"]:
+                print(f"  从文件出现到处理完毕: 平均 {summary['avg_latency']:.2f} s, "
+                      f"最长 {summary['max_latency']:.2f} s", file=self.out)
+        return self.EXIT_ERRORS if summary["errors"] else self.EXIT_OK
+    
+    def revert_session(self, session_id):
+        def show_progress(event):
+            print(f"\r已撤销 {event['done']}/{event['total']}", end="", file=sys.stderr, flush=True)
+        
+        try:
+            results = self.cleaner.revert_session(
+                session_id,
+                progress=None if self.args.json else show_progress,
+                cancel_event=self.cancel_event
+            )
+        except Exception as e:
+            self.emit_error(session_id, e)
+            return self.EXIT_ERRORS
+        results["cancelled"] = results["cancelled"] or self.cancel_event.is_set()
+        
+        if self.args.json:
+            for new_name, original_name in results["renamed"]:
+                self.emit({"event": "unrename", "session_id": session_id, "name": new_name, "original_name": original_name})
+            for name in results["restored"]:
+                self.emit({"event": "restore", "session_id": session_id, "name": name})
+            for name, reason in results["skipped"]:
+                self.emit({"event": "skip", "session_id": session_id, "name": name, "reason": reason})
+            for name, message in results["errors"]:
+                self.emit({"event": "error", "session_id": session_id, "name": name, "message": message})
+            self.emit({
+                "event": "revert_summary",
+                "session_id": session_id,
+                "cancelled": results["cancelled"],
+                "renamed": len(results["renamed"]),
+                "restored": len(results["restored"]),
+                "skipped": len(results["skipped"]),
+                "errors": len(results["errors"])
+            })
+        else:
+            print(file=sys.stderr)
+            print(f"{session_id}: {'撤销已取消' if results['cancelled'] else '撤销完成'}", file=self.out)
+            for new_name, original_name in results["renamed"]:
+                print(f"  改回原名: {new_name} -> {original_name}", file=self.out)
+            for name in results["restored"]:
+                print(f"  已恢复: {name}", file=self.out)
+            for name, reason in results["skipped"]:
+                print(f"  跳过: {name} ({reason})", file=self.out)
+            for name, message in results["errors"]:
+                print(f"  错误: {name}: {message}", file=self.out)
+            print(f"  改回原名: {len(results['renamed'])} 个文件, 恢复: {len(results['restored'])} 个文件, "
+                  f"跳过: {len(results['skipped'])} 个, 错误: {len(results['errors'])} 个", file=self.out)
+        return self.EXIT_ERRORS if results["errors"] else self.EXIT_OK
+    
+    def count_planned(self, results, op):
+        name = os.path.basename(op.path)
+        if op.kind == "rename":
+            results["renamed"].append((name, os.path.basename(op.new_path)))
+        elif op.kind == "skip":
+            results["skipped"].append((name, os.path.basename(op.new_path), op.reason))
+        elif op.kind == "delete":
+            results["deleted"].append(name)
+    
+    def report(self, root, results):
+        results["cancelled"] = results["cancelled"] or self.cancel_event.is_set()
+        if self.args.json:
+            if not results["dry_run"]:
+                self.report_operations(root, results)
+            self.emit({
+                "event": "summary",
+                "root": root,
+                "dry_run": results["dry_run"],
+                "cancelled": results["cancelled"],
+                "renamed": len(results["renamed"]),
+                "skipped": len(results["skipped"]),
+                "deleted": len(results["deleted"]),
+                "errors": len(results["errors"]),
+                "metrics": results.get("metrics")
+            })
+            return
+        
+        if results["dry_run"]:
+            title = "预览已取消" if results["cancelled"] else "预览完成（未修改任何文件）"
+        else:
+            title = "清理已取消" if results["cancelled"] else "清理完成"
+        print(f"{root}: {title}", file=self.out)
+        self.report_operations(root, results)
+        print(f"  重命名: {len(results['renamed'])} 个文件, 删除: {len(results['deleted'])} 个文件, "
+              f"跳过: {len(results['skipped'])} 个文件, 错误: {len(results['errors'])} 个", file=self.out)
+        self.report_metrics(results)
+    
+    def report_metrics(self, results):
+        """输出各阶段的耗时统计（多进程清理时每个目录的结果没有统计）"""
+        lines = format_metrics(results.get("metrics"))
+        if lines:
+            print(f"  耗时: {', '.join(lines)}", file=self.out)
+    
+    def report_operations(self, root, results):
+        """逐条输出结果汇总中的操作"""
+        if self.args.json:
+            for old_name, new_name in results["renamed"]:
+                self.emit({"event": "rename", "root": root, "name": old_name, "new_name": new_name})
+            for old_name, new_name, reason in results["skipped"]:
+                self.emit({"event": "skip", "root": root, "name": old_name, "new_name": new_name, "reason": reason})
+            for name in results["deleted"]:
+                self.emit({"event": "delete", "root": root, "name": name})
+            for name, message in results["errors"]:
+                self.emit({"event": "error", "root": root, "name": name, "message": message})
+            return
+        for old_name, new_name in results["renamed"]:
+            print(f"  重命名: {old_name} -> {new_name}", file=self.out)
+        for old_name, new_name, reason in results["skipped"]:
+            print(f"  跳过: {old_name} -> {new_name} ({reason})", file=self.out)
+        for name in results["deleted"]:
+            print(f"  删除: {name}", file=self.out)
+        for name, message in results["errors"]:
+            print(f"  错误: {name}: {message}", file=self.out)
+    
+    def emit(self, record):
+        self.out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.out.flush()
+    
+    def emit_error(self, root, error):
+        if self.args.json:
+            self.emit({"event": "error", "root": root, "message": str(error)})
+        else:
+            print(f"{root}: 清理过程中发生错误: {error}", file=sys.stderr)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        # 不带参数时启动图形界面
+        app = FileCleanerGUI()
+        app.run()
+        return 0
+    
+    args = build_arg_parser().parse_args(argv)
+    if not (args.roots or args.apply_plan or args.revert_session or args.list_sessions or args.maintenance
+            or args.clear_cache):
+        build_arg_parser().print_usage(sys.stderr)
+        return CommandLineRunner.EXIT_USAGE
+    out = sys.stdout
+    if args.json:
+        # 核心代码的诊断信息通过 print 输出，JSON 模式下改写到标准错误，保证标准输出只有 JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            return run_profiled(CommandLineRunner(args, out).run, args.profile)
+    return run_profiled(CommandLineRunner(args, out).run, args.profile)
+
+def run_profiled(func, stats_file=None):
+    """调用 func；指定 stats_file 时在 cProfile 下运行，保存 pstats 统计并输出累计耗时最多的函数"""
+    if not stats_file:
+        return func()
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(stats_file)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(25)
+        print(f"性能分析结果已保存到 {stats_file}，可以用 python -m pstats {stats_file} 查看", file=sys.stderr)
+
 if __name__ == "__main__":
-    app = FileCleanerGUI()
-    app.run() 
\ No newline at end of file
+    sys.exit(main()) 
\ No newline at end of file
@@ -0,0 +1,48 @@
+import contextlib
+import io
+import json
+import os
+
+import pytest
+
+from file_cleaner import FileCleaner, LocalFileOperations
+
+BASE_CONFIG = {
+    "target_extensions": [".mp4", ".srt"],
+    "remove_patterns": ["javdb.com@"],
+    "cleanup_extensions": [".url"],
+    "scan_subdirectories": True,
+    "incremental_scan": False,
+}
+
+
+def touch(path, data=b"", mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def tree(tmp_path):
+    path = tmp_path / "tree"
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def make_cleaner(tmp_path, monkeypatch):
+    """返回 make(trash=None, **config)：用临时目录中的配置文件、历史数据库和回收站（XDG_DATA_HOME）创建 FileCleaner"""
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "xdg"))
+
+    def make(trash=None, **config):
+        config_file = tmp_path / "cleaner_config.json"
+        config_file.write_text(json.dumps({**BASE_CONFIG, **config}, ensure_ascii=False), encoding="utf-8")
+        file_ops = LocalFileOperations(trash) if trash is not None else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            return FileCleaner(file_ops=file_ops, config_file=str(config_file),
+                               db_file=str(tmp_path / "history.db"), trash=trash)
+
+    return make
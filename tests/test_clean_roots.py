@@ -0,0 +1,91 @@
+import os
+import sqlite3
+
+import pytest
+
+import file_cleaner
+from file_cleaner import FileCleaner, LocalFileOperations, STATUS_PENDING
+from tests.conftest import touch
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="需要 fork 启动的工作进程继承测试中的替换")
+
+
+def make_roots(tree, count=3):
+    roots = []
+    for i in range(count):
+        root = os.path.join(tree, f"root{i}")
+        touch(os.path.join(root, f"javdb.com@ABC{i}.mp4"))
+        touch(os.path.join(root, "site.url"))
+        roots.append(root)
+    return roots
+
+
+def status_codes(cleaner):
+    with sqlite3.connect(cleaner.history_db.db_file) as conn:
+        return [row[0] for row in conn.execute("SELECT status_code FROM operations")]
+
+
+def last_session(cleaner):
+    return cleaner.history_db.get_cleaning_sessions(limit=1)[0]
+
+
+def test_clean_roots(make_cleaner, tree):
+    roots = make_roots(tree)
+    cleaner = make_cleaner()
+    results = cleaner.clean_roots(roots, processes=2)
+    assert len(results["renamed"]) == 3 and len(results["deleted"]) == 3
+    assert sorted(results["roots"]) == roots
+    assert STATUS_PENDING not in status_codes(cleaner)
+    assert last_session(cleaner)[6] == "已完成"
+
+
+def test_failed_unit_records_are_complete(make_cleaner, tree, monkeypatch):
+    roots = make_roots(tree)
+    apply_to_writer = FileCleaner._apply_to_writer
+
+    def failing_apply(self, plan, writer, results, progress, cancel_event=None, verify=False):
+        apply_to_writer(self, plan, writer, results, progress, cancel_event, verify)
+        raise RuntimeError("工作单元出错")
+
+    monkeypatch.setattr(FileCleaner, "_apply_to_writer", failing_apply)
+    cleaner = make_cleaner()
+    results = cleaner.clean_roots(roots, processes=2)
+    # 出错的单元已经执行的操作都有结果，不会停留在待执行状态
+    assert sorted(path for path, _ in results["errors"]) == roots
+    assert all(os.path.exists(os.path.join(root, f"ABC{i}.mp4")) for i, root in enumerate(roots))
+    assert STATUS_PENDING not in status_codes(cleaner)
+    assert last_session(cleaner)[6] == "已完成"
+
+
+def test_lost_worker_does_not_hang(make_cleaner, tree, monkeypatch):
+    roots = make_roots(tree, count=1)
+
+    def crash(self, src, dst):
+        os._exit(1)
+
+    monkeypatch.setattr(LocalFileOperations, "rename", crash)
+    cleaner = make_cleaner()
+    results = cleaner.clean_roots(roots, processes=1)
+    assert [path for path, _ in results["errors"]] == roots
+    assert last_session(cleaner)[2] is not None
+
+
+def test_parent_error_stops_workers(make_cleaner, tree, monkeypatch):
+    roots = make_roots(tree)
+    cleaner = make_cleaner()
+
+    def broken_insert(rows):
+        raise KeyboardInterrupt
+
+    writer = cleaner.history_db.open_session_writer
+
+    def open_writer(*args, **kwargs):
+        result = writer(*args, **kwargs)
+        monkeypatch.setattr(result, "apply_outcomes", lambda *a: broken_insert(a))
+        return result
+
+    monkeypatch.setattr(cleaner.history_db, "open_session_writer", open_writer)
+    with pytest.raises(KeyboardInterrupt):
+        cleaner.clean_roots(roots, processes=2)
+    session = last_session(cleaner)
+    assert session[6] == "出错" and session[2] is not None
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+import file_cleaner
+from file_cleaner import DirectoryBatch, REASON_TARGET_EXISTS, _folds_case, _rename_noreplace
+from tests.conftest import touch
+
+
+def listing(directory):
+    return sorted(os.listdir(directory))
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_skip_keeps_both_files(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"new")
+    touch(os.path.join(tree, "ABC.mp4"), b"old")
+    results = make_cleaner(collision_strategy="skip").clean_directory(tree)
+    assert [item[2] for item in results["skipped"]] == ["目标文件已存在"]
+    assert listing(tree) == ["ABC.mp4", "javdb.com@ABC.mp4"]
+
+
+def test_suffix_picks_the_first_free_name(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"new")
+    touch(os.path.join(tree, "ABC.mp4"))
+    touch(os.path.join(tree, "ABC (2).mp4"))
+    results = make_cleaner(collision_strategy="suffix").clean_directory(tree)
+    assert list(results["renamed"]) == [("javdb.com@ABC.mp4", "ABC (3).mp4")]
+    assert read(os.path.join(tree, "ABC (3).mp4")) == b"new"
+
+
+def test_suffix_between_files_of_one_directory(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    touch(os.path.join(tree, "javbus.com@ABC.mp4"))
+    make_cleaner(collision_strategy="suffix", remove_patterns=["javdb.com@", "javbus.com@"]).clean_directory(tree)
+    assert listing(tree) == ["ABC (2).mp4", "ABC.mp4"]
+
+
+@pytest.mark.parametrize("incoming_wins", [True, False])
+def test_keep_newer(make_cleaner, tree, incoming_wins):
+    incoming = touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"incoming", mtime=2000 if incoming_wins else 1000)
+    touch(os.path.join(tree, "ABC.mp4"), b"existing", mtime=1000 if incoming_wins else 2000)
+    cleaner = make_cleaner(collision_strategy="keep_newer")
+    results = cleaner.clean_directory(tree)
+    assert listing(tree) == ["ABC.mp4"]
+    assert read(os.path.join(tree, "ABC.mp4")) == (b"incoming" if incoming_wins else b"existing")
+    assert len(results["deleted"]) == 1 and not results["errors"]
+
+    # 被替换的文件在回收站中，撤销后恢复原样
+    session_id = cleaner.history_db.get_cleaning_sessions(limit=1)[0][0]
+    reverted = cleaner.revert_session(session_id)
+    assert not reverted["errors"]
+    assert listing(tree) == ["ABC.mp4", "javdb.com@ABC.mp4"]
+    assert read(incoming) == b"incoming"
+
+
+def test_keep_larger_between_files_of_one_directory(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"small")
+    touch(os.path.join(tree, "javbus.com@ABC.mp4"), b"much larger")
+    cleaner = make_cleaner(collision_strategy="keep_larger", remove_patterns=["javdb.com@", "javbus.com@"])
+    cleaner.clean_directory(tree)
+    assert listing(tree) == ["ABC.mp4"]
+    assert read(os.path.join(tree, "ABC.mp4")) == b"much larger"
+
+
+def test_keep_newer_skips_directories(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    os.mkdir(os.path.join(tree, "ABC.mp4"))
+    ops = list(make_cleaner(collision_strategy="keep_newer", scan_subdirectories=False).plan(tree))
+    assert [(op.kind, op.reason_code) for op in ops] == [("skip", REASON_TARGET_EXISTS)]
+
+
+def test_case_probe_follows_the_filesystem(tmp_path, monkeypatch):
+    touch(str(tmp_path / "Movie.mp4"))
+    # 平台默认值只在目录中没有可探测的名称时使用
+    monkeypatch.setattr(file_cleaner, "CASE_INSENSITIVE_NAMES", True)
+    folds = os.path.exists(str(tmp_path / "MOVIE.MP4"))
+    assert _folds_case(str(tmp_path), {"Movie.mp4"}) is folds
+    assert _folds_case(str(tmp_path), {"123"}) is True
+
+
+def test_case_insensitive_directory(make_cleaner, tree, monkeypatch):
+    # 模拟不区分大小写的挂载（vfat、SMB）
+    monkeypatch.setattr(file_cleaner, "_folds_case", lambda directory, names: True)
+    touch(os.path.join(tree, "javdb.com@abc.mp4"))
+    touch(os.path.join(tree, "ABC.mp4"))
+    touch(os.path.join(tree, "DEF.mp4"))
+    cleaner = make_cleaner(rename_rules=[{"pattern": "DEF", "replace": "def"}])
+    ops = {os.path.basename(op.path): op for op in cleaner.plan(tree)}
+    assert ops["javdb.com@abc.mp4"].kind == "skip"
+    # 只改变大小写的重命名不与文件自己冲突
+    assert ops["DEF.mp4"].kind == "rename"
+
+
+def test_batch_keys_are_exact_on_case_sensitive_filesystems(monkeypatch):
+    monkeypatch.setattr(file_cleaner, "_folds_case", lambda directory, names: False)
+    batch = DirectoryBatch("/videos", [], {"ABC.mp4"})
+    assert batch.contains("ABC.mp4") and not batch.contains("abc.mp4")
+
+
+def test_batch_keeps_names_on_case_insensitive_filesystems(monkeypatch):
+    monkeypatch.setattr(file_cleaner, "_folds_case", lambda directory, names: True)
+    names = {"ABC.mp4", "abc.MP4", "Sub"}
+    batch = DirectoryBatch("/videos", [], names)
+    assert batch.contains("abc.mp4") and batch.contains("sub")
+    # 查找使用单独的小写集合，names 仍然是目录中的原始名称（目录状态缓存记录它的条目数）
+    assert batch.names == {"ABC.mp4", "abc.MP4", "Sub"}
+    batch.record_rename("Sub", "New")
+    assert batch.contains("NEW") and not batch.contains("sub")
+    assert batch.names == {"ABC.mp4", "abc.MP4", "New"}
+
+
+@pytest.mark.parametrize("fallback", [None, "link", "check"])
+def test_rename_never_overwrites(monkeypatch, tmp_path, fallback):
+    if fallback is not None:
+        monkeypatch.setattr(file_cleaner, "_libc_renameat2", lambda: None)
+    if fallback == "check":
+        def no_links(*args, **kwargs):
+            raise PermissionError("不支持硬链接")
+        monkeypatch.setattr(os, "link", no_links)
+    source = touch(str(tmp_path / "a.mp4"), b"source")
+    target = touch(str(tmp_path / "b.mp4"), b"target")
+    with pytest.raises(FileExistsError):
+        _rename_noreplace(source, target)
+    assert read(source) == b"source" and read(target) == b"target"
+    _rename_noreplace(source, str(tmp_path / "c.mp4"))
+    assert listing(tmp_path) == ["b.mp4", "c.mp4"]
+
+
+def test_target_created_after_planning_is_not_overwritten(make_cleaner, tree, tmp_path):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"new")
+    cleaner = make_cleaner()
+    plan_file = str(tmp_path / "plan.jsonl")
+    cleaner.save_plan(cleaner.plan(tree), plan_file, tree)
+    touch(os.path.join(tree, "ABC.mp4"), b"old")
+    # 不重新检查磁盘时由重命名本身拒绝覆盖
+    results = cleaner.apply(cleaner.load_plan(plan_file)[1], tree)
+    assert not list(results["renamed"])
+    assert list(results["errors"]) == [("javdb.com@ABC.mp4", "目标文件已存在: ABC.mp4")]
+    assert read(os.path.join(tree, "ABC.mp4")) == b"old"
+    assert read(os.path.join(tree, "javdb.com@ABC.mp4")) == b"new"
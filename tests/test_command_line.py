@@ -0,0 +1,56 @@
+import io
+import json
+import os
+
+import pytest
+
+from file_cleaner import CommandLineRunner, build_arg_parser
+from tests.conftest import touch
+
+
+def run(cleaner, *argv):
+    args = build_arg_parser().parse_args(["--config", cleaner.config.config_file,
+                                          "--history-db", cleaner.history_db.db_file, *argv])
+    out = io.StringIO()
+    return CommandLineRunner(args, out).run(), out.getvalue()
+
+
+def test_list_sessions_shows_metrics(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    cleaner = make_cleaner()
+    cleaner.clean_directory(tree)
+    code, out = run(cleaner, "--list-sessions", "--json")
+    session, = [json.loads(line) for line in out.splitlines()]
+    assert code == CommandLineRunner.EXIT_OK
+    assert session["renamed"] == 1 and session["metrics"]["rename"]["count"] == 1
+    assert session["metrics"]["total"]["seconds"] > 0
+    code, out = run(cleaner, "--list-sessions")
+    assert "耗时: 遍历目录" in out and "重命名: " in out
+
+
+@pytest.mark.parametrize("argv", [
+    ["--list-sessions", "{tree}"],
+    ["--maintenance", "{tree}"],
+    ["--list-sessions", "--maintenance"],
+    ["--revert-session", "20240101_000000_000000", "--dry-run"],
+    ["--clear-cache", "--dry-run"],
+    ["--dry-run", "-P", "2", "{tree}"],
+    ["--save-plan", "plan.jsonl", "-P", "2", "{tree}"],
+    ["--apply-plan", "plan.jsonl", "{tree}"],
+    ["--watch", "--save-plan", "plan.jsonl", "{tree}"],
+])
+def test_conflicting_arguments_are_rejected(make_cleaner, tree, argv):
+    source = touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    cleaner = make_cleaner()
+    code, out = run(cleaner, *(arg.format(tree=tree) for arg in argv))
+    assert code == CommandLineRunner.EXIT_USAGE and out == ""
+    assert os.path.exists(source)
+    assert not cleaner.history_db.get_cleaning_sessions()
+
+
+def test_save_plan_with_dry_run(make_cleaner, tree, tmp_path):
+    source = touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    plan_file = str(tmp_path / "plan.jsonl")
+    code, _ = run(make_cleaner(), "--dry-run", "--save-plan", plan_file, tree)
+    assert code == CommandLineRunner.EXIT_OK
+    assert os.path.exists(plan_file) and os.path.exists(source)
@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import sqlite3
+import time
+
+from file_cleaner import CleaningProgress, CommandLineRunner, build_arg_parser
+from tests.conftest import touch
+
+
+def age_directories(tree):
+    """把目录的修改时间改到扫描开始之前，使它们可以被缓存（见 DirectoryStateCache.RACY_WINDOW_NS）"""
+    past = time.time() - 600
+    for directory, _, _ in os.walk(tree):
+        os.utime(directory, (past, past))
+
+
+def scan(cleaner, tree, **kwargs):
+    """生成计划，返回 (实际列出的文件数, 计划中的文件名)"""
+    progress = CleaningProgress()
+    names = [os.path.basename(op.path) for op in cleaner.plan(tree, progress, **kwargs)]
+    return progress.scanned, names
+
+
+def cached_paths(cleaner):
+    with sqlite3.connect(cleaner.history_db.db_file) as conn:
+        return {row[0] for row in conn.execute("SELECT path FROM directory_state")}
+
+
+def make_tree(tree):
+    touch(os.path.join(tree, "a", "ABC.mp4"))
+    touch(os.path.join(tree, "b", "DEF.mp4"))
+    touch(os.path.join(tree, "b", "c", "GHI.srt"))
+    age_directories(tree)
+
+
+def test_unchanged_directories_are_skipped(make_cleaner, tree):
+    make_tree(tree)
+    cleaner = make_cleaner(incremental_scan=True)
+    assert scan(cleaner, tree) == (3, [])
+    assert cached_paths(cleaner) == {tree, os.path.join(tree, "a"), os.path.join(tree, "b"),
+                                     os.path.join(tree, "b", "c")}
+    assert scan(cleaner, tree) == (0, [])
+    # 强制完整扫描时仍然列出所有目录
+    assert scan(cleaner, tree, incremental=False) == (3, [])
+
+
+def test_changed_directory_is_rescanned(make_cleaner, tree):
+    make_tree(tree)
+    cleaner = make_cleaner(incremental_scan=True)
+    scan(cleaner, tree)
+    touch(os.path.join(tree, "b", "c", "javdb.com@JKL.mp4"))
+    assert scan(cleaner, tree) == (2, ["javdb.com@JKL.mp4"])
+    # 有待执行操作的目录不记录，下一次仍然会被扫描
+    assert os.path.join(tree, "b", "c") not in cached_paths(cleaner)
+    assert scan(cleaner, tree) == (2, ["javdb.com@JKL.mp4"])
+
+
+def test_rule_change_invalidates_cache(make_cleaner, tree):
+    make_tree(tree)
+    scan(make_cleaner(incremental_scan=True), tree)
+    cleaner = make_cleaner(incremental_scan=True, remove_patterns=["A"])
+    assert scan(cleaner, tree) == (3, ["ABC.mp4"])
+
+
+def test_removed_directories_are_forgotten(make_cleaner, tree):
+    make_tree(tree)
+    cleaner = make_cleaner(incremental_scan=True)
+    scan(cleaner, tree)
+    # last_seen 以秒为单位，模拟上一次扫描发生在更早的时候
+    with sqlite3.connect(cleaner.history_db.db_file) as conn:
+        conn.execute("UPDATE directory_state SET last_seen = last_seen - 60")
+    os.remove(os.path.join(tree, "b", "c", "GHI.srt"))
+    os.rmdir(os.path.join(tree, "b", "c"))
+    assert scan(cleaner, tree) == (1, [])
+    assert os.path.join(tree, "b", "c") not in cached_paths(cleaner)
+
+
+def test_clear_cache_from_command_line(make_cleaner, tree, tmp_path):
+    make_tree(tree)
+    cleaner = make_cleaner(incremental_scan=True)
+    scan(cleaner, tree)
+
+    def run(*argv):
+        args = build_arg_parser().parse_args(["--config", cleaner.config.config_file,
+                                              "--history-db", cleaner.history_db.db_file, "--json", *argv])
+        out = io.StringIO()
+        assert CommandLineRunner(args, out).run() == CommandLineRunner.EXIT_OK
+        return json.loads(out.getvalue())
+
+    # 可以只清除扫描根目录中的一棵子树
+    assert run("--clear-cache", os.path.join(tree, "b"))["directories"] == 2
+    assert cached_paths(cleaner) == {tree, os.path.join(tree, "a")}
+    assert scan(cleaner, tree) == (2, [])
+    assert run("--clear-cache")["directories"] == 4
+    assert cached_paths(cleaner) == set()
@@ -0,0 +1,161 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from file_cleaner import (HistoryDatabase, REASON_PATTERNS_REMOVED, REASON_SHORTCUT_DELETED,
+                          REASON_SHORTCUT_RECYCLED, REASON_TARGET_EXISTS, STATUS_DONE, STATUS_SKIPPED)
+
+# 第一个版本写入的表结构（没有 user_version，时间戳是本地时间文本）
+BASELINE_SCHEMA = '''
+    CREATE TABLE operations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        operation_type TEXT NOT NULL,
+        original_path TEXT NOT NULL,
+        new_path TEXT,
+        timestamp timestamp NOT NULL,
+        is_reverted INTEGER DEFAULT 0,
+        session_id TEXT,
+        details TEXT
+    );
+    CREATE TABLE cleaning_sessions (
+        session_id TEXT PRIMARY KEY,
+        start_time timestamp NOT NULL,
+        end_time timestamp,
+        target_directory TEXT NOT NULL,
+        files_renamed INTEGER DEFAULT 0,
+        files_deleted INTEGER DEFAULT 0,
+        status TEXT NOT NULL
+    );
+'''
+
+BASELINE_OPERATIONS = [
+    ("rename", "/videos/javdb.com@ABC.mp4", "/videos/ABC.mp4", "从文件名中移除了 'javdb.com@'"),
+    ("delete", "/videos/site.url", None, "删除了快捷方式文件 (已移至回收站)"),
+    ("delete", "/videos/other.url", None, "删除了快捷方式文件 (直接删除，不可撤销)"),
+    ("skip", "/videos/javdb.com@DEF.mp4", None, "跳过重命名：目标文件 'DEF.mp4' 已存在"),
+]
+
+
+def make_baseline_db(path):
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.execute(
+            "INSERT INTO cleaning_sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("20240102_030405", "2024-01-02 03:04:05", "2024-01-02 03:04:09", "/videos", 1, 2, "已完成")
+        )
+        conn.executemany(
+            '''INSERT INTO operations (operation_type, original_path, new_path, timestamp, session_id, details)
+               VALUES (?, ?, ?, '2024-01-02 03:04:06', '20240102_030405', ?)''',
+            BASELINE_OPERATIONS
+        )
+    conn.close()
+
+
+def user_version(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def test_new_database(tmp_path):
+    path = str(tmp_path / "history.db")
+    HistoryDatabase(path)
+    assert user_version(path) == len(HistoryDatabase.MIGRATIONS)
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"operations", "cleaning_sessions", "directory_state", "meta", "patterns", "session_metrics"} <= tables
+    # 再次打开时不重复执行迁移
+    HistoryDatabase(path)
+    assert user_version(path) == len(HistoryDatabase.MIGRATIONS)
+
+
+def test_upgrade_baseline_database(tmp_path):
+    path = str(tmp_path / "history.db")
+    make_baseline_db(path)
+    db = HistoryDatabase(path)
+    assert user_version(path) == len(HistoryDatabase.MIGRATIONS)
+
+    session, = db.get_cleaning_sessions()
+    assert session[0] == "20240102_030405"
+    assert session[1] == int(datetime(2024, 1, 2, 3, 4, 5).timestamp())
+    assert session[2] == int(datetime(2024, 1, 2, 3, 4, 9).timestamp())
+
+    records = db.search_operations(reverted=None)[::-1]
+    assert [r.timestamp for r in records] == [int(datetime(2024, 1, 2, 3, 4, 6).timestamp())] * 4
+    assert [r.reversible for r in records] == [1, 1, 0, 0]
+    assert [r.status_code for r in records] == [STATUS_DONE, STATUS_DONE, STATUS_DONE, STATUS_SKIPPED]
+    # 旧详情文本在维护时转换为编码，显示的内容不变
+    assert [r.describe() for r in records] == [op[3] for op in BASELINE_OPERATIONS]
+    assert db.compact_details() == 4
+    records = db.search_operations(reverted=None)[::-1]
+    assert [r.reason_code for r in records] == [
+        REASON_PATTERNS_REMOVED, REASON_SHORTCUT_RECYCLED, REASON_SHORTCUT_DELETED, REASON_TARGET_EXISTS
+    ]
+    assert records[0].pattern == "javdb.com@" and records[0].detail_args is None
+    assert all(r.details is None for r in records)
+    assert [r.describe() for r in records] == [op[3] for op in BASELINE_OPERATIONS]
+
+    # 迁移前的记录也在路径索引中
+    assert [r.original_path for r in db.search_operations(text="javdb", reverted=None)] == [
+        "/videos/javdb.com@DEF.mp4", "/videos/javdb.com@ABC.mp4"
+    ]
+    assert [r.operation_type for r in db.get_session_operations("20240102_030405")] == ["rename", "delete", "delete"]
+
+
+def test_failed_migration_keeps_version(tmp_path):
+    path = str(tmp_path / "history.db")
+    HistoryDatabase(path)
+
+    class BrokenDatabase(HistoryDatabase):
+        MIGRATIONS = HistoryDatabase.MIGRATIONS + ("_migrate_broken",)
+
+        def _migrate_broken(self, conn):
+            conn.execute("CREATE TABLE half_done (id INTEGER)")
+            raise RuntimeError("迁移失败")
+
+    with pytest.raises(RuntimeError):
+        BrokenDatabase(path)
+    assert user_version(path) == len(HistoryDatabase.MIGRATIONS)
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+
+
+def traced_statements(monkeypatch):
+    statements = []
+    connect = HistoryDatabase.connect
+
+    def traced_connect(self, *args, **kwargs):
+        conn = connect(self, *args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(HistoryDatabase, "connect", traced_connect)
+    return statements
+
+
+def test_upgrade_builds_path_index_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "history.db")
+    make_baseline_db(path)
+    statements = traced_statements(monkeypatch)
+    db = HistoryDatabase(path)
+    assert sum("'rebuild'" in statement for statement in statements) == 1
+    # 新记录由触发器加入索引
+    db.add_operation("rename", "/videos/javdb.com@XYZ.mp4", "/videos/XYZ.mp4", "20240102_030405")
+    assert [r.new_path for r in db.search_operations(text="XYZ", reverted=None)] == ["/videos/XYZ.mp4"]
+
+
+def test_path_index_without_insert_trigger_is_repaired(tmp_path):
+    path = str(tmp_path / "history.db")
+    db = HistoryDatabase(path)
+    # 没有插入触发器的版本 5：这期间插入的记录不在索引中
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TRIGGER operations_fts_insert")
+    db.add_operation("rename", "/videos/javdb.com@XYZ.mp4", "/videos/XYZ.mp4")
+    assert not db.search_operations(text="XYZ", reverted=None)
+    with db.connect() as conn:
+        db._migrate_path_index_trigger(conn)
+    assert len(db.search_operations(text="XYZ", reverted=None)) == 1
+    db.add_operation("rename", "/videos/javdb.com@XYZ2.mp4", "/videos/XYZ2.mp4")
+    assert len(db.search_operations(text="XYZ", reverted=None)) == 2
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import time
+
+from file_cleaner import HistoryDatabase, REASON_PATTERNS_REMOVED
+
+
+def add_session(db, days_ago, finished=True):
+    session_id = db.start_cleaning_session("/videos")
+    writer = db.open_session_writer(session_id)
+    try:
+        writer.add_operation("rename", f"/videos/{session_id}_a.mp4", f"/videos/{session_id}_b.mp4",
+                             REASON_PATTERNS_REMOVED, ["x"])
+    finally:
+        writer.close()
+    if finished:
+        db.end_cleaning_session(session_id, 1, 0)
+    started = int(time.time() - days_ago * 86400)
+    with sqlite3.connect(db.db_file) as conn:
+        conn.execute("UPDATE cleaning_sessions SET start_time = ? WHERE session_id = ?", (started, session_id))
+        conn.execute("UPDATE operations SET timestamp = ? WHERE session_id = ?", (started, session_id))
+    # 会话编号由时间生成，相邻两次创建之间稍作等待
+    time.sleep(0.002)
+    return session_id
+
+
+def session_ids(db):
+    return {row[0] for row in db.get_cleaning_sessions(limit=100)}
+
+
+def test_old_finished_sessions_are_archived(tmp_path):
+    db = HistoryDatabase(str(tmp_path / "history.db"))
+    old = add_session(db, 400)
+    recent = add_session(db, 1)
+    summary = db.apply_retention(max_age_days=365, archive_dir=str(tmp_path / "archive"))
+    assert summary["archived_sessions"] == 1 and summary["archived_operations"] == 1
+    assert session_ids(db) == {recent}
+    assert os.path.exists(tmp_path / "archive" / f"{old}.jsonl.gz")
+
+
+def test_open_sessions_are_never_archived(tmp_path):
+    db = HistoryDatabase(str(tmp_path / "history.db"))
+    watching = add_session(db, 400, finished=False)
+    finished = add_session(db, 400)
+    newest = add_session(db, 0)
+    db.apply_retention(max_age_days=365, max_sessions=1, archive_dir=str(tmp_path / "archive"))
+    assert session_ids(db) == {watching, newest}
+    assert finished not in session_ids(db)
+    # 仍在进行的会话的记录保留，之后可以正常结束和撤销
+    assert len(db.get_session_operations(watching)) == 1
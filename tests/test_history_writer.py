@@ -0,0 +1,58 @@
+import sqlite3
+
+from file_cleaner import (HistoryDatabase, REASON_OPERATION_FAILED, REASON_PATTERNS_REMOVED,
+                          STATUS_DONE, STATUS_FAILED, STATUS_PENDING)
+
+
+def statuses(db_file, session_id, column="status_code"):
+    with sqlite3.connect(db_file) as conn:
+        return [row[0] for row in conn.execute(
+            f"SELECT {column} FROM operations WHERE session_id = ? ORDER BY id", (session_id,))]
+
+
+def test_rows_are_committed_before_their_actions_run(tmp_path):
+    db_file = str(tmp_path / "history.db")
+    db = HistoryDatabase(db_file)
+    session_id = db.start_cleaning_session(str(tmp_path))
+    seen = []
+
+    def action():
+        # 另一个连接在文件操作执行时已经能看到待执行的记录
+        seen.extend(statuses(db_file, session_id))
+
+    writer = db.open_session_writer(session_id, batch_size=10, flush_interval=3600)
+    try:
+        writer.add_operation("rename", "/a/x.mp4", "/a/y.mp4", REASON_PATTERNS_REMOVED, ["x"], action=action, shard="/a")
+    finally:
+        writer.close()
+    assert seen == [STATUS_PENDING]
+    assert statuses(db_file, session_id) == [STATUS_DONE]
+
+
+def test_failing_action_is_recorded_as_failed(tmp_path):
+    db = HistoryDatabase(str(tmp_path / "history.db"))
+    session_id = db.start_cleaning_session(str(tmp_path))
+
+    def action():
+        raise OSError("boom")
+
+    writer = db.open_session_writer(session_id)
+    try:
+        writer.add_operation("rename", "/a/x.mp4", "/a/y.mp4", REASON_PATTERNS_REMOVED, ["x"], action=action, shard="/a")
+    finally:
+        writer.close()
+    assert statuses(db.db_file, session_id) == [STATUS_FAILED]
+    assert statuses(db.db_file, session_id, "reason_code") == [REASON_OPERATION_FAILED]
+    # 失败的操作没有修改磁盘，撤销时不需要处理
+    assert db.get_session_operations(session_id) == []
+
+
+def test_session_writer_uses_full_sync(tmp_path):
+    db = HistoryDatabase(str(tmp_path / "history.db"))
+    writer = db.open_session_writer(db.start_cleaning_session(str(tmp_path)))
+    try:
+        # 2 = FULL：断电后也不会丢失撤销依赖的待执行记录
+        assert writer.conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+        assert writer.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        writer.close()
@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+
+from file_cleaner import (LEGACY_PLAN_FORMATS, PLAN_FORMAT, PlannedOperation, REASON_PATTERNS_REMOVED,
+                          REASON_SHORTCUT_RECYCLED, REASON_TARGET_EXISTS)
+from tests.conftest import touch
+
+
+def snapshot(plan):
+    return sorted((op.to_dict() for op in plan), key=lambda op: op["path"])
+
+
+def test_plan_round_trip(make_cleaner, tree, tmp_path):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    touch(os.path.join(tree, "sub", "javdb.com@DEF.srt"))
+    touch(os.path.join(tree, "sub", "DEF.srt"))
+    touch(os.path.join(tree, "site.url"))
+    cleaner = make_cleaner()
+    plan = list(cleaner.plan(tree))
+    plan_file = str(tmp_path / "plan.jsonl")
+    assert cleaner.save_plan(plan, plan_file, tree) == len(plan) == 3
+    with open(plan_file, encoding="utf-8") as f:
+        assert json.loads(f.readline()) == {"format": PLAN_FORMAT, "directory": tree}
+
+    directory, loaded = cleaner.load_plan(plan_file)
+    loaded = list(loaded)
+    assert directory == tree
+    assert snapshot(loaded) == snapshot(plan)
+    by_name = {os.path.basename(op.path): op for op in loaded}
+    assert by_name["javdb.com@ABC.mp4"].reason_code == REASON_PATTERNS_REMOVED
+    assert by_name["javdb.com@DEF.srt"].kind == "skip"
+    assert by_name["javdb.com@DEF.srt"].reason_code == REASON_TARGET_EXISTS
+
+    results = cleaner.apply(loaded, directory, verify=True)
+    assert list(results["renamed"]) == [("javdb.com@ABC.mp4", "ABC.mp4")]
+    assert list(results["deleted"]) == ["site.url"]
+    assert os.path.exists(os.path.join(tree, "ABC.mp4"))
+
+
+def test_apply_saved_plan_rechecks_disk(make_cleaner, tree, tmp_path):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    touch(os.path.join(tree, "javdb.com@GHI.mp4"))
+    cleaner = make_cleaner()
+    plan_file = str(tmp_path / "plan.jsonl")
+    cleaner.save_plan(cleaner.plan(tree), plan_file, tree)
+    # 保存计划之后磁盘发生了变化
+    touch(os.path.join(tree, "ABC.mp4"))
+    os.remove(os.path.join(tree, "javdb.com@GHI.mp4"))
+
+    results = cleaner.apply(cleaner.load_plan(plan_file)[1], tree, verify=True)
+    assert not list(results["renamed"])
+    assert sorted(item[0] for item in results["skipped"]) == ["javdb.com@ABC.mp4", "javdb.com@GHI.mp4"]
+    assert os.path.exists(os.path.join(tree, "javdb.com@ABC.mp4"))
+
+
+def test_load_legacy_plan(make_cleaner, tree, tmp_path):
+    source = touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    touch(os.path.join(tree, "javdb.com@DEF.mp4"))
+    touch(os.path.join(tree, "DEF.mp4"))
+    link = touch(os.path.join(tree, "site.url"))
+    # filecleaner-plan/1 保存的是简短原因和详情文本
+    lines = [
+        {"format": LEGACY_PLAN_FORMATS[0], "directory": tree},
+        {"kind": "rename", "path": source, "new_path": os.path.join(tree, "ABC.mp4"),
+         "details": "从文件名中移除了 'javdb.com@'"},
+        {"kind": "skip", "path": os.path.join(tree, "javdb.com@DEF.mp4"), "new_path": os.path.join(tree, "DEF.mp4"),
+         "reason": "目标文件已存在", "details": "跳过重命名：目标文件 'DEF.mp4' 已存在"},
+        {"kind": "delete", "path": link, "details": "删除了快捷方式文件 (已移至回收站)"},
+    ]
+    plan_file = tmp_path / "plan.jsonl"
+    plan_file.write_text("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines), encoding="utf-8")
+
+    cleaner = make_cleaner()
+    directory, loaded = cleaner.load_plan(str(plan_file))
+    loaded = list(loaded)
+    assert directory == tree
+    assert [(op.kind, op.reason_code, op.detail_args) for op in loaded] == [
+        ("rename", REASON_PATTERNS_REMOVED, ["javdb.com@"]),
+        ("skip", REASON_TARGET_EXISTS, ["DEF.mp4"]),
+        ("delete", REASON_SHORTCUT_RECYCLED, None),
+    ]
+    assert loaded[1].reason == "目标文件已存在"
+
+    results = cleaner.apply(loaded, directory, verify=True)
+    assert list(results["renamed"]) == [("javdb.com@ABC.mp4", "ABC.mp4")]
+    assert list(results["deleted"]) == ["site.url"]
+    records = cleaner.history_db.search_operations(reverted=None)[::-1]
+    assert [r.describe() for r in records] == [line["details"] for line in lines[1:]]
+
+
+def test_legacy_details_that_cannot_be_parsed(tmp_path):
+    op = PlannedOperation.from_dict({"kind": "skip", "path": "/videos/a.mp4", "reason": "未知", "details": "其他"})
+    assert op.kind == "skip" and op.reason_code is None and op.detail_args is None
+
+
+@pytest.mark.parametrize("header", ["", "not json\n", '{"format": "filecleaner-plan/99", "directory": "/"}\n'])
+def test_load_rejects_other_files(make_cleaner, tmp_path, header):
+    plan_file = tmp_path / "plan.jsonl"
+    plan_file.write_text(header, encoding="utf-8")
+    with pytest.raises(ValueError):
+        make_cleaner().load_plan(str(plan_file))
+
+
+def test_failed_apply_closes_session(make_cleaner, tree):
+    source = touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    cleaner = make_cleaner()
+
+    def broken_plan():
+        yield from cleaner.plan(tree)
+        raise OSError("读取计划失败")
+
+    with pytest.raises(OSError):
+        cleaner.apply(broken_plan(), tree)
+    session = cleaner.history_db.get_cleaning_sessions(limit=1)[0]
+    # 已登记的重命名仍然执行并计入会话，会话以"出错"状态结束
+    assert session[6] == "出错" and session[2] is not None and session[4] == 1
+    assert not os.path.exists(source)
+    error, = cleaner.history_db.search_operations(operation_type="error", reverted=None)
+    assert error.describe() == "清理过程中发生错误: 读取计划失败"
@@ -0,0 +1,99 @@
+import os
+
+from file_cleaner import CompiledRuleSet, FileRenamer, PatternMatcher, RenameRule
+from tests.conftest import touch
+
+
+def compile_rules(*items, patterns=()):
+    return CompiledRuleSet.from_config({
+        "target_extensions": [".mp4"],
+        "cleanup_extensions": [".url"],
+        "remove_patterns": list(patterns),
+        "collision_strategy": "skip",
+        "scan_subdirectories": True,
+        "incremental_scan": False,
+        "rename_rules": list(items),
+    })
+
+
+def rename(name, *items, patterns=(), directory="/videos"):
+    match = compile_rules(*items, patterns=patterns).renamer(directory).apply(name)
+    return match[0] if match else None
+
+
+def test_each_rule_sees_the_previous_result():
+    rules = ({"type": "regex", "pattern": r"\[[^\]]*\]"}, {"type": "regex", "pattern": r"^\s+"})
+    assert rename("[site] ABC.mp4", *rules) == "ABC.mp4"
+
+
+def test_rules_run_in_config_order():
+    # 同时作为一个组合正则扫描时 "ab" 会在更靠左的位置命中；依次应用时 "bc" 先被移除
+    assert rename("abcd.mp4", "bc", "ab") == "ad.mp4"
+    assert rename("abcd.mp4", "ab", "bc") == "cd.mp4"
+
+
+def test_rules_run_after_remove_patterns():
+    assert rename("javdb.com@[x]ABC.mp4", {"type": "regex", "pattern": r"^\[x\]"},
+                  patterns=["javdb.com@"]) == "ABC.mp4"
+
+
+def test_readme_example():
+    rules = (
+        {"type": "regex", "pattern": r"\[[^\]]*\]", "name": "站点标签"},
+        {"type": "regex", "pattern": r"^\s+", "name": "开头的空格"},
+        {"type": "regex", "pattern": r" ?\[?\b(?:720|1080|2160)[pP]\b\]?", "name": "分辨率"},
+        {"type": "regex", "pattern": r"-C(?=\.[^.]+$)", "ignore_case": True},
+    )
+    match = compile_rules(*rules).renamer("/videos").apply("[site] ABC 1080p-c.mp4")
+    assert match == ("ABC.mp4", ["站点标签", "开头的空格", "分辨率", r"-C(?=\.[^.]+$)"])
+
+
+def test_replacement_groups_and_backreferences():
+    assert rename("XYZ_001.mp4", {"type": "regex", "pattern": r"^(\w+?)_(\d+)", "replace": r"\1-\2"}) == "XYZ-001.mp4"
+    # 引用自身分组的规则不能放进组合正则，仍然要正确应用
+    assert rename("aab.mp4", "b", {"type": "regex", "pattern": r"(a)\1", "replace": "A"}) == "A.mp4"
+
+
+def test_literal_rules_do_not_expand_templates():
+    assert rename("a-b.mp4", {"pattern": "-", "replace": r"\1"}) == r"a\1b.mp4"
+    assert rename("ABC-x.mp4", {"pattern": "abc", "replace": "z", "ignore_case": True}) == "z-x.mp4"
+
+
+def test_paths_limit_rules_to_matching_directories():
+    rule = {"type": "regex", "pattern": "_", "replace": "-", "paths": ["*/字幕"]}
+    assert rename("a_b.mp4", rule, directory="/videos/字幕") == "a-b.mp4"
+    assert rename("a_b.mp4", rule, directory="/videos/字幕/sub") == "a-b.mp4"
+    assert rename("a_b.mp4", rule, directory="/videos/other") is None
+
+
+def test_invalid_rules_are_skipped(capsys):
+    rules = compile_rules({"type": "regex", "pattern": "(["}, {"type": "glob", "pattern": "x"}, "x")
+    assert [rule.pattern for rule in rules.rename_rules] == ["x"]
+    assert "忽略无效的重命名规则" in capsys.readouterr().out
+
+
+def test_rejects_names_without_a_stem():
+    assert rename("[only].mp4", {"type": "regex", "pattern": r"\[[^\]]*\]"}) is None
+    assert rename("a.mp4", {"type": "regex", "pattern": r"^.*$"}) is None
+
+
+def test_rules_are_part_of_the_fingerprint():
+    assert compile_rules("x").fingerprint != compile_rules("y").fingerprint
+
+
+def test_filter_does_not_change_results():
+    # 组合正则只用来排除不匹配任何规则的文件名；"^x" 在第一条规则修改文件名之前就能匹配
+    rules = [RenameRule.from_config(item) for item in ("b", {"type": "regex", "pattern": "^x"})]
+    renamer = FileRenamer(PatternMatcher(()), rules)
+    assert renamer.apply("xab.mp4") == ("a.mp4", ["b", "^x"])
+    assert renamer.apply("cab.mp4") == ("ca.mp4", ["b"])
+    assert renamer.apply("zzz.mp4") is None
+
+
+def test_dry_run_uses_rename_rules(make_cleaner, tree):
+    touch(os.path.join(tree, "[site] ABC.mp4"))
+    touch(os.path.join(tree, "DEF.mp4"))
+    cleaner = make_cleaner(rename_rules=[{"type": "regex", "pattern": r"\[[^\]]*\]"},
+                                         {"type": "regex", "pattern": r"^\s+"}])
+    results = cleaner.dry_run(tree)
+    assert list(results["renamed"]) == [("[site] ABC.mp4", "ABC.mp4")]
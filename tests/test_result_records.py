@@ -0,0 +1,96 @@
+import gc
+import os
+import pickle
+import threading
+
+import pytest
+
+from file_cleaner import ResultRecords
+from tests.conftest import touch
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(ResultRecords, "SPILL_CHUNK", 2)
+
+
+def test_records_stay_in_memory_below_limit():
+    records = ResultRecords(memory_limit=5)
+    assert not records
+    records.extend(("a.mp4", "b.mp4"))
+    assert len(records) == 2 and records
+    assert list(records) == ["a.mp4", "b.mp4"]
+    assert records._spill_path is None
+
+
+def test_records_spill_to_file(small_chunks):
+    records = ResultRecords(memory_limit=3)
+    items = [(f"{i}.mp4", f"new {i}.mp4") for i in range(10)]
+    records.extend(items)
+    assert len(records) == 10
+    assert len(records._items) == 3
+    assert os.path.exists(records._spill_path)
+    # 元组读回来仍然是元组，可以多次遍历
+    assert list(records) == items
+    assert list(records) == items
+    records.append(("10.mp4", "new 10.mp4"))
+    assert list(records)[-1] == ("10.mp4", "new 10.mp4")
+
+    spill_path = records._spill_path
+    del records
+    gc.collect()
+    assert not os.path.exists(spill_path)
+
+
+def test_pickled_records_own_a_copy(small_chunks):
+    records = ResultRecords(memory_limit=1)
+    records.extend(["a", "b", "c"])
+    restored = pickle.loads(pickle.dumps(records))
+    # 两个对象各自拥有一份临时文件，删除其中一个不影响另一个
+    assert restored._spill_path != records._spill_path
+    spill_path, restored_path = records._spill_path, restored._spill_path
+    del records
+    gc.collect()
+    assert not os.path.exists(spill_path)
+    assert list(restored) == ["a", "b", "c"]
+    restored.append("d")
+    assert list(restored) == ["a", "b", "c", "d"]
+    del restored
+    gc.collect()
+    assert not os.path.exists(restored_path)
+
+
+def test_iteration_ignores_concurrent_appends(small_chunks):
+    records = ResultRecords(memory_limit=1)
+    records.extend(range(5))
+    it = iter(records)
+    assert next(it) == 0
+    # 遍历开始后追加的记录（包括写入临时文件的）不包括在这次遍历中
+    records.extend(range(5, 20))
+    assert list(it) == [1, 2, 3, 4]
+    assert list(records) == list(range(20))
+
+
+def test_concurrent_appends(small_chunks):
+    records = ResultRecords(memory_limit=10)
+
+    def worker(n):
+        for i in range(200):
+            records.append((n, i))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(records) == 800
+    assert sorted(records) == [(n, i) for n in range(4) for i in range(200)]
+
+
+def test_cleaning_results_spill(make_cleaner, tree, small_chunks):
+    for i in range(25):
+        touch(os.path.join(tree, f"javdb.com@{i:03d}.mp4"))
+    cleaner = make_cleaner(results_memory_limit=10)
+    results = cleaner.clean_directory(tree)
+    assert len(results["renamed"]._items) == 10 and results["renamed"]._spill_path is not None
+    assert sorted(results["renamed"]) == [(f"javdb.com@{i:03d}.mp4", f"{i:03d}.mp4") for i in range(25)]
@@ -0,0 +1,97 @@
+import os
+import threading
+
+from tests.conftest import touch
+
+
+def clean(cleaner, tree):
+    results = cleaner.clean_directory(tree)
+    session = cleaner.history_db.get_cleaning_sessions(limit=1)[0]
+    return session[0], results
+
+
+def session_status(cleaner, session_id):
+    return {row[0]: row[6] for row in cleaner.history_db.get_cleaning_sessions()}[session_id]
+
+
+def test_revert_session(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"abc")
+    touch(os.path.join(tree, "sub", "javdb.com@DEF.srt"), b"def")
+    touch(os.path.join(tree, "sub", "site.url"), b"url")
+    before = sorted(os.path.relpath(os.path.join(d, f), tree) for d, _, files in os.walk(tree) for f in files)
+    cleaner = make_cleaner()
+    session_id, results = clean(cleaner, tree)
+    assert len(results["renamed"]) == 2 and len(results["deleted"]) == 1
+
+    reverted = cleaner.revert_session(session_id)
+    assert sorted(reverted["renamed"]) == [("ABC.mp4", "javdb.com@ABC.mp4"), ("DEF.srt", "javdb.com@DEF.srt")]
+    assert list(reverted["restored"]) == ["site.url"]
+    assert not list(reverted["skipped"]) and not list(reverted["errors"])
+    after = sorted(os.path.relpath(os.path.join(d, f), tree) for d, _, files in os.walk(tree) for f in files)
+    assert after == before
+    assert session_status(cleaner, session_id) == "已撤销"
+    assert cleaner.history_db.get_session_operations(session_id) == []
+    # 已撤销的操作不会再次执行
+    again = cleaner.revert_session(session_id)
+    assert not list(again["renamed"]) and not list(again["restored"])
+
+
+def test_revert_skips_occupied_names_and_can_be_retried(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    touch(os.path.join(tree, "javdb.com@DEF.mp4"))
+    cleaner = make_cleaner()
+    session_id, _ = clean(cleaner, tree)
+    occupied = touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"new")
+    os.remove(os.path.join(tree, "DEF.mp4"))
+
+    reverted = cleaner.revert_session(session_id)
+    assert not list(reverted["renamed"])
+    assert sorted(reverted["skipped"]) == [("ABC.mp4", "原文件名已被占用"), ("DEF.mp4", "文件已不存在")]
+    assert os.path.exists(os.path.join(tree, "ABC.mp4"))
+    assert len(cleaner.history_db.get_session_operations(session_id)) == 2
+
+    os.remove(occupied)
+    reverted = cleaner.revert_session(session_id)
+    assert list(reverted["renamed"]) == [("ABC.mp4", "javdb.com@ABC.mp4")]
+    assert session_status(cleaner, session_id) == "部分撤销"
+    assert [op.new_path for op in cleaner.history_db.get_session_operations(session_id)] == [
+        os.path.join(tree, "DEF.mp4")
+    ]
+
+
+def test_cancelled_revert(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    cleaner = make_cleaner()
+    session_id, _ = clean(cleaner, tree)
+    cancel = threading.Event()
+    cancel.set()
+    reverted = cleaner.revert_session(session_id, cancel_event=cancel)
+    assert reverted["cancelled"] and not list(reverted["renamed"])
+    assert os.path.exists(os.path.join(tree, "ABC.mp4"))
+    assert session_status(cleaner, session_id) == "已完成"
+
+
+def test_revert_single_operation(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"))
+    cleaner = make_cleaner()
+    session_id, _ = clean(cleaner, tree)
+    op, = cleaner.history_db.get_session_operations(session_id)
+    assert cleaner.revert_operation(op)
+    assert os.path.exists(os.path.join(tree, "javdb.com@ABC.mp4"))
+    assert not cleaner.revert_operation(cleaner.history_db.search_operations(reverted=True)[0])
+
+
+def test_revert_single_operation_keeps_reoccupied_name(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"cleaned")
+    cleaner = make_cleaner()
+    session_id, _ = clean(cleaner, tree)
+    op, = cleaner.history_db.get_session_operations(session_id)
+    occupied = touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"new")
+    assert not cleaner.revert_operation(op)
+    with open(occupied, "rb") as f:
+        assert f.read() == b"new"
+    assert os.path.exists(os.path.join(tree, "ABC.mp4"))
+    # 没有撤销的操作仍然可以在原文件名空出后再次撤销
+    assert cleaner.history_db.get_session_operations(session_id) == [op]
+    os.remove(occupied)
+    assert cleaner.revert_operation(op)
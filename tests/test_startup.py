@@ -0,0 +1,13 @@
+import subprocess
+import sys
+
+from benchmarks.startup_benchmark import DEFERRED_MODULES, GUI_MODULES, REPO_ROOT
+
+
+def test_import_does_not_load_deferred_modules():
+    code = ("import sys, file_cleaner; "
+            "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT,
+                          capture_output=True, text=True, check=True)
+    loaded = set(proc.stdout.split())
+    assert not loaded & set(DEFERRED_MODULES + GUI_MODULES)
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from file_cleaner import (FreedesktopTrash, REASON_SHORTCUT_DELETED, TrashIndex,
+                          UnsupportedTrash, WinshellTrash, default_trash_backend)
+from tests.conftest import touch
+
+
+@pytest.mark.parametrize("platform, backend", [
+    ("linux", FreedesktopTrash),
+    ("freebsd13", FreedesktopTrash),
+    ("win32", WinshellTrash),
+    ("darwin", UnsupportedTrash),
+])
+def test_backend_selection(monkeypatch, platform, backend):
+    monkeypatch.setattr("sys.platform", platform)
+    assert type(default_trash_backend()) is backend
+
+
+def test_freedesktop_trash_round_trip(tmp_path):
+    trash = FreedesktopTrash(str(tmp_path / "Trash"))
+    first = touch(str(tmp_path / "a" / "link.url"), b"1")
+    second = touch(str(tmp_path / "b" / "link.url"), b"2")
+    assert trash.recycle_many([first, second]) == [None, None]
+    assert not os.path.exists(first) and not os.path.exists(second)
+    assert len(os.listdir(tmp_path / "Trash" / "info")) == 2
+
+    # 同名文件在回收站中使用不同的名称，按原路径分别恢复
+    index = TrashIndex(trash)
+    handle = index.take(second)
+    trash.restore(handle, second)
+    with open(second, "rb") as f:
+        assert f.read() == b"2"
+    assert not os.path.exists(first)
+
+
+def test_revert_restores_deleted_shortcuts(make_cleaner, tree):
+    link = touch(os.path.join(tree, "sub", "site.url"), b"[InternetShortcut]")
+    cleaner = make_cleaner()
+    results = cleaner.clean_directory(tree)
+    assert list(results["deleted"]) == ["site.url"] and not os.path.exists(link)
+    session_id = cleaner.history_db.get_cleaning_sessions(limit=1)[0][0]
+    reverted = cleaner.revert_session(session_id)
+    assert list(reverted["restored"]) == ["site.url"]
+    assert os.path.exists(link)
+
+
+def test_unsupported_trash_deletes_shortcuts_irreversibly(make_cleaner, tree):
+    link = touch(os.path.join(tree, "site.url"))
+    cleaner = make_cleaner(trash=UnsupportedTrash("不支持"))
+    results = cleaner.clean_directory(tree)
+    assert list(results["deleted"]) == ["site.url"] and not os.path.exists(link)
+    session_id = cleaner.history_db.get_cleaning_sessions(limit=1)[0][0]
+    record, = cleaner.history_db.search_operations(operation_type="delete", reverted=None)
+    assert record.reason_code == REASON_SHORTCUT_DELETED and not record.reversible
+    assert not cleaner.revert_session(session_id)["restored"]
+
+
+def test_unsupported_trash_keeps_replaced_files(make_cleaner, tree):
+    touch(os.path.join(tree, "javdb.com@ABC.mp4"), b"incoming", mtime=2000)
+    touch(os.path.join(tree, "ABC.mp4"), b"existing", mtime=1000)
+    cleaner = make_cleaner(trash=UnsupportedTrash("不支持"), collision_strategy="keep_newer")
+    results = cleaner.clean_directory(tree)
+    # 被替换的文件只能移至回收站，不能移走时两个文件都保留
+    assert sorted(os.listdir(tree)) == ["ABC.mp4", "javdb.com@ABC.mp4"]
+    assert results["errors"]